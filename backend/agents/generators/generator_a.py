@@ -11,12 +11,57 @@ import json
 import datetime
 from dotenv import load_dotenv
 from backend.core.llm_client import get_llm
+from backend.core.token_budget import PromptSegment, fit_prompt, render_prompt
+from backend.core.hedging import HedgedLLM, hedging_enabled
 from backend.core.trulens_client import register_eval
 from backend.core.langfuse_client import langfuse
 from backend.agents.generators.output_parser import OutputParser
+from backend.agents.schemas.json_schemas import BinderSchemas
+from backend.core.metrics import GENERATOR_A_OUTPUTS
 
 load_dotenv()
 
+# --- Config (tuneable vía .env) ---
+# structured → salida estructurada nativa del proveedor (JSON schema de la sección), con
+# el camino de texto + OutputParser como respaldo; text → solo el camino de texto
+GENERATOR_A_OUTPUT_MODE = os.getenv("GENERATOR_A_OUTPUT_MODE", "structured").lower()
+
+INSTRUCCIONES_CRITICAS_JSON_A = """[INSTRUCCIONES CRÍTICAS]
+- Devuelve SOLO un objeto JSON válido UTF-8.
+- NO incluyas ningún texto adicional, explicaciones, markdown o formato que no sea el JSON puro.
+- SIEMPRE incluye TODOS los campos obligatorios del esquema, incluso si están vacíos.
+- Para la sección JN.1, el JSON DEBE contener el objeto 'secciones_JN' con los campos:
+  * "objeto": descripción del objeto del contrato
+  * "alcance": descripción del alcance
+  * "ambito": ámbito de aplicación
+- Si falta información para un campo, usa un string vacío "" o el valor "Por determinar", NUNCA omitas el campo.
+- NO uses la palabra "faltantes" como valor, usa cadenas vacías o valores descriptivos.
+- Estructura EXACTA esperada para JN.1:
+  {
+    "secciones_JN": {
+      "objeto": "descripción o cadena vacía",
+      "alcance": "descripción o cadena vacía",
+      "ambito": "descripción o cadena vacía"
+    }
+  }"""
+
+
+def section_json_complete(content: str, seccion: str) -> bool:
+    """
+    True si `content` parsea como JSON y trae los campos obligatorios de la sección
+    (los mismos que exige ValidatorAgent). Solo esas respuestas entran en la caché LLM.
+    """
+    parsed, parse_error = OutputParser.parse_json(content, strict=False)
+    if parse_error or not isinstance(parsed, dict):
+        return False
+    for field in BinderSchemas.get_section_required_fields(seccion):
+        current = parsed
+        for part in field.split("."):
+            if not isinstance(current, dict) or part not in current:
+                return False
+            current = current[part]
+    return True
+
 
 class GeneratorA:
     """
@@ -28,6 +73,15 @@ class GeneratorA:
     def __init__(self):
         # El modelo se carga desde llm_client con configuración global
         self.llm = get_llm(task_type="json_a", temperature=0.2)
+        # Hedging opcional contra el proveedor alternativo: gana la primera respuesta que parsee como JSON
+        self.hedged_llm = HedgedLLM(
+            self.llm, task_type="json_a", temperature=0.2,
+            accept=lambda content: OutputParser.parse_json(content, strict=False)[1] is None,
+        )
+
+    def _structured_enabled(self, state: dict) -> bool:
+        mode = (state.get("output_mode") or GENERATOR_A_OUTPUT_MODE).lower()
+        return mode == "structured"
 
     async def ainvoke(self, state: dict):
         """
@@ -40,7 +94,9 @@ class GeneratorA:
           "expediente_id": "EXP-001",
           "context": "...",              # opcional
           "citas_golden": [...],         # opcional
-          "dependencias_previas": [...]  # opcional
+          "dependencias_previas": [...], # opcional
+          "hedge_llm": True,             # opcional (default LLM_HEDGING_ENABLED)
+          "output_mode": "structured"    # opcional (default GENERATOR_A_OUTPUT_MODE)
         }
         """
 
@@ -55,51 +111,75 @@ class GeneratorA:
             seccion = state.get("seccion", "JN.x")
             json_schema = state.get("json_schema", "")
             
+            # === Presupuesto de tokens por segmento ===
+            # Se recorta primero lo menos prioritario (dependencias → golden → contexto normativo);
+            # el prompt base (instrucción + esquema) y las instrucciones críticas nunca se recortan.
+            fitted, token_budget = fit_prompt("json_a", [
+                PromptSegment("prompt_a", render_prompt(prompt_a), priority=100, trimmable=False),
+                PromptSegment("instrucciones", INSTRUCCIONES_CRITICAS_JSON_A, priority=100, trimmable=False),
+                PromptSegment("user_text", user_text, priority=90),
+                PromptSegment("contexto_normativo", context or "Sin contexto disponible.", priority=50),
+                PromptSegment("golden", json.dumps(golden, ensure_ascii=False, indent=2), priority=30),
+                PromptSegment("dependencias", json.dumps(dependencias, ensure_ascii=False, indent=2), priority=10),
+            ], model=self.llm.model_name)
+
             # === Construcción del prompt mejorado ===
-            # Nota: El truncamiento se aplica solo si es necesario para evitar límites del modelo
             full_prompt = f"""
-{prompt_a}
+{fitted["prompt_a"]}
 
 [DATOS DEL USUARIO]
-{user_text}
+{fitted["user_text"]}
 
 [CONTEXTO NORMATIVO]
-{context or "Sin contexto disponible."}
+{fitted["contexto_normativo"]}
 
 [REFERENCIAS GOLDEN]
-{json.dumps(golden, ensure_ascii=False, indent=2)}
+{fitted["golden"]}
 
 [DEPENDENCIAS PREVIAS]
-{json.dumps(dependencias, ensure_ascii=False, indent=2)}
+{fitted["dependencias"]}
 
-[INSTRUCCIONES CRÍTICAS]
-- Devuelve SOLO un objeto JSON válido UTF-8.
-- NO incluyas ningún texto adicional, explicaciones, markdown o formato que no sea el JSON puro.
-- SIEMPRE incluye TODOS los campos obligatorios del esquema, incluso si están vacíos.
-- Para la sección JN.1, el JSON DEBE contener el objeto 'secciones_JN' con los campos:
-  * "objeto": descripción del objeto del contrato
-  * "alcance": descripción del alcance
-  * "ambito": ámbito de aplicación
-- Si falta información para un campo, usa un string vacío "" o el valor "Por determinar", NUNCA omitas el campo.
-- NO uses la palabra "faltantes" como valor, usa cadenas vacías o valores descriptivos.
-- Estructura EXACTA esperada para JN.1:
-  {{
-    "secciones_JN": {{
-      "objeto": "descripción o cadena vacía",
-      "alcance": "descripción o cadena vacía",
-      "ambito": "descripción o cadena vacía"
-    }}
-  }}
+{fitted["instrucciones"]}
 """
 
             print("Full Prompt para Generator A:\n", full_prompt)
+            # Una respuesta que ValidatorA rechazaría no se cachea (el reintento la volvería a recibir)
+            cache_accept = lambda content: section_json_complete(content, seccion)
             try:
                 # === Invocación al modelo ===
-                response = await self.llm.ainvoke(full_prompt)
-                raw_output = response.content
-
-                # === Usar OutputParser para limpieza y parsing ===
-                parsed_json, parse_error = OutputParser.parse_json(raw_output, strict=False)
+                hedge_info = None
+                use_hedging = hedging_enabled(state.get("hedge_llm"))
+                parsed_json, parse_error, output_mode = None, None, "text"
+
+                # === Salida estructurada nativa (sin limpieza ni regex) ===
+                section_schema = BinderSchemas.get_structured_output_schema(seccion)
+                if self._structured_enabled(state) and section_schema and not use_hedging:
+                    try:
+                        parsed_json = await self.llm.ainvoke_structured(
+                            full_prompt, section_schema, max_tokens=token_budget["max_tokens"],
+                            cache_accept=cache_accept,
+                        )
+                        raw_output = json.dumps(parsed_json, ensure_ascii=False)
+                        output_mode = "structured"
+                    except Exception as e:
+                        print(f"⚠️ Salida estructurada no disponible ({type(e).__name__}: {e}); se usa el camino de texto")
+                        output_mode = "text_fallback"
+
+                # === Camino de texto (respaldo) ===
+                if parsed_json is None:
+                    if use_hedging:
+                        response, hedge_info = await self.hedged_llm.ainvoke(
+                            full_prompt, max_tokens=token_budget["max_tokens"], cache_accept=cache_accept
+                        )
+                    else:
+                        response = await self.llm.ainvoke(
+                            full_prompt, max_tokens=token_budget["max_tokens"], cache_accept=cache_accept
+                        )
+                    raw_output = response.content
+                    # === Usar OutputParser para limpieza y parsing ===
+                    parsed_json, parse_error = OutputParser.parse_json(raw_output, strict=False)
+                GENERATOR_A_OUTPUTS.inc(mode=output_mode)
+                model_name = hedge_info["model"] if hedge_info else self.llm.model_name
                 
                 if parse_error:
                     print(f"⚠️ Advertencia de parsing: {parse_error}")
@@ -119,9 +199,12 @@ class GeneratorA:
                     "hash": f"hash_A_{seccion}_{expediente_id}",
                     # Metadatos adicionales (no del binder, pero útiles)
                     "metadata": {
-                        "model": self.llm.model_name,
+                        "model": model_name,
                         "status": "success" if not parse_error else "warning",
                         "schema_version": "1.0.0",
+                        "token_budget": token_budget,
+                        "hedge": hedge_info,
+                        "output_mode": output_mode,
                     },
                     "parse_error": parse_error,
                     "dependencias": dependencias,
@@ -135,7 +218,7 @@ class GeneratorA:
                         "documento": documento,
                         "seccion": seccion,
                         "modo": "json_a",
-                        "model": self.llm.model_name,
+                        "model": model_name,
                     },
                     metrics=None,
                     app_version="json_a",
@@ -11,6 +11,7 @@ import json
 import datetime
 from dotenv import load_dotenv
 from backend.core.llm_client import get_llm
+from backend.core.token_budget import PromptSegment, fit_prompt, render_prompt
 from backend.core.trulens_client import register_eval
 from backend.core.trulens_metrics import compute_basic_metrics
 from backend.core.langfuse_client import langfuse
@@ -30,7 +31,25 @@ class GeneratorB:
         # Configuramos el modelo para tareas narrativas (mayor longitud)
         self.llm = get_llm(task_type="json_b", temperature=0.3)
 
-    async def ainvoke(self, state: dict):
+    async def _generate_text(self, full_prompt: str, on_token=None, max_tokens: int = None) -> str:
+        """
+        Invoca el modelo. Si se proporciona `on_token`, usa la API de streaming
+        asíncrono del LLM y notifica cada fragmento de texto según llega.
+        """
+        kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+        if on_token is None:
+            response = await self.llm.ainvoke(full_prompt, **kwargs)
+            return response.content
+
+        parts = []
+        async for chunk in self.llm.astream(full_prompt, **kwargs):
+            delta = chunk.content or ""
+            if delta:
+                parts.append(delta)
+                on_token(delta)
+        return "".join(parts)
+
+    async def ainvoke(self, state: dict, on_token=None):
         """
         Espera:
         {
@@ -41,6 +60,7 @@ class GeneratorB:
           "documento": "JN",
           "seccion": "JN.1"
         }
+        on_token: callback opcional (str -> None) para emitir la narrativa token a token.
         """
 
         with langfuse.start_as_current_span(name="generator_b"):
@@ -58,9 +78,15 @@ class GeneratorB:
             if len(structured_data_str) > 3000:
                 print(f"⚠️ Advertencia: JSON_A tiene {len(structured_data_str)} caracteres (puede afectar calidad)")
 
+            # === Presupuesto de tokens (JSON_A e instrucciones no se recortan: solo se contabilizan) ===
+            fitted, token_budget = fit_prompt("json_b", [
+                PromptSegment("prompt_b", render_prompt(prompt_b), priority=100, trimmable=False),
+                PromptSegment("datos_estructurados", structured_data_str, priority=100, trimmable=False),
+            ], model=self.llm.model_name)
+
             # === Construcción del prompt narrativo ===
             full_prompt = f"""
-{prompt_b}
+{fitted["prompt_b"]}
 
 [DATOS ESTRUCTURADOS VALIDADOS]
 {structured_data_str}
@@ -74,9 +100,9 @@ Redacta una narrativa formal, coherente y completa basada en los datos estructur
 """
 
             try:
-                # === Invocar al modelo ===
-                response = await self.llm.ainvoke(full_prompt)
-                raw_output = response.content
+                # === Invocar al modelo (streaming si hay callback) ===
+                raw_output = await self._generate_text(full_prompt, on_token=on_token,
+                                                       max_tokens=token_budget["max_tokens"])
 
                 # === Extraer narrativa usando OutputParser ===
                 # El modelo puede devolver JSON o texto plano
@@ -115,6 +141,7 @@ Redacta una narrativa formal, coherente y completa basada en los datos estructur
                         "status": "success",
                         "narrative_length": len(narrative_output),
                         "metrics": metrics,
+                        "token_budget": token_budget,
                     },
                 }
 
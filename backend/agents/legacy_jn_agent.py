@@ -1,8 +1,6 @@
 import os
 import json # Importar el módulo json
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_groq import ChatGroq
 from langchain_core.output_parsers import JsonOutputParser
 from typing import Dict, Any, Optional
 
@@ -11,7 +9,7 @@ from backend.models.schemas_jn import UserRequest, ChatResponse, JustificacionNe
 
 # Importar los prompts desde backend.prompts
 from backend.prompts.jn_prompts import prompt_a_template, prompt_b_template
-from backend.core.config import settings
+from backend.core.llm_client import get_llm
 
 # --- Configuración de los modelos de lenguaje ---
 # Asegúrate de que OPENAI_API_KEY y GROQ_API_KEY estén en tu .env
@@ -32,20 +30,15 @@ async def generate_justificacion_necesidad(
     Permite especificar el modelo concreto por etapa.
     """
     # Configuración de los modelos de lenguaje
-    llm_openai = ChatOpenAI(model="gpt-5", api_key=settings.openai_api_key) # Usar settings.openai_api_key
-    llm_groq = ChatGroq(model="openai/gpt-oss-20b", temperature=0, api_key=settings.groq_api_key) # Usar settings.groq_api_key
+    # (clientes compartidos del registro de llm_client: sin pools HTTP nuevos por request)
+    def select_llm(choice: str, task_type: str):
+        if choice == "groq":
+            return get_llm(provider="groq", model_name="openai/gpt-oss-20b", temperature=0, task_type=task_type)
+        return get_llm(provider="openai", model_name="gpt-5", temperature=None, task_type=task_type)
 
-    # Seleccionar el LLM para la generación estructurada
-    if structured_llm_choice == "groq":
-        structured_llm = llm_groq
-    else:
-        structured_llm = llm_openai
-
-    # Seleccionar el LLM para la generación narrativa
-    if narrative_llm_choice == "groq":
-        narrative_llm = llm_groq
-    else:
-        narrative_llm = llm_openai
+    # Seleccionar el LLM para la generación estructurada y para la narrativa
+    structured_llm = select_llm(structured_llm_choice, "legacy_structured")
+    narrative_llm = select_llm(narrative_llm_choice, "legacy_narrative")
 
     # Definir las cadenas con los LLMs seleccionados
     structured_chain = prompt_a_template | structured_llm | parser_structured_jn
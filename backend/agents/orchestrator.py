@@ -4,8 +4,15 @@ Orchestrator (instrumentado)
 Flujo LangGraph completo con trazabilidad LangFuse (contextual) y persistencia Mongo.
 """
 
+import os
+import time
+import uuid
+import asyncio
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict
+from langgraph.config import get_stream_writer
+from langgraph.checkpoint.memory import InMemorySaver
+from pymongo import MongoClient
+from typing import TypedDict, List, Dict, Any, AsyncIterator, Optional, Tuple
 from backend.agents.retriever_agent import RetrieverAgent
 from backend.agents.prompt_refiner import PromptRefinerAgent
 from backend.agents.prompt_manager import PromptManager
@@ -15,6 +22,15 @@ from backend.agents.generators.generator_b import GeneratorB
 from backend.prompts.jn_prompts import prompt_a_template, prompt_b_template, PROMPT_PARSER_SLOTS_JN
 from backend.database.outputs_repository import save_output
 from backend.core.langfuse_client import langfuse
+from backend.core.metrics import NODE_DURATION
+from backend.core.generation_cache import get_generation_cache
+from backend.core.llm_cache import bypass_llm_cache, bypass_llm_cache_active
+
+try:
+    from langgraph.checkpoint.mongodb import MongoDBSaver
+    HAS_MONGO_CHECKPOINTER = True
+except ImportError:
+    HAS_MONGO_CHECKPOINTER = False
 
 
 # ============================================================
@@ -34,27 +50,163 @@ class OrchestratorState(TypedDict, total=False):
         json_a: dict
         json_b: dict
         validation_result: str
+        rag_prefetched: bool # True si el contexto RAG ya viene recuperado (lotes por expediente)
+        rag_query: str # Texto con el que se recuperó el contexto precargado (forma parte de la clave de caché)
+        stream_tokens: bool # True para emitir la narrativa de GeneratorB token a token (SSE)
+        # --- Resultado de validación (escrito por ValidatorAgent) ---
+        validation_a_result: dict
+        validation_a_passed: bool
+        validation_b_result: dict
+        validation_b_passed: bool
+        validation_failed: bool
+        validation_error_message: str
+        # --- Enrutado condicional ---
+        generation_a_attempts: int # Nº de veces que se ha ejecutado GeneratorA en este run
+        route_after_a: str # "continue" | "retry" | "fail" (decidido en validator_a)
+        route_history: list # Decisiones tomadas, p.ej. ["validator_a:retry", "validator_a:continue"]
+        path_taken: str # "completed" | "completed_after_retry" | "rejected"
+        # --- Caché de generación ---
+        generation_key: str # Hash canónico de entradas + versiones (backend.core.generation_cache)
+        corpus_version: str # Versión del corpus normativo usada en la clave
+        output_ids: dict # Ids en el ledger `outputs`: {"A": ..., "B": ...}
+        cache_hit: bool # True si el resultado sale de la caché sin ejecutar el grafo
+        # --- Presupuesto de tokens ---
+        token_budgets: dict # Desglose por tarea (backend.core.token_budget); JSON_A/B lo llevan en su metadata
+        # --- Hedging de proveedores LLM ---
+        hedge_llm: bool # Fuerza/desactiva el hedging en GeneratorA y el refinador (None → LLM_HEDGING_ENABLED)
+        llm_hedges: dict # Ganador y latencia por tarea (el de JSON_A va en su metadata)
+        output_mode: str # GeneratorA: "structured" | "text" (None → GENERATOR_A_OUTPUT_MODE)
+        # --- Recuperación ---
+        retrieval_mode: str # "vector" | "hybrid" (None → RETRIEVAL_MODE)
+        rerank: bool # Rerank con cross-encoder en el retriever (None → RERANK_ENABLED)
+        retrieval: dict # Bloque debug del retriever: valores usados y latencia por fuente
+        matches: list # Citas recuperadas (título, fuente, página, score)
+
+
+# ============================================================
+#   2. Contenedor de agentes (compartido por proceso)
+# ============================================================
+class OrchestratorAgents:
+    """
+    Agrupa las instancias de agentes que usa el grafo.
+    Se crea una sola vez por proceso (lifespan de FastAPI) para no recargar
+    el modelo de embeddings ni recrear clientes Mongo/LLM en cada request.
+    Los agentes no guardan estado por request: todo viaja en el `state` del grafo,
+    por lo que pueden compartirse entre peticiones concurrentes.
+
+    `retriever` y `output_sink` permiten sustituir las dependencias externas
+    (Atlas / colección outputs) en tests y benchmarks offline.
+    """
+
+    def __init__(self, debug_mode: bool = False, retriever=None, output_sink=None):
+        self.retriever = retriever or RetrieverAgent()
+        self.output_sink = output_sink or save_output
+        self.prompt_refiner = PromptRefinerAgent()
+        self.prompt_manager = PromptManager(prompt_a_template, prompt_b_template, debug_mode=debug_mode)
+        self.generator_a = GeneratorA()
+        self.validator_a = ValidatorAgent(mode="estructurado", strict=True, max_retries=2)  # Auto-retry habilitado
+        self.generator_b = GeneratorB()
+        self.validator_b = ValidatorAgent(mode="narrativa", strict=True, max_retries=0)  # Sin retry para narrativa
+
+    async def warmup(self):
+        """Precalienta los recursos costosos (primera inferencia del modelo de embeddings)."""
+        await self.retriever.warmup()
+
+    async def aclose(self):
+        """Libera conexiones abiertas por los agentes."""
+        self.retriever.close()
+
+
+# ============================================================
+#   3. Checkpointing (estado guardado tras cada nodo)
+# ============================================================
+# Backend del checkpointer: mongo (persistente) | memory (tests) | none (sin checkpoints)
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "mongo").lower()
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", os.getenv("MONGO_DB", "Golden"))
+CHECKPOINT_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Intentos máximos de GeneratorA (incluido el primero) antes de rechazar el JSON_A
+GENERATOR_A_MAX_ATTEMPTS = int(os.getenv("GENERATOR_A_MAX_ATTEMPTS", "2"))
+
+# Orden lineal de los nodos (para reanudar desde un nodo concreto)
+NODE_SEQUENCE = [
+    "retriever",
+    "prompt_refiner",
+    "prompt_manager",
+    "generator_a",
+    "validator_a",
+    "generator_b",
+    "validator_b",
+]
+
+
+def build_checkpointer(backend: str = CHECKPOINT_BACKEND):
+    """
+    Devuelve el checkpointer de LangGraph según CHECKPOINT_BACKEND.
+    Si Mongo no está disponible se usa memoria (las ejecuciones no sobreviven reinicios).
+    """
+    if backend == "none":
+        return None
+    mongo_uri = os.getenv("MONGO_URI")
+    if backend == "mongo" and HAS_MONGO_CHECKPOINTER and mongo_uri:
+        return MongoDBSaver(
+            MongoClient(mongo_uri),
+            db_name=CHECKPOINT_DB,
+            checkpoint_collection_name="graph_checkpoints",
+            writes_collection_name="graph_checkpoint_writes",
+            ttl=CHECKPOINT_TTL_SECONDS,
+        )
+    if backend == "mongo":
+        print("⚠️ [Orchestrator] Checkpointer Mongo no disponible, usando memoria local")
+    return InMemorySaver()
+
+
+def _timed(node_name: str, node_fn):
+    """Envuelve un nodo para registrar su tiempo de pared en /metrics."""
+    async def timed_node(state: OrchestratorState):
+        with NODE_DURATION.time(node=node_name):
+            return await node_fn(state)
+    return timed_node
+
 
+def retrieval_state(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Claves del estado que rellena el retriever (nodo del grafo o pasada compartida de un lote)."""
+    return {
+        "context": result.get("context", ""),
+        "matches": result.get("matches", []),
+        "retrieval": result.get("debug"),
+    }
 
-    # ============================================================
-    #   2. Funciones observables (LangFuse)
-    # ============================================================
-def build_orchestrator(debug_mode: bool = False):
+
+def new_run_config(run_id: str = None) -> Dict[str, Any]:
+    """Config de ejecución del grafo: cada run tiene su propio hilo de checkpoints."""
+    return {"configurable": {"thread_id": run_id or str(uuid.uuid4())}}
+
+
+# ============================================================
+#   4. Grafo LangGraph (nodos observables con LangFuse)
+# ============================================================
+def build_orchestrator(debug_mode: bool = False, agents: OrchestratorAgents = None, checkpointer=None):
         graph = StateGraph(OrchestratorState)
 
-        # Instancias de agentes
-        retriever_agent = RetrieverAgent()
-        prompt_refiner_agent = PromptRefinerAgent()
-        prompt_manager_agent = PromptManager(prompt_a_template, prompt_b_template, debug_mode=debug_mode)
-        generator_a_agent = GeneratorA()
-        validator_a_agent = ValidatorAgent(mode="estructurado", strict=True, max_retries=2)  # Auto-retry habilitado
-        generator_b_agent = GeneratorB()
-        validator_b_agent = ValidatorAgent(mode="narrativa", strict=True, max_retries=0)  # Sin retry para narrativa
+        # Instancias de agentes (reutiliza el contenedor si se proporciona)
+        agents = agents or OrchestratorAgents(debug_mode=debug_mode)
+        retriever_agent = agents.retriever
+        prompt_refiner_agent = agents.prompt_refiner
+        prompt_manager_agent = agents.prompt_manager
+        generator_a_agent = agents.generator_a
+        validator_a_agent = agents.validator_a
+        generator_b_agent = agents.generator_b
+        validator_b_agent = agents.validator_b
+        output_sink = agents.output_sink
 
         async def retriever_node(state: OrchestratorState):
+            # Contexto ya recuperado para todo el expediente (ejecución por lotes)
+            if state.get("rag_prefetched"):
+                return state
             with langfuse.start_as_current_span(name="retriever_node"):
                 result = await retriever_agent.ainvoke(state)
-                state.update(result)
+                state.update(retrieval_state(result))
                 return state
 
         async def prompt_refiner_node(state: OrchestratorState) -> OrchestratorState:
@@ -68,11 +220,16 @@ def build_orchestrator(debug_mode: bool = False):
                 "base_section_instruction": base_section_instruction,
                 "user_input": user_text,
                 "rag_context": "\n".join([res.get('content', '') for res in rag_results]),
-                "section_key": seccion
+                "section_key": seccion,
+                "hedge": state.get("hedge_llm"),
             }
             refined_output = await prompt_refiner_agent.ainvoke(inputs)
             state["refined_section_instruction"] = refined_output["refined_section_instruction"]
             state["json_schema"] = refined_output["json_schema"]
+            if refined_output.get("token_budget"):
+                state["token_budgets"] = {**(state.get("token_budgets") or {}), "prompt_refiner": refined_output["token_budget"]}
+            if refined_output.get("hedge"):
+                state["llm_hedges"] = {**(state.get("llm_hedges") or {}), "prompt_refiner": refined_output["hedge"]}
             return state
 
         async def prompt_manager_node(state: OrchestratorState):
@@ -100,62 +257,365 @@ def build_orchestrator(debug_mode: bool = False):
 
         async def generator_a_node(state: OrchestratorState):
             with langfuse.start_as_current_span(name="generator_a_node"):
-                result = await generator_a_agent.ainvoke(state)
+                # Cada intento parte de una validación limpia
+                state["generation_a_attempts"] = state.get("generation_a_attempts", 0) + 1
+                state["validation_failed"] = False
+                state["validation_error_message"] = ""
+                # Un reintento no puede salir de la caché de respuestas: devolvería la respuesta rechazada
+                with bypass_llm_cache(state["generation_a_attempts"] > 1 or bypass_llm_cache_active()):
+                    result = await generator_a_agent.ainvoke(state)
                 state.update(result)
                 if "json_a" in result:
-                    await save_output(
+                    output_id = await output_sink(
                         state["expediente_id"],
                         state["documento"],
                         state["seccion"],
                         "A",
                     result["json_a"],
                 )
+                    state["output_ids"] = {**(state.get("output_ids") or {}), "A": output_id}
             return state
 
         async def validator_a_node(state: OrchestratorState):
             with langfuse.start_as_current_span(name="validator_a_node"):
                 result = await validator_a_agent.ainvoke(state)
                 state.update(result)
+
+                # Decidir la ruta: continuar, regenerar JSON_A o rechazar sin gastar narrativa
+                if state.get("validation_a_passed"):
+                    decision = "continue"
+                elif state.get("generation_a_attempts", 1) < GENERATOR_A_MAX_ATTEMPTS:
+                    decision = "retry"
+                else:
+                    decision = "fail"
+                state["route_after_a"] = decision
+                state["route_history"] = list(state.get("route_history") or []) + [f"validator_a:{decision}"]
             return state
 
+        def route_after_validator_a(state: OrchestratorState) -> str:
+            return state.get("route_after_a", "continue")
+
         async def generator_b_node(state: OrchestratorState):
             with langfuse.start_as_current_span(name="generator_b_node"):
-                result = await generator_b_agent.ainvoke(state)
+                on_token = None
+                if state.get("stream_tokens"):
+                    # Los tokens salen por el canal "custom" de graph.astream()
+                    writer = get_stream_writer()
+                    on_token = lambda delta: writer({"event": "token", "node": "generator_b", "delta": delta})
+                result = await generator_b_agent.ainvoke(state, on_token=on_token)
                 state.update(result)
                 if "json_b" in result:
-                    await save_output(
+                    output_id = await output_sink(
                         state["expediente_id"],
                         state["documento"],
                         state["seccion"],
                         "B",
                     result["json_b"],
                 )
+                    state["output_ids"] = {**(state.get("output_ids") or {}), "B": output_id}
             return state
 
         async def validator_b_node(state: OrchestratorState):
             with langfuse.start_as_current_span(name="validator_b_node"):
                 result = await validator_b_agent.ainvoke(state)
                 state.update(result)
+                retried = any(r == "validator_a:retry" for r in state.get("route_history") or [])
+                state["path_taken"] = "completed_after_retry" if retried else "completed"
             return state
 
-        graph.add_node("retriever", retriever_node)
-        graph.add_node("prompt_refiner", prompt_refiner_node)
-        graph.add_node("prompt_manager", prompt_manager_node)
-        graph.add_node("generator_a", generator_a_node)
-        graph.add_node("validator_a", validator_a_node)
-        graph.add_node("generator_b", generator_b_node)
-        graph.add_node("validator_b", validator_b_node)
+        async def rejected_node(state: OrchestratorState):
+            # Terminal de fallo: JSON_A rechazado tras agotar intentos → no se genera narrativa
+            print(f"⛔ JSON_A rechazado tras {state.get('generation_a_attempts', 1)} intento(s); se omite GeneratorB")
+            state["path_taken"] = "rejected"
+            return state
+
+        graph.add_node("retriever", _timed("retriever", retriever_node))
+        graph.add_node("prompt_refiner", _timed("prompt_refiner", prompt_refiner_node))
+        graph.add_node("prompt_manager", _timed("prompt_manager", prompt_manager_node))
+        graph.add_node("generator_a", _timed("generator_a", generator_a_node))
+        graph.add_node("validator_a", _timed("validator_a", validator_a_node))
+        graph.add_node("generator_b", _timed("generator_b", generator_b_node))
+        graph.add_node("validator_b", _timed("validator_b", validator_b_node))
+        graph.add_node("rejected", _timed("rejected", rejected_node))
 
         graph.add_edge(START, "retriever")
         graph.add_edge("retriever", "prompt_refiner")
         graph.add_edge("prompt_refiner", "prompt_manager")
         graph.add_edge("prompt_manager", "generator_a")
         graph.add_edge("generator_a", "validator_a")
-        graph.add_edge("validator_a", "generator_b")
+        graph.add_conditional_edges(
+            "validator_a",
+            route_after_validator_a,
+            {"continue": "generator_b", "retry": "generator_a", "fail": "rejected"},
+        )
         graph.add_edge("generator_b", "validator_b")
         graph.add_edge("validator_b", END)
+        graph.add_edge("rejected", END)
+
+        return graph.compile(checkpointer=checkpointer)
+
+
+# ============================================================
+#   5. Runtime de proceso (grafo compilado una sola vez)
+# ============================================================
+_runtime = {"agents": None, "graph": None}
+
+
+async def init_orchestrator_runtime(warmup: bool = True, agents: OrchestratorAgents = None, checkpointer=None):
+    """
+    Crea el contenedor de agentes y el grafo compilado del proceso.
+    Pensado para el lifespan de FastAPI: el coste de carga se paga al arrancar.
+    `agents` / `checkpointer` permiten inyectar dependencias (benchmarks offline).
+    """
+    if agents is not None and _runtime["graph"] is None:
+        _runtime["agents"] = agents
+        _runtime["graph"] = build_orchestrator(agents=agents, checkpointer=checkpointer)
+    graph = get_orchestrator()
+    if warmup:
+        await _runtime["agents"].warmup()
+    return graph
+
+
+def get_orchestrator():
+    """
+    Devuelve el grafo compilado compartido.
+    Si el lifespan no lo ha inicializado (scripts, tests), se construye bajo demanda.
+    """
+    if _runtime["graph"] is None:
+        agents = OrchestratorAgents()
+        _runtime["agents"] = agents
+        _runtime["graph"] = build_orchestrator(agents=agents, checkpointer=build_checkpointer())
+    return _runtime["graph"]
+
+
+def get_orchestrator_agents() -> OrchestratorAgents:
+    """Devuelve el contenedor de agentes compartido (lo crea si hace falta)."""
+    get_orchestrator()
+    return _runtime["agents"]
+
+
+async def run_section(
+    initial_state: Dict[str, Any],
+    run_id: str = None,
+    force_regenerate: bool = False,
+) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    Genera una sección pasando por la caché de generación.
+    Devuelve (estado_final, run_id); en un acierto de caché run_id es None
+    porque no se ejecuta el grafo ni se crean checkpoints.
+    """
+    cache = get_generation_cache()
+    state = dict(initial_state)
+    cached = await cache.lookup(state, force_regenerate=force_regenerate)
+    if cached:
+        return cached, None
+
+    config = new_run_config(run_id)
+    # force_regenerate también ignora la caché de respuestas LLM
+    with bypass_llm_cache(force_regenerate):
+        final_state = await get_orchestrator().ainvoke(state, config)
+    await cache.remember(final_state)
+    return final_state, config["configurable"]["thread_id"]
+
+
+async def shutdown_orchestrator_runtime():
+    """Cierra los recursos del runtime al apagar la aplicación."""
+    agents = _runtime["agents"]
+    _runtime["agents"] = None
+    _runtime["graph"] = None
+    if agents is not None:
+        await agents.aclose()
+
+
+# ============================================================
+#   6. Ejecución concurrente de varias secciones
+# ============================================================
+# Límite de grafos simultáneos por lote (protege a los proveedores LLM)
+JN_BATCH_MAX_CONCURRENCY = int(os.getenv("JN_BATCH_MAX_CONCURRENCY", "4"))
+
+
+async def run_sections_batch(
+    expediente_id: str,
+    secciones: List[str],
+    user_text: str,
+    documento: str = "JN",
+    user_text_por_seccion: Optional[Dict[str, str]] = None,
+    max_concurrency: Optional[int] = None,
+    force_regenerate: bool = False,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Ejecuta el grafo de varias secciones de un expediente en paralelo.
+
+    - Las secciones ya generadas con las mismas entradas salen de la caché de generación.
+    - Hace una única pasada de retrieval para todo el expediente y comparte contexto,
+      citas y bloque debug (`retrieval`) con cada sección.
+    - Limita la concurrencia con un semáforo (máximo JN_BATCH_MAX_CONCURRENCY).
+    - Devuelve los resultados según terminan (no en el orden de entrada).
+
+    Cada resultado: {"seccion", "run_id", "final_state", "error", "elapsed_ms"}
+    """
+    agents = get_orchestrator_agents()
+    user_text_por_seccion = user_text_por_seccion or {}
+    limit = min(max_concurrency or JN_BATCH_MAX_CONCURRENCY, JN_BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    # --- Retrieval compartido (una sola consulta para todo el expediente) ---
+    with langfuse.start_as_current_span(name="retriever_batch"):
+        retrieval = await agents.retriever.ainvoke({"user_text": user_text})
+    shared_retrieval = retrieval_state(retrieval)
+
+    async def run_one(seccion: str) -> Dict[str, Any]:
+        async with semaphore:
+            started = time.perf_counter()
+            initial_state = {
+                "expediente_id": expediente_id,
+                "documento": documento,
+                "seccion": seccion,
+                "user_text": user_text_por_seccion.get(seccion, user_text),
+                **shared_retrieval,
+                "rag_prefetched": True,
+                "rag_query": user_text,
+            }
+            run_id = str(uuid.uuid4())
+            try:
+                final_state, run_id = await run_section(initial_state, run_id, force_regenerate)
+                error = None
+            except Exception as e:
+                final_state, error = None, f"{type(e).__name__}: {e}"
+            return {
+                "seccion": seccion,
+                "run_id": run_id,
+                "final_state": final_state,
+                "error": error,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+
+    # Secciones únicas manteniendo el orden de entrada
+    tasks = [asyncio.create_task(run_one(s)) for s in dict.fromkeys(secciones)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Si el cliente corta el stream, no dejamos grafos huérfanos
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+# ============================================================
+#   7. Ejecución en streaming (eventos por nodo + tokens)
+# ============================================================
+def summarize_node_update(node: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    """Resumen ligero del estado tras un nodo, para eventos de progreso (SSE, jobs)."""
+    state = state or {}
+    if node == "retriever":
+        return {"context_chars": len(state.get("context") or "")}
+    if node == "prompt_refiner":
+        return {"refined_instruction_chars": len(state.get("refined_section_instruction") or "")}
+    if node == "generator_a":
+        return {"json_a": state.get("json_a")}
+    if node == "generator_b":
+        return {"json_b": state.get("json_b")}
+    if node == "validator_a":
+        return {"validation_failed": bool(state.get("validation_failed")), "route": state.get("route_after_a")}
+    if node == "validator_b":
+        return {"validation_failed": bool(state.get("validation_failed"))}
+    if node == "rejected":
+        return {"validation_error_message": state.get("validation_error_message")}
+    return {}
+
+
+async def stream_orchestrator(
+    initial_state: Dict[str, Any],
+    stream_tokens: bool = True,
+    run_id: str = None,
+    force_regenerate: bool = False,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Ejecuta el grafo compartido y emite un evento por cada nodo completado:
+      {"event": "node", "node": ..., "elapsed_ms": ..., "data": {...}}
+      {"event": "token", "node": "generator_b", "delta": "..."}   (si stream_tokens)
+      {"event": "result", "run_id": ..., "state": {...}}           (al final)
+    En un acierto de la caché de generación solo se emite "result" (run_id None).
+    """
+    cache = get_generation_cache()
+    initial_state = dict(initial_state)
+    cached = await cache.lookup(initial_state, force_regenerate=force_regenerate)
+    if cached:
+        yield {"event": "result", "run_id": None, "state": cached}
+        return
+
+    graph = get_orchestrator()
+    config = new_run_config(run_id)
+    started = time.perf_counter()
+    final_state = dict(initial_state)
+    state = {**initial_state, "stream_tokens": stream_tokens}
+
+    # force_regenerate también ignora la caché de respuestas LLM
+    with bypass_llm_cache(force_regenerate):
+        async for mode, chunk in graph.astream(state, config, stream_mode=["updates", "custom"]):
+            if mode == "custom":
+                yield chunk
+                continue
+            for node, update in chunk.items():
+                final_state.update(update or {})
+                yield {
+                    "event": "node",
+                    "node": node,
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "data": summarize_node_update(node, update),
+                }
+
+    await cache.remember(final_state)
+    yield {"event": "result", "run_id": config["configurable"]["thread_id"], "state": final_state}
+
+
+# ============================================================
+#   8. Reanudación desde checkpoints
+# ============================================================
+async def resume_orchestrator(
+    run_id: str,
+    from_node: Optional[str] = None,
+    state_overrides: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Reanuda una ejecución previa a partir de sus checkpoints.
+
+    - Sin `from_node`: continúa desde el último checkpoint (p.ej. tras un reinicio).
+    - Con `from_node`: vuelve a ejecutar desde ese nodo reutilizando el estado
+      guardado justo antes (p.ej. "generator_b" regenera solo la narrativa
+      a partir del JSON_A existente, sin repetir retriever/refiner/GeneratorA).
+    - `state_overrides` permite sustituir claves del estado antes de reanudar.
+    """
+    graph = get_orchestrator()
+    if graph.checkpointer is None:
+        raise ValueError("El checkpointing está desactivado (CHECKPOINT_BACKEND=none)")
+
+    config = new_run_config(run_id)
+    latest = await graph.aget_state(config)
+    if not latest.values:
+        raise LookupError(f"No existen checkpoints para la ejecución {run_id}")
+
+    if from_node:
+        if from_node not in NODE_SEQUENCE:
+            raise ValueError(f"Nodo desconocido: {from_node}")
+        target = None
+        async for snapshot in graph.aget_state_history(config):  # del más reciente al más antiguo
+            if snapshot.next == (from_node,):
+                target = snapshot
+                break
+        if target is None:
+            raise LookupError(f"La ejecución {run_id} no tiene checkpoint previo a '{from_node}'")
+        config = target.config
+        position = NODE_SEQUENCE.index(from_node)
+        previous_node = NODE_SEQUENCE[position - 1] if position > 0 else START
+    else:
+        previous_node = None
+
+    if state_overrides:
+        config = await graph.aupdate_state(config, state_overrides, as_node=previous_node)
 
-        return graph.compile()
+    return await graph.ainvoke(None, config)
 
 
 # ============================================================
@@ -197,3 +657,7 @@ def build_orchestrator():
 # - El flujo LangGraph se mantiene idéntico.
 # - La versión futura (.as_node) se usará cuando todos los agentes sean nativos.
 # - Orden del flujo: Retriever → Prompt → GeneratorA → ValidatorA → GeneratorB → ValidatorB → END
+# - Tras ValidatorA el flujo es condicional: continuar, volver a GeneratorA
+#   (hasta GENERATOR_A_MAX_ATTEMPTS) o terminar en "rejected" sin llamar a GeneratorB.
+# - El grafo y los agentes se crean una vez por proceso (`init_orchestrator_runtime`
+#   en el lifespan); los endpoints usan `get_orchestrator()`.
@@ -1,20 +1,26 @@
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate, PromptTemplate
 
 import json
 from backend.models.schemas_jn import OutputJsonA
+from backend.core.llm_client import get_llm
+from backend.core.token_budget import PromptSegment, fit_prompt
+from backend.core.hedging import HedgedLLM, hedging_enabled
 
 load_dotenv()
 
 class PromptRefinerAgent:
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model=os.getenv("OPENAI_MODEL", "gpt-4o"), # Puedes ajustar el modelo si es necesario
-            api_key=os.getenv("OPENAI_API_KEY"),
-            temperature=0.3 # Una temperatura más baja para mayor consistencia
+        model_name = os.getenv("OPENAI_MODEL", "gpt-4o") # Puedes ajustar el modelo si es necesario
+        self.llm = get_llm(
+            provider="openai",
+            model_name=model_name,
+            temperature=0.3, # Una temperatura más baja para mayor consistencia
+            task_type="prompt_refiner",
         )
+        # Hedging opcional contra el proveedor alternativo (gana la primera instrucción no vacía)
+        self.hedged_llm = HedgedLLM(self.llm, task_type="prompt_refiner", temperature=0.3)
         self.refiner_prompt_template = ChatPromptTemplate.from_messages([
             SystemMessagePromptTemplate(prompt=PromptTemplate(
                 template="""Eres un asistente experto en refinar instrucciones para modelos de lenguaje.
@@ -35,13 +41,11 @@ El JSON de salida debe adherirse estrictamente al siguiente esquema:
 """,
                 input_variables=["base_section_instruction", "user_input", "rag_context", "section_key", "json_schema"]
             )),
+            # Instrucción, input y contexto ya van en el mensaje de sistema: no se repiten (ahorro de tokens)
             HumanMessagePromptTemplate(prompt=PromptTemplate(
-                template="""Refina la siguiente instrucción para la sección '{section_key}':
-Instrucción Base: {base_section_instruction}
-Input del Usuario: {user_input}
-Contexto RAG: {rag_context}
+                template="""Refina la instrucción base para la sección '{section_key}'.
 Instrucción Refinada:""",
-                input_variables=["base_section_instruction", "user_input", "rag_context", "section_key"]
+                input_variables=["section_key"]
             ))
         ])
 
@@ -53,7 +57,8 @@ Instrucción Refinada:""",
           "base_section_instruction": "Instrucción base para la sección JN.1",
           "user_input": "Texto del usuario...",
           "rag_context": "Contexto RAG relevante...",
-          "section_key": "JN.1"
+          "section_key": "JN.1",
+          "hedge": True  # opcional (default LLM_HEDGING_ENABLED)
         }
         """
         base_section_instruction = inputs.get("base_section_instruction", "")
@@ -68,15 +73,32 @@ Instrucción Refinada:""",
             # Obtener el esquema JSON de OutputJsonA
             output_json_a_schema = json.dumps(OutputJsonA.model_json_schema(), ensure_ascii=False, indent=2)
 
+            # Presupuesto de tokens: el contexto RAG es lo primero que se recorta
+            fitted, token_budget = fit_prompt("prompt_refiner", [
+                PromptSegment("json_schema", output_json_a_schema, priority=100, trimmable=False),
+                PromptSegment("base_section_instruction", base_section_instruction, priority=100, trimmable=False),
+                PromptSegment("user_input", user_input, priority=90),
+                PromptSegment("rag_context", rag_context, priority=50),
+            ], model=self.llm.model_name)
+
             prompt_messages = self.refiner_prompt_template.format_messages(
                 base_section_instruction=base_section_instruction,
-                user_input=user_input,
-                rag_context=rag_context,
+                user_input=fitted["user_input"],
+                rag_context=fitted["rag_context"],
                 section_key=section_key,
                 json_schema=output_json_a_schema
             )
-            response = await self.llm.ainvoke(prompt_messages)
-            return {"refined_section_instruction": response.content, "json_schema": output_json_a_schema}
+            hedge_info = None
+            if hedging_enabled(inputs.get("hedge")):
+                response, hedge_info = await self.hedged_llm.ainvoke(prompt_messages, max_tokens=token_budget["max_tokens"])
+            else:
+                response = await self.llm.ainvoke(prompt_messages, max_tokens=token_budget["max_tokens"])
+            return {
+                "refined_section_instruction": response.content,
+                "json_schema": output_json_a_schema,
+                "token_budget": token_budget,
+                "hedge": hedge_info,
+            }
         except Exception as e:
             print(f"Error refining prompt for section {section_key}: {e}")
             return {"refined_section_instruction": base_section_instruction, "json_schema": output_json_a_schema} # Fallback a la instrucción base
\ No newline at end of file
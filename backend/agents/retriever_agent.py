@@ -1,18 +1,27 @@
 """
 RetrieverAgent (RAG)
 ----------------------
-Recupera contexto normativo desde MongoDB Atlas usando búsqueda vectorial.
+Recupera contexto normativo usando búsqueda vectorial: MongoDB Atlas ($vectorSearch)
+o un índice local memory-mapped (VECTOR_BACKEND=atlas|local).
 Devuelve contexto listo para prompts + metadatos (título, fuente, página, score).
 Config vía .env
 """
 
 import os
+import time
 import asyncio
 from typing import Dict, Any, List
 
 from motor.motor_asyncio import AsyncIOMotorClient
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
+from backend.core.metrics import RETRIEVER_VECTOR_SEARCH_DURATION, RETRIEVER_LEXICAL_SEARCH_DURATION
+from backend.core.embedding_service import EMBEDDING_MODEL, get_embedding_service
+from backend.core.embedding_cache import get_query_embedding_cache
+from backend.core.retrieval_policy import RETRIEVAL_MIN_CONTEXT_CHARS, get_retrieval_policy_manager
+from backend.core.reranker import RERANK_CANDIDATES, RERANK_TOP_K, get_reranker, rerank_enabled
+from backend.core.vector_index import VECTOR_BACKEND, VECTOR_INDEX_RELOAD_SECONDS, LocalVectorIndex
+from backend.core.context_packer import CONTEXT_PACKER, CONTEXT_TOKEN_BUDGET, pack_context
+from backend.core.retrieval_cache import get_retrieval_cache
 
 load_dotenv()
 
@@ -21,123 +30,347 @@ MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("MONGO_DB", "Golden")
 COLLECTION_NAME = os.getenv("EMBEDDINGS_COLLECTION", "embeddings")
 INDEX_NAME = os.getenv("VECTOR_INDEX_NAME", "default")
-MODEL_NAME = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+MODEL_NAME = EMBEDDING_MODEL
 
-# límites (tuneables sin tocar código)
+# límites (tuneables sin tocar código); valores iniciales de la política aprendida del corpus
 VSEARCH_NUM_CANDIDATES = int(os.getenv("VSEARCH_NUM_CANDIDATES", "150"))
 VSEARCH_LIMIT = int(os.getenv("VSEARCH_LIMIT", "5"))
 MAX_CONTEXT_CHARS = int(os.getenv("MAX_CONTEXT_CHARS", "4000"))  # recorta payload
 
-# Cache local para modelos (evita timeouts de HuggingFace)
-LOCAL_CACHE_DIR = os.getenv("SENTENCE_TRANSFORMERS_HOME", "./models_cache")
+# Identificador del corpus para la política de búsqueda (retrieval_policy)
+CORPUS_KEY = f"{DB_NAME}.{COLLECTION_NAME}:{INDEX_NAME}"
+
+# Recuperación híbrida: vector | hybrid (léxica $text + vectorial, fusionadas con RRF)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+# Constante k de reciprocal rank fusion (60 es el valor habitual)
+RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+
+
+def select_context(results: List[Dict[str, Any]], limit: int, max_chars: int, min_chars: int = 0):
+    """
+    Selección en cliente sobre los resultados sobre-capturados (ordenados por score).
+    Toma los `limit` mejores con texto (sin duplicados); si su contexto no llega a `min_chars`
+    sigue con los siguientes. Nunca supera `max_chars` (el último fragmento se recorta).
+    Devuelve (seleccionados, contexto, no usados de los `limit` primeros por falta de espacio).
+    """
+    candidates, seen = [], set()
+    for r in results:
+        t = (r.get("text") or "").strip()
+        if t and t not in seen:
+            seen.add(t)
+            candidates.append((r, t))
+
+    selected, chunks = [], []
+    acc = 0
+    for r, t in candidates:
+        if len(selected) >= limit and acc >= min_chars:
+            break
+        if acc + len(t) + 2 > max_chars:
+            remaining = max(0, max_chars - acc - 3)
+            if remaining > 0:
+                chunks.append(t[:remaining] + "…")
+                selected.append(r)
+            break
+        chunks.append(t)
+        selected.append(r)
+        acc += len(t) + 2
+
+    unused = max(0, min(limit, len(candidates)) - len(selected))
+    return selected, "\n\n".join(chunks), unused
+
+
+def _chunk_key(r: Dict[str, Any]):
+    return r.get("chunk_id") or (r.get("source"), r.get("page"), (r.get("text") or "").strip())
+
+
+def reciprocal_rank_fusion(ranked: Dict[str, List[Dict[str, Any]]], k: int = RETRIEVAL_RRF_K) -> List[Dict[str, Any]]:
+    """
+    Fusiona listas ordenadas de varias fuentes: score = Σ 1 / (k + rank).
+    Deduplica por chunk; cada resultado conserva el score original de cada fuente
+    (`<fuente>_score`) y la lista de fuentes que lo encontraron.
+    """
+    fused: Dict[Any, Dict[str, Any]] = {}
+    for source, results in ranked.items():
+        for rank, r in enumerate(results, start=1):
+            key = _chunk_key(r)
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {**r, "rrf_score": 0.0, "sources": []}
+            if source not in entry["sources"]:
+                entry["sources"].append(source)
+                entry["rrf_score"] += 1.0 / (k + rank)
+                entry[f"{source}_score"] = r.get("score")
+    results = sorted(fused.values(), key=lambda e: e["rrf_score"], reverse=True)
+    for r in results:
+        r["score"] = r["rrf_score"]
+    return results
+
+
+class AtlasVectorBackend:
+    """$vectorSearch sobre la colección de embeddings en Atlas (VECTOR_BACKEND=atlas)."""
+
+    name = "atlas"
+
+    def __init__(self, collection, index_name: str = INDEX_NAME, include_embeddings: bool = CONTEXT_PACKER == "mmr"):
+        self.collection = collection
+        self.index_name = index_name
+        # El empaquetado MMR del contexto reutiliza los embeddings de los chunks
+        self.include_embeddings = include_embeddings
+
+    def build_pipeline(self, query_embedding: List[float], limit: int, num_candidates: int):
+        pipeline = [
+            {
+                "$vectorSearch": {
+                    "queryVector": query_embedding,
+                    "path": "embedding",
+                    "numCandidates": num_candidates,
+                    "limit": limit,
+                    "index": self.index_name,
+                }
+            },
+            {
+                "$project": {
+                        "_id": 0,
+                        "chunk_id": {"$toString": "$_id"},
+                        "text": 1,
+                        "title": {
+                            "$ifNull": [
+                                "$title",
+                                "$metadata.title"
+                            ]
+                        },
+                        "source": {
+                            "$ifNull": [
+                                "$source",
+                                "$metadata.source"
+                            ]
+                        },
+                        "page": {
+                            "$ifNull": [
+                                "$page",
+                                "$metadata.page"
+                            ]
+                        },
+                        "score": {"$meta": "vectorSearchScore"},
+                    }
+
+            },
+        ]
+        if self.include_embeddings:
+            pipeline[1]["$project"]["embedding"] = 1
+        return pipeline
+
+    async def search(self, query_embedding: List[float], limit: int, num_candidates: int) -> List[Dict[str, Any]]:
+        return await self.collection.aggregate(
+            self.build_pipeline(query_embedding, limit, num_candidates)
+        ).to_list(length=limit)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name, "index": self.index_name}
+
+
+class LocalVectorBackend:
+    """
+    Índice local memory-mapped (VECTOR_BACKEND=local): sin red ni Atlas.
+    La búsqueda corre en un hilo; cada VECTOR_INDEX_RELOAD_SECONDS se recogen los refrescos incrementales.
+    """
+
+    name = "local"
+
+    def __init__(self, index: LocalVectorIndex = None, include_embeddings: bool = CONTEXT_PACKER == "mmr"):
+        self.index = index or LocalVectorIndex()
+        self.include_embeddings = include_embeddings
+        self._checked = time.monotonic()
+        if not self.index.count:
+            print(f"⚠️ [Retriever] Índice local vacío en {self.index.path}: "
+                  f"ejecuta python -m backend.database.build_local_index")
+
+    async def search(self, query_embedding: List[float], limit: int, num_candidates: int) -> List[Dict[str, Any]]:
+        if time.monotonic() - self._checked > VECTOR_INDEX_RELOAD_SECONDS:
+            self._checked = time.monotonic()
+            await asyncio.to_thread(self.index.reload_if_changed)
+        return await asyncio.to_thread(self.index.search, query_embedding, limit, num_candidates,
+                                       None, self.include_embeddings)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name, "index": self.index.path, "rows": self.index.count,
+                "dtype": self.index.dtype, "approximate": bool(self.index.manifest.get("ivf"))}
+
+
+class MongoTextSearch:
+    """Búsqueda léxica ($text) sobre los mismos chunks (índice de init_embeddings.py)."""
+
+    name = "lexical"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def build_pipeline(self, query_text: str, limit: int):
+        return [
+            {"$match": {"$text": {"$search": query_text}}},
+            {"$sort": {"score": {"$meta": "textScore"}}},
+            {"$limit": limit},
+            {
+                "$project": {
+                    "_id": 0,
+                    "chunk_id": {"$toString": "$_id"},
+                    "text": 1,
+                    "title": {"$ifNull": ["$title", "$metadata.title"]},
+                    "source": {"$ifNull": ["$source", "$metadata.source"]},
+                    "page": {"$ifNull": ["$page", "$metadata.page"]},
+                    "score": {"$meta": "textScore"},
+                }
+            },
+        ]
+
+    async def search(self, query_text: str, limit: int) -> List[Dict[str, Any]]:
+        return await self.collection.aggregate(self.build_pipeline(query_text, limit)).to_list(length=limit)
+
 
 class RetrieverAgent:
-    def __init__(self):
-        if not MONGO_URI:
-            raise RuntimeError("MONGO_URI no está definido en .env")
-        
-        # Configurar cache local para evitar descargas repetidas
-        os.makedirs(LOCAL_CACHE_DIR, exist_ok=True)
-        print(f"[Retriever] Usando cache local: {LOCAL_CACHE_DIR}")
-        
-        try:
-            self.model = SentenceTransformer(
-                MODEL_NAME,
-                cache_folder=LOCAL_CACHE_DIR,
-                device='cpu'  # Puede cambiarse a 'cuda' si hay GPU
-            )
-            print(f"[Retriever] Modelo cargado: {MODEL_NAME}")
-        except Exception as e:
-            print(f"⚠️ Error cargando modelo desde HuggingFace: {e}")
-            print(f"💡 Tip: Descarga el modelo manualmente o usa OpenAI embeddings")
-            raise
-        
-        self.client = AsyncIOMotorClient(MONGO_URI)
-        self.collection = self.client[DB_NAME][COLLECTION_NAME]
+    def __init__(self, backend=None, embeddings=None, lexical=None):
+        """
+        `backend` (búsqueda vectorial), `embeddings` (EmbeddingService) y `lexical` (búsqueda
+        léxica) permiten inyectar las dependencias en tests y benchmarks; con un backend
+        inyectado no se abre conexión a Mongo ni se exige MONGO_URI.
+        """
+        # Modelo de embeddings compartido del proceso (el mismo que usan las rutas);
+        # encode por lotes en su hilo dedicado: no bloquea el event loop
+        self.embeddings = embeddings or get_embedding_service()
+        self.batcher = self.embeddings.batcher
+
+        self.client = None
+        if backend is None:
+            if not MONGO_URI and VECTOR_BACKEND == "atlas":
+                raise RuntimeError("MONGO_URI no está definido en .env")
+            self.client = AsyncIOMotorClient(MONGO_URI) if MONGO_URI else None
+            if VECTOR_BACKEND == "local":
+                backend = LocalVectorBackend()
+            else:
+                backend = AtlasVectorBackend(self.client[DB_NAME][COLLECTION_NAME])
+            if lexical is None and self.client is not None:
+                lexical = MongoTextSearch(self.client[DB_NAME][COLLECTION_NAME])
+        self.backend = backend
+        self.lexical = lexical  # fuente léxica para RETRIEVAL_MODE=hybrid (None → solo vectorial)
+        print(f"[Retriever] Backend vectorial: {self.backend.name}")
+
+    async def warmup(self):
+        """Primera inferencia fuera del event loop para no pagarla en la primera request."""
+        await self.batcher.encode("warmup")
+        await get_retrieval_cache().refresh_version()  # la primera consulta ya puede usar la caché
+        if rerank_enabled():
+            await get_reranker().warmup()
+        print("[Retriever] Modelo precalentado")
+
+    def close(self):
+        """Cierra el cliente Motor (el servicio de embeddings es del proceso y se cierra en el lifespan)."""
+        if self.client is not None:
+            self.client.close()
 
     async def ainvoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
             query_text = (inputs or {}).get("user_text", "").strip()
             if not query_text:
                 return {"status": "error", "msg": "user_text vacío", "context": ""}
 
-            def build_pipeline(limit, num_candidates):
-                return [
-                    {
-                        "$vectorSearch": {
-                            "queryVector": query_embedding,
-                            "path": "embedding",
-                            "numCandidates": num_candidates,
-                            "limit": limit,
-                            "index": INDEX_NAME,
-                        }
-                    },
-                    {
-                        "$project": {
-                                "_id": 0,
-                                "text": 1,
-                                "title": {
-                                    "$ifNull": [
-                                        "$title",
-                                        "$metadata.title"
-                                    ]
-                                },
-                                "source": {
-                                    "$ifNull": [
-                                        "$source",
-                                        "$metadata.source"
-                                    ]
-                                },
-                                "page": {
-                                    "$ifNull": [
-                                        "$page",
-                                        "$metadata.page"
-                                    ]
-                                },
-                                "score": {"$meta": "vectorSearchScore"},
-                            }
-
-                    },
-                ]
+            # Modo por petición (estado `retrieval_mode`) o RETRIEVAL_MODE
+            requested_mode = ((inputs or {}).get("retrieval_mode") or RETRIEVAL_MODE).lower()
+            hybrid = requested_mode == "hybrid" and self.lexical is not None
+            rerank = rerank_enabled((inputs or {}).get("rerank"))
+            lexical_task = None
 
             try:
-                # --- Paso 1: embedding de la consulta ---
-                query_embedding = self.model.encode(query_text).tolist()
-
-                # --- Paso 2: primer intento ---
-                limit = VSEARCH_LIMIT
-                num_candidates = VSEARCH_NUM_CANDIDATES
-                results = await self.collection.aggregate(
-                    build_pipeline(limit, num_candidates)
-                ).to_list(length=limit)
-
-                # --- Paso 3: calibración automática ---
-                # Si no hay resultados o todos los textos son muy cortos, ampliamos el rango
-                if not results or sum(len(r.get("text", "")) for r in results) < 500:
-                    num_candidates = int(num_candidates * 1.5)
-                    limit = min(limit + 2, 10)
-                    results = await self.collection.aggregate(
-                        build_pipeline(limit, num_candidates)
-                    ).to_list(length=limit)
-
-                if not results:
-                    return {"status": "no_results", "context": "", "matches": [], "query": query_text}
+                # --- Paso 1: política aprendida del corpus (limit / numCandidates / sobre-captura) ---
+                policy_manager = get_retrieval_policy_manager(VSEARCH_NUM_CANDIDATES, VSEARCH_LIMIT)
+                policy = await policy_manager.get(CORPUS_KEY)
+                limit = policy.limit
+                num_candidates = policy.num_candidates
+                fetch_limit = policy.fetch_limit()
+                if rerank:
+                    # El cross-encoder necesita candidatos de sobra entre los que elegir
+                    fetch_limit = max(fetch_limit, RERANK_CANDIDATES)
+
+                # La búsqueda léxica no necesita embedding: corre en paralelo con el embedding y la
+                # búsqueda vectorial (si la caché de resultados acierta se cancela en `finally`)
+                if hybrid:
+                    lexical_task = asyncio.create_task(self._lexical_search(query_text, fetch_limit))
 
-                # --- Paso 4: construir contexto legible ---
-                chunks = []
-                acc = 0
-                for r in results:
-                    t = (r.get("text") or "").strip()
-                    if not t:
-                        continue
-                    if acc + len(t) + 2 > MAX_CONTEXT_CHARS:
-                        remaining = max(0, MAX_CONTEXT_CHARS - acc - 3)
-                        if remaining > 0:
-                            chunks.append(t[:remaining] + "…")
-                        break
-                    chunks.append(t)
-                    acc += len(t) + 2
-
-                context = "\n\n".join(chunks)
+                # --- Paso 2: embedding de la consulta + búsqueda vectorial única ---
+                # (caché LRU compartida con /normativa/search: consultas repetidas no se recodifican)
+                started_embed = time.perf_counter()
+                query_embedding = await get_query_embedding_cache().aget_or_compute(
+                    query_text, MODEL_NAME, self.batcher.encode
+                )
+                embedded = time.perf_counter()
+
+                # Caché de resultados (versión del corpus en la clave): un acierto no va a Atlas.
+                # Léxica y rerank dependen del texto, no solo del embedding.
+                retrieval_cache = get_retrieval_cache()
+                cache_key, cached = await retrieval_cache.lookup(
+                    query_embedding,
+                    corpus=CORPUS_KEY,
+                    backend=self.backend.name,
+                    model=MODEL_NAME,
+                    k=fetch_limit,
+                    num_candidates=num_candidates,
+                    limit=limit,
+                    retrieval_mode="hybrid" if hybrid else "vector",
+                    rerank=rerank,
+                    context_packer=CONTEXT_PACKER,
+                    text=query_text if hybrid or rerank else None,
+                )
+                if cached is not None:
+                    return cached
+
+                started = time.perf_counter()
+                with RETRIEVER_VECTOR_SEARCH_DURATION.time(backend=self.backend.name):
+                    results = await self.backend.search(query_embedding, fetch_limit, num_candidates)
+                sources = {
+                    "vector": {
+                        "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                        "embed_ms": round((embedded - started_embed) * 1000, 1),
+                        "results": len(results),
+                    }
+                }
+
+                # Fusión con la léxica (RRF) y deduplicación por chunk
+                if lexical_task is not None:
+                    lexical_results, sources["lexical"] = await lexical_task
+                    results = reciprocal_rank_fusion({"vector": results, "lexical": lexical_results})
+
+                # Rerank opcional: se quedan los top-k del cross-encoder (orden vectorial si agota su presupuesto)
+                rerank_info = None
+                if rerank:
+                    top_k = RERANK_TOP_K or limit
+                    results, rerank_info = await get_reranker().rerank(query_text, results[:RERANK_CANDIDATES], top_k)
+                    if rerank_info["status"] == "ok":
+                        limit = top_k
+
+                # --- Paso 3: selección en cliente + contexto legible ---
+                # (si los `limit` mejores se quedan cortos se completa con la sobre-captura,
+                #  sin una segunda agregación; con CONTEXT_PACKER=mmr sin casi-duplicados,
+                #  fusionando chunks contiguos y con presupuesto de tokens)
+                packing = None
+                if CONTEXT_PACKER == "mmr":
+                    selected, context, unused, packing = pack_context(
+                        results, limit, RETRIEVAL_MIN_CONTEXT_CHARS, CONTEXT_TOKEN_BUDGET
+                    )
+                else:
+                    selected, context, unused = select_context(
+                        results, limit, MAX_CONTEXT_CHARS, RETRIEVAL_MIN_CONTEXT_CHARS
+                    )
+
+                # --- Paso 4: la calidad observada ajusta la política del corpus ---
+                score_key = "vector_score" if hybrid else "score"
+                scores = [r[score_key] for r in selected if r.get(score_key) is not None]
+                adjusted = await policy_manager.observe(
+                    policy,
+                    context_chars=len(context),
+                    unused=unused,
+                    mean_score=sum(scores) / len(scores) if scores else None,
+                )
+
+                if not selected:
+                    return {"status": "no_results", "context": "", "matches": [], "query": query_text}
 
                 # --- Paso 5: metadatos / citas ---
                 citations = [
@@ -146,16 +379,25 @@ class RetrieverAgent:
                         "source": r.get("source"),
                         "page": r.get("page"),
                         "score": r.get("score"),
+                        **({"sources": r["sources"]} if hybrid else {}),
+                        **({"rerank_score": r["rerank_score"]} if "rerank_score" in r else {}),
                     }
-                    for r in results
+                    for r in selected
                 ]
 
+                # Un resultado degradado (rerank sin terminar, léxica caída) no se cachea bajo la
+                # clave de calidad completa: la siguiente consulta vuelve a intentarlo
+                degraded = (rerank_info is not None and rerank_info["status"] != "ok") or \
+                    "error" in sources.get("lexical", {})
+                if degraded:
+                    cache_key = None
+
                 # --- Paso 6: logging amigable ---
-                print(f"[Retriever] {len(results)} resultados — promedio de score: "
+                print(f"[Retriever] {len(selected)}/{len(results)} resultados — promedio de score: "
                     f"{sum(c['score'] for c in citations)/len(citations):.3f} "
-                    f"| numCandidates={num_candidates} limit={limit}")
+                    f"| numCandidates={num_candidates} limit={limit} fetch={fetch_limit}")
 
-                return {
+                result = {
                     "status": "ok",
                     "query": query_text,
                     "context": context,
@@ -163,11 +405,23 @@ class RetrieverAgent:
                     "debug": {
                         "num_candidates": num_candidates,
                         "limit": limit,
+                        "fetch_limit": fetch_limit,
+                        "fetched": len(results),
+                        "retrieval_mode": "hybrid" if hybrid else "vector",
+                        "sources": sources,
+                        "rerank": rerank_info,
+                        "selected": len(selected),
+                        "context_packing": packing,
+                        "vector_searches": 1,
+                        "policy": {"corpus": CORPUS_KEY, "observations": policy.observations, "adjusted": adjusted},
                         "max_context_chars": MAX_CONTEXT_CHARS,
-                        "index": INDEX_NAME,
+                        **self.backend.describe(),
                         "model": MODEL_NAME,
+                        "cache": {"hit": False, "stored": cache_key is not None},
                     },
                 }
+                retrieval_cache.store(cache_key, result)
+                return result
 
             except Exception as e:
                 return {
@@ -175,6 +429,24 @@ class RetrieverAgent:
                     "msg": f"Retriever falló: {type(e).__name__}: {e}",
                     "context": "",
                 }
+            finally:
+                if lexical_task is not None and not lexical_task.done():
+                    lexical_task.cancel()
+
+    async def _lexical_search(self, query_text: str, limit: int):
+        """Búsqueda léxica con su latencia; si falla se sigue solo con la vectorial."""
+        started = time.perf_counter()
+        try:
+            with RETRIEVER_LEXICAL_SEARCH_DURATION.time():
+                results = await self.lexical.search(query_text, limit)
+            error = None
+        except Exception as e:
+            results, error = [], f"{type(e).__name__}: {e}"
+            print(f"⚠️ [Retriever] Búsqueda léxica fallida, se usa solo la vectorial: {error}")
+        info = {"latency_ms": round((time.perf_counter() - started) * 1000, 1), "results": len(results)}
+        if error:
+            info["error"] = error
+        return results, info
 
 
 # Prueba manual local (opcional)
@@ -5,7 +5,8 @@ Esquemas de validación para JSON_A y JSON_B basados en los documentos del binde
 Estos esquemas permiten validar estructuralmente las salidas de los generadores.
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+import copy
 import json
 
 
@@ -110,6 +111,21 @@ class BinderSchemas:
         else:
             raise ValueError(f"Tipo de esquema desconocido: {schema_type}")
 
+    @staticmethod
+    def get_structured_output_schema(seccion: str) -> Optional[Dict[str, Any]]:
+        """
+        Esquema de datos de la sección para la salida estructurada nativa del proveedor
+        (response_format JSON schema). None si la sección no tiene esquema propio.
+        """
+        schema = BinderSchemas.SECTION_SCHEMAS.get(seccion)
+        if schema is None:
+            return None
+        return {
+            "title": f"JSON_A_{seccion.replace('.', '_')}",
+            "description": f"Datos estructurados de la sección {seccion}",
+            **copy.deepcopy(schema),
+        }
+
     @staticmethod
     def validate_basic_structure(data: Dict[str, Any], schema_type: str) -> tuple[bool, List[str]]:
         """
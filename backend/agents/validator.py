@@ -18,6 +18,7 @@ import os
 from dotenv import load_dotenv
 from backend.agents.schemas.json_schemas import BinderSchemas
 from backend.agents.generators.output_parser import OutputParser
+from backend.core.metrics import VALIDATOR_REPAIRS
 
 load_dotenv()
 
@@ -347,6 +348,7 @@ JSON CORREGIDO:"""
         """
         try:
             from backend.core.llm_client import get_llm
+            from backend.core.token_budget import PromptSegment, fit_prompt
             
             llm = get_llm(task_type="json_repair", temperature=0.1)
             
@@ -358,8 +360,11 @@ JSON CORREGIDO:"""
             
             print(f"\n🔧 Intentando reparación automática de JSON_A...")
             
-            # Invocar LLM para reparar
-            response = await llm.ainvoke(repair_prompt)
+            # Invocar LLM para reparar (max_tokens según el hueco que deja el prompt)
+            _, token_budget = fit_prompt("json_repair", [
+                PromptSegment("repair_prompt", repair_prompt, priority=100, trimmable=False),
+            ], model=llm.model_name)
+            response = await llm.ainvoke(repair_prompt, max_tokens=token_budget["max_tokens"])
             repaired_output = response.content
             
             # Parsear JSON reparado
@@ -373,6 +378,7 @@ JSON CORREGIDO:"""
             json_a["json"] = repaired_json
             json_a["metadata"]["repaired"] = True
             json_a["metadata"]["repair_attempt"] = True
+            json_a["metadata"]["repair_token_budget"] = token_budget
             
             print(f"✅ JSON reparado exitosamente")
             return json_a
@@ -458,6 +464,7 @@ JSON CORREGIDO:"""
                     result = self.validate_json_a(json_a, seccion)
                     result_dict = result.to_dict()
                     
+                    VALIDATOR_REPAIRS.inc(result="success" if result.is_valid else "failed")
                     if result.is_valid:
                         print(f"✅ Reparación exitosa en intento {retry_count}")
                         result_dict["repaired"] = True
@@ -1,26 +1,39 @@
 from datetime import datetime
 import hashlib
+import json
+import time
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Any, Optional, Dict
+from typing import Any, Optional, Dict, List
 from backend.models.schemas_jn import UserRequest, OutputJsonA, OutputJsonB, OutputJsonBRefs
 from backend.models.schemas_jn import UserRequest
 from backend.core.logic_jn import build_jn_output
-from backend.agents.orchestrator import build_orchestrator, OrchestratorState
+from backend.agents.orchestrator import (
+    get_orchestrator,
+    new_run_config,
+    resume_orchestrator,
+    run_section,
+    run_sections_batch,
+    stream_orchestrator,
+    NODE_SEQUENCE,
+    OrchestratorState,
+)
 from backend.database.outputs_repository import save_output
 from backend.utils.dict_utils import to_dict_safe
 from backend.core.llm_client import get_llm
 
 # Importaciones para RAG
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_mongodb import MongoDBAtlasVectorSearch
+from backend.core.embedding_service import get_embedding_service
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
 # Config embeddings (HuggingFace, gratis, local)
-embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+# (modelo compartido del proceso; embed_query pasa por la caché de embeddings de consultas)
+embeddings = get_embedding_service()
 
 # VectorStore conectado a Mongo Atlas
 vectorstore = MongoDBAtlasVectorSearch.from_connection_string(
@@ -63,8 +76,8 @@ async def generar_justificacion_de_la_necesidad(request: GenerateJNRequest):
         results = vectorstore.similarity_search(request.rag_query, k=3)
         rag_context_str = "\n\nContexto de Normativa Relevante:\n" + "\n---\n".join([doc.page_content for doc in results])
 
-    # Inicializar el orquestador
-    orchestrator_graph = build_orchestrator()
+    # Grafo compartido del proceso (creado en el lifespan)
+    orchestrator_graph = get_orchestrator()
 
     # Preparar el estado inicial para el orquestador
     initial_state = OrchestratorState(
@@ -78,7 +91,7 @@ async def generar_justificacion_de_la_necesidad(request: GenerateJNRequest):
 
     try:
         # Ejecutar el orquestador
-        final_state = await orchestrator_graph.ainvoke(initial_state)
+        final_state = await orchestrator_graph.ainvoke(initial_state, new_run_config())
 
         jn_output = {}
         if "json_a" in final_state:
@@ -131,12 +144,80 @@ async def generar_justificacion_de_la_necesidad(request: GenerateJNRequest):
 # 🚀 NUEVO ENDPOINT CON ORQUESTADOR LANGGRAPH
 # ============================================================
 
+def collect_token_budgets(final_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Desglose de tokens por tarea: refinador (estado) + generadores (metadata de JSON_A / JSON_B)."""
+    budgets = dict(final_state.get("token_budgets") or {})
+    for task_type in ("json_a", "json_b"):
+        budget = ((final_state.get(task_type) or {}).get("metadata") or {}).get("token_budget")
+        if budget:
+            budgets[task_type] = budget
+    return budgets
+
+
+def collect_llm_hedges(final_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Proveedor ganador y latencia de las llamadas hedged (refinador + JSON_A)."""
+    hedges = dict(final_state.get("llm_hedges") or {})
+    hedge_a = ((final_state.get("json_a") or {}).get("metadata") or {}).get("hedge")
+    if hedge_a:
+        hedges["json_a"] = hedge_a
+    return hedges
+
+
+def build_section_response(final_state: Dict[str, Any], expediente_id: str, seccion: str, run_id: str = None) -> Dict[str, Any]:
+    """Formato común de respuesta para una sección generada por el orquestador."""
+    path_taken = final_state.get("path_taken")
+    rejected = path_taken == "rejected"
+    return {
+        "success": not rejected,
+        "expediente_id": expediente_id,
+        "seccion": seccion,
+        "run_id": run_id,
+        "json_a": final_state.get("json_a"),
+        "json_b": final_state.get("json_b"),
+        "validation_result": final_state.get("validation_b_result") or final_state.get("validation_a_result"),
+        "path_taken": path_taken,
+        "route_history": final_state.get("route_history", []),
+        "generation_a_attempts": final_state.get("generation_a_attempts"),
+        "rag_results_count": len(final_state.get("rag_results") or final_state.get("matches") or []),
+        "cache_hit": bool(final_state.get("cache_hit")),
+        "token_budgets": collect_token_budgets(final_state),
+        "llm_hedges": collect_llm_hedges(final_state),
+        "retrieval": final_state.get("retrieval"),
+        "message": (
+            f"Sección {seccion} rechazada: {final_state.get('validation_error_message', '')}"
+            if rejected else
+            f"Sección {seccion} generada exitosamente con orquestador LangGraph"
+        )
+    }
+
+
 class GenerateJNOrchestratedRequest(BaseModel):
     """Request para generar sección JN con orquestador LangGraph"""
     expediente_id: str = Field(..., description="ID del expediente")
     documento: str = Field(default="JN", description="Tipo de documento (JN, PPT, CEC, CR)")
     seccion: str = Field(..., description="Sección a generar (JN.1, JN.2, JN.3, etc.)")
     user_text: str = Field(..., description="Texto de entrada del usuario")
+    force_regenerate: bool = Field(False, description="Si True, ignora la caché de generación y vuelve a ejecutar el grafo")
+    hedge: Optional[bool] = Field(None, description="Hedging OpenAI/Groq en GeneratorA y el refinador (None → LLM_HEDGING_ENABLED)")
+    retrieval_mode: Optional[str] = Field(None, description="Recuperación 'vector' o 'hybrid' (léxica + vectorial con RRF); None → RETRIEVAL_MODE")
+    rerank: Optional[bool] = Field(None, description="Rerank de los candidatos con cross-encoder (None → RERANK_ENABLED)")
+
+
+def orchestrated_initial_state(request: GenerateJNOrchestratedRequest) -> Dict[str, Any]:
+    """Estado inicial del grafo con las opciones por petición (también lo usa la cola de jobs)."""
+    initial_state = {
+        "expediente_id": request.expediente_id,
+        "documento": request.documento,
+        "seccion": request.seccion,
+        "user_text": request.user_text
+    }
+    if request.hedge is not None:
+        initial_state["hedge_llm"] = request.hedge
+    if request.retrieval_mode:
+        initial_state["retrieval_mode"] = request.retrieval_mode
+    if request.rerank is not None:
+        initial_state["rerank"] = request.rerank
+    return initial_state
 
 
 @router.post("/generar_jn_orquestado")
@@ -155,36 +236,178 @@ async def generar_jn_con_orquestador(request: GenerateJNOrchestratedRequest):
     8. Save → Guarda en MongoDB con trazabilidad
     
     Todo el flujo está instrumentado con LangFuse para observabilidad.
+    Si la misma sección ya se generó con idénticas entradas (y mismos prompts,
+    esquemas, modelo y corpus) se devuelve desde la caché (`cache_hit=true`).
     """
     try:
-        # Construir orquestador
-        orchestrator = build_orchestrator(debug_mode=False)
-        
         # Estado inicial
-        initial_state = {
-            "expediente_id": request.expediente_id,
-            "documento": request.documento,
-            "seccion": request.seccion,
-            "user_text": request.user_text
-        }
+        initial_state = orchestrated_initial_state(request)
         
-        # Ejecutar grafo
-        final_state = await orchestrator.ainvoke(initial_state)
+        # Caché de generación → grafo compartido (cada ejecución guarda checkpoints bajo su run_id)
+        final_state, run_id = await run_section(initial_state, force_regenerate=request.force_regenerate)
         
         # Respuesta
-        return {
-            "success": True,
-            "expediente_id": request.expediente_id,
-            "seccion": request.seccion,
-            "json_a": final_state.get("json_a"),
-            "json_b": final_state.get("json_b"),
-            "validation_result": final_state.get("validation_result"),
-            "rag_results_count": len(final_state.get("rag_results", [])),
-            "message": f"Sección {request.seccion} generada exitosamente con orquestador LangGraph"
-        }
+        return build_section_response(final_state, request.expediente_id, request.seccion, run_id)
     
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error en orquestador: {str(e)}"
         )
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Serializa un evento en formato Server-Sent Events."""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+@router.post("/generar_jn_orquestado/stream")
+async def generar_jn_con_orquestador_stream(request: GenerateJNOrchestratedRequest):
+    """
+    📡 Variante en streaming (Server-Sent Events) de /generar_jn_orquestado.
+
+    Eventos emitidos:
+    - `node`   → al completar cada nodo (retriever, prompt_refiner, generator_a, …)
+    - `token`  → fragmentos de la narrativa de GeneratorB según se generan
+    - `result` → respuesta final (mismo formato que el endpoint no streaming)
+    - `error`  → si el orquestador falla a mitad de ejecución
+
+    El primer byte llega al terminar el retriever, no al final del pipeline.
+    """
+    initial_state = orchestrated_initial_state(request)
+
+    async def event_stream():
+        try:
+            async for event in stream_orchestrator(initial_state, stream_tokens=True, force_regenerate=request.force_regenerate):
+                kind = event.pop("event")
+                if kind == "result":
+                    yield _sse("result", build_section_response(event["state"], request.expediente_id, request.seccion, event["run_id"]))
+                else:
+                    yield _sse(kind, event)
+        except Exception as e:
+            yield _sse("error", {"detail": f"Error en orquestador: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ============================================================
+# 📦 GENERACIÓN CONCURRENTE DE VARIAS SECCIONES
+# ============================================================
+
+class GenerateJNBatchRequest(BaseModel):
+    """Request para generar varias secciones de un expediente en paralelo"""
+    expediente_id: str = Field(..., description="ID del expediente")
+    documento: str = Field(default="JN", description="Tipo de documento (JN, PPT, CEC, CR)")
+    secciones: List[str] = Field(..., min_length=1, description="Secciones a generar (JN.1 … JN.8)")
+    user_text: str = Field(..., description="Texto de entrada del usuario (se usa también para el retrieval compartido)")
+    user_text_por_seccion: Dict[str, str] = Field(default_factory=dict, description="Texto específico por sección (opcional)")
+    max_concurrency: Optional[int] = Field(None, ge=1, description="Máximo de secciones simultáneas (limitado por JN_BATCH_MAX_CONCURRENCY)")
+    stream: bool = Field(False, description="Si True, devuelve NDJSON con una línea por sección según termina")
+    force_regenerate: bool = Field(False, description="Si True, ignora la caché de generación para todas las secciones")
+
+
+def _batch_item_response(item: Dict[str, Any], expediente_id: str) -> Dict[str, Any]:
+    """Convierte el resultado del runner de lotes al formato de respuesta por sección."""
+    if item["error"]:
+        return {
+            "success": False,
+            "expediente_id": expediente_id,
+            "seccion": item["seccion"],
+            "run_id": item["run_id"],
+            "error": item["error"],
+            "elapsed_ms": item["elapsed_ms"],
+        }
+    response = build_section_response(item["final_state"], expediente_id, item["seccion"], item["run_id"])
+    response["elapsed_ms"] = item["elapsed_ms"]
+    return response
+
+
+@router.post("/generar_jn_lote")
+async def generar_jn_lote(request: GenerateJNBatchRequest):
+    """
+    📦 Genera varias secciones de un expediente concurrentemente.
+
+    - Una única pasada de retrieval compartida por todas las secciones.
+    - Grafos en paralelo con límite de concurrencia configurable.
+    - `stream=True` → NDJSON (una línea por sección en orden de finalización;
+      si el lote falla a mitad, una última línea `{"success": false, "error": ...}`).
+    - `stream=False` → respuesta única con todas las secciones.
+
+    El tiempo total pasa de la suma de los pipelines al del más lento.
+    """
+    batch = run_sections_batch(
+        expediente_id=request.expediente_id,
+        secciones=request.secciones,
+        user_text=request.user_text,
+        documento=request.documento,
+        user_text_por_seccion=request.user_text_por_seccion,
+        max_concurrency=request.max_concurrency,
+        force_regenerate=request.force_regenerate,
+    )
+
+    if request.stream:
+        async def ndjson_lines():
+            try:
+                async for item in batch:
+                    yield json.dumps(_batch_item_response(item, request.expediente_id), ensure_ascii=False, default=str) + "\n"
+            except Exception as e:
+                # Las cabeceras 200 ya se enviaron: el fallo va como última línea
+                error = {"success": False, "expediente_id": request.expediente_id,
+                         "error": f"Error en generación por lotes: {str(e)}"}
+                yield json.dumps(error, ensure_ascii=False) + "\n"
+
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+    started = time.perf_counter()
+    try:
+        resultados = [_batch_item_response(item, request.expediente_id) async for item in batch]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en generación por lotes: {str(e)}")
+
+    return {
+        "success": all(r["success"] for r in resultados),
+        "expediente_id": request.expediente_id,
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        "resultados": resultados,
+    }
+
+
+# ============================================================
+# ⏯️ REANUDACIÓN DESDE CHECKPOINTS
+# ============================================================
+
+class ResumeJNRequest(BaseModel):
+    """Request para reanudar una ejecución previa del orquestador"""
+    run_id: str = Field(..., description="run_id devuelto por la ejecución original")
+    from_node: Optional[str] = Field(None, description=f"Nodo desde el que reejecutar ({', '.join(NODE_SEQUENCE)}). Vacío = continuar donde se quedó")
+    state_overrides: Dict[str, Any] = Field(default_factory=dict, description="Claves del estado a sustituir antes de reanudar (p.ej. json_a)")
+
+
+@router.post("/reanudar")
+async def reanudar_jn(request: ResumeJNRequest):
+    """
+    ⏯️ Reanuda una ejecución a partir de sus checkpoints.
+
+    Ejemplo: `from_node="generator_b"` regenera solo la narrativa usando el
+    JSON_A ya guardado, sin repetir retriever, refiner ni GeneratorA.
+    """
+    try:
+        final_state = await resume_orchestrator(request.run_id, request.from_node, request.state_overrides or None)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reanudando orquestador: {str(e)}")
+
+    return build_section_response(
+        final_state,
+        final_state.get("expediente_id"),
+        final_state.get("seccion"),
+        request.run_id,
+    )
@@ -0,0 +1,66 @@
+from typing import Any, Awaitable, Callable, Dict
+from fastapi import APIRouter, HTTPException
+from backend.agents.orchestrator import stream_orchestrator
+from backend.api.jn_routes import GenerateJNOrchestratedRequest, build_section_response, orchestrated_initial_state
+from backend.core.job_queue import get_job_queue, JobQueueFullError
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+async def run_generation_job(request: Dict[str, Any], on_node: Callable[[Dict[str, Any]], Awaitable[None]]) -> Dict[str, Any]:
+    """
+    Runner de la cola: ejecuta el orquestador para una sección y notifica
+    cada nodo completado para exponer el progreso del job.
+    """
+    # Mismo estado inicial que /generar_jn_orquestado (hedge, retrieval_mode, rerank…)
+    job_request = GenerateJNOrchestratedRequest(**request)
+    initial_state = orchestrated_initial_state(job_request)
+    final_state, run_id = None, None
+    async for event in stream_orchestrator(initial_state, stream_tokens=False, force_regenerate=job_request.force_regenerate):
+        if event["event"] == "node":
+            await on_node({"node": event["node"], "elapsed_ms": event["elapsed_ms"]})
+        elif event["event"] == "result":
+            final_state, run_id = event["state"], event["run_id"]
+    return build_section_response(final_state or {}, job_request.expediente_id, job_request.seccion, run_id)
+
+
+@router.post("/", status_code=202)
+async def submit_job(request: GenerateJNOrchestratedRequest):
+    """
+    📥 Encola la generación de una sección y devuelve el `job_id` inmediatamente.
+    Si la cola está llena responde 429 (back-pressure) para que el cliente reintente.
+    """
+    try:
+        job = await get_job_queue().submit(request.model_dump())
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error encolando job: {str(e)}")
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+
+@router.get("/stats")
+async def job_queue_stats():
+    """📊 Estado de la cola: workers, jobs pendientes y en ejecución."""
+    return get_job_queue().stats()
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """
+    🔍 Estado de un job: queued / running / succeeded / failed / cancelled.
+    `progress.nodes_completed` lista los nodos del grafo ya terminados.
+    """
+    job = await get_job_queue().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return job
+
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str):
+    """🛑 Cancela un job encolado o en ejecución."""
+    job = await get_job_queue().cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return {"job_id": job_id, "status": job["status"]}
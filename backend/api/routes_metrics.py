@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from backend.core.metrics import REGISTRY
+
+router = APIRouter(tags=["metrics"])
+
+# Content-Type estándar del formato de exposición de Prometheus
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    📈 Métricas del proceso en formato Prometheus:
+    - Tiempo por nodo del orquestador
+    - Llamadas y tokens LLM por task_type
+    - Latencia de $vectorSearch y escaladas de numCandidates
+    - Intentos de reparación del validador
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
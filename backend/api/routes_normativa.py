@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Query
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_mongodb import MongoDBAtlasVectorSearch
+from backend.core.embedding_service import get_embedding_service
 from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
 import os
@@ -10,7 +10,8 @@ load_dotenv()
 router = APIRouter(prefix="/normativa", tags=["normativa"])
 
 # Config embeddings (HuggingFace, gratis, local)
-embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+# (modelo compartido del proceso; embed_query pasa por la caché de embeddings de consultas)
+embeddings = get_embedding_service()
 # embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
 
 # VectorStore conectado a Mongo Atlas
@@ -0,0 +1,245 @@
+"""
+Benchmark offline del pipeline
+------------------------------
+Mide latencia (p50/p95/p99) y throughput del grafo compilado y de la API FastAPI
+a distintos niveles de concurrencia, sin proveedores externos:
+
+✔️ LLM: modelo fake (`LLM_PROVIDER=fake`, latencias vía FAKE_LLM_LATENCY_MS*).
+✔️ Retrieval: retriever offline con contexto fijo y latencia configurable.
+✔️ Persistencia: sink de outputs en memoria (no toca Mongo).
+
+Uso:
+    python -m backend.benchmarks.bench_pipeline --target graph app --concurrency 1 4 16 --requests 64
+    python -m backend.benchmarks.bench_pipeline --json bench_output.json
+
+La API se ejecuta en proceso con httpx.ASGITransport (sin servidor HTTP).
+Importar `backend.main` no carga el modelo de embeddings (servicio compartido
+perezoso), así que el escenario `app` no necesita el modelo en la caché local.
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Any, Awaitable, Callable, Dict, List
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from backend.core.generation_cache import GenerationCache, InMemoryGenerationCacheStore, set_generation_cache
+from backend.core.llm_cache import LLMResponseCache, set_llm_cache
+from backend.agents.orchestrator import (
+    OrchestratorAgents,
+    build_orchestrator,
+    init_orchestrator_runtime,
+    new_run_config,
+    shutdown_orchestrator_runtime,
+)
+
+DEFAULT_CONCURRENCY = [1, 4, 16]
+DEFAULT_REQUESTS = 32
+
+BENCH_REQUEST = {
+    "expediente_id": "EXP-BENCH",
+    "documento": "JN",
+    "seccion": "JN.1",
+    "user_text": "Queremos montar un mercadillo con 15 puestos en la plaza del pueblo.",
+}
+
+OFFLINE_CONTEXT = (
+    "Artículo 10. Los mercadillos municipales requieren autorización previa del Ayuntamiento.\n\n"
+    "Reglamento municipal, sección 3: la ocupación de la vía pública se limitará a la Plaza Mayor."
+)
+
+
+class OfflineRetriever:
+    """Sustituto de RetrieverAgent: devuelve un contexto fijo tras `latency_ms`."""
+
+    def __init__(self, latency_ms: float = None):
+        self.latency_ms = latency_ms if latency_ms is not None else float(os.getenv("FAKE_RETRIEVER_LATENCY_MS", "20"))
+
+    async def warmup(self):
+        return None
+
+    def close(self):
+        return None
+
+    async def ainvoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return {
+            "status": "ok",
+            "query": (inputs or {}).get("user_text", ""),
+            "context": OFFLINE_CONTEXT,
+            "matches": [{"title": "Reglamento de mercadillos", "source": "offline", "page": 1, "score": 0.9}],
+        }
+
+
+class InMemoryOutputSink:
+    """Sustituto de `save_output`: guarda los outputs en una lista."""
+
+    def __init__(self):
+        self.saved: List[Dict[str, Any]] = []
+
+    async def __call__(self, expediente_id, documento, seccion, nodo, data):
+        output_id = f"mem-{len(self.saved) + 1}"
+        self.saved.append({"output_id": output_id, "expediente_id": expediente_id, "seccion": seccion, "nodo": nodo})
+        return output_id
+
+
+def build_offline_agents() -> OrchestratorAgents:
+    """Agentes sin dependencias externas (requiere LLM_PROVIDER=fake al construirlos)."""
+    return OrchestratorAgents(retriever=OfflineRetriever(), output_sink=InMemoryOutputSink())
+
+
+def build_offline_checkpointer(name: str):
+    return None if name == "none" else InMemorySaver()
+
+
+async def _offline_corpus_version() -> str:
+    return "bench"
+
+
+def build_offline_generation_cache(enabled: bool) -> GenerationCache:
+    """Caché de generación en memoria; desactivada por defecto para medir el pipeline completo."""
+    return GenerationCache(InMemoryGenerationCacheStore(), corpus_version_fn=_offline_corpus_version, enabled=enabled)
+
+
+# ============================================================
+#   Estadísticas
+# ============================================================
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil con interpolación lineal (equivalente a numpy.percentile por defecto)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+async def run_load(call: Callable[[], Awaitable[bool]], requests: int, concurrency: int) -> Dict[str, Any]:
+    """
+    Lanza `requests` llamadas con a lo sumo `concurrency` en vuelo.
+    `call` devuelve True si la llamada fue correcta.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    latencies: List[float] = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok = await call()
+            except Exception as e:
+                print(f"⚠️ [bench] Error en la llamada: {type(e).__name__}: {e}")
+                ok = False
+            latencies.append((time.perf_counter() - started) * 1000)
+            if not ok:
+                errors += 1
+
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall_s = time.perf_counter() - wall_started
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "throughput_rps": round(requests / wall_s, 2) if wall_s else 0.0,
+        "wall_s": round(wall_s, 3),
+    }
+
+
+# ============================================================
+#   Escenarios
+# ============================================================
+async def bench_graph(concurrency_levels: List[int], requests: int, checkpointer: str = "memory",
+                      generation_cache: bool = False) -> List[Dict[str, Any]]:
+    """Grafo compilado invocado directamente (sin capa HTTP ni caché de generación)."""
+    graph = build_orchestrator(agents=build_offline_agents(), checkpointer=build_offline_checkpointer(checkpointer))
+
+    async def call() -> bool:
+        final_state = await graph.ainvoke(dict(BENCH_REQUEST), new_run_config())
+        return final_state.get("path_taken") != "rejected"
+
+    await call()  # calentamiento (imports perezosos, primeras conexiones)
+    return [dict(await run_load(call, requests, level), target="graph") for level in concurrency_levels]
+
+
+async def bench_app(concurrency_levels: List[int], requests: int, checkpointer: str = "memory",
+                    generation_cache: bool = False) -> List[Dict[str, Any]]:
+    """API FastAPI en proceso: POST /justificacion/generar_jn_orquestado."""
+    import httpx
+    from backend.main import app
+
+    set_generation_cache(build_offline_generation_cache(generation_cache))
+    await init_orchestrator_runtime(
+        warmup=False,
+        agents=build_offline_agents(),
+        checkpointer=build_offline_checkpointer(checkpointer),
+    )
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def call() -> bool:
+                response = await client.post("/justificacion/generar_jn_orquestado", json=BENCH_REQUEST)
+                return response.status_code == 200 and response.json().get("success", False)
+
+            await call()
+            return [dict(await run_load(call, requests, level), target="app") for level in concurrency_levels]
+    finally:
+        await shutdown_orchestrator_runtime()
+        set_generation_cache(None)
+
+
+SCENARIOS = {"graph": bench_graph, "app": bench_app}
+
+
+def format_table(rows: List[Dict[str, Any]]) -> str:
+    columns = ["target", "concurrency", "requests", "errors", "p50_ms", "p95_ms", "p99_ms", "mean_ms", "throughput_rps"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+    lines = ["  ".join(c.rjust(widths[c]) for c in columns)]
+    for row in rows:
+        lines.append("  ".join(str(row[c]).rjust(widths[c]) for c in columns))
+    return "\n".join(lines)
+
+
+async def main(targets: List[str], concurrency_levels: List[int], requests: int, checkpointer: str,
+               generation_cache: bool = False, llm_cache: bool = False) -> List[Dict[str, Any]]:
+    # Caché de respuestas LLM solo en memoria; desactivada por defecto (las peticiones son idénticas)
+    set_llm_cache(LLMResponseCache(enabled=llm_cache))
+    rows: List[Dict[str, Any]] = []
+    for target in targets:
+        print(f"\n🔹 Benchmark '{target}' (concurrencia={concurrency_levels}, requests={requests})")
+        rows.extend(await SCENARIOS[target](concurrency_levels, requests, checkpointer, generation_cache))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline del pipeline Mini-CELIA")
+    parser.add_argument("--target", nargs="+", choices=sorted(SCENARIOS), default=["graph", "app"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="Llamadas por nivel de concurrencia")
+    parser.add_argument("--checkpointer", choices=["memory", "none"], default="memory")
+    parser.add_argument("--generation-cache", action="store_true", help="Activa la caché de generación (escenario app)")
+    parser.add_argument("--llm-cache", action="store_true", help="Activa la caché de respuestas LLM en memoria")
+    parser.add_argument("--json", dest="json_path", help="Ruta donde guardar los resultados en JSON")
+    args = parser.parse_args()
+
+    # El modo offline debe fijarse antes de construir los agentes
+    os.environ["LLM_PROVIDER"] = "fake"
+
+    results = asyncio.run(main(args.target, args.concurrency, args.requests, args.checkpointer, args.generation_cache, args.llm_cache))
+    print("\n" + format_table(results))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Resultados guardados en {args.json_path}")
@@ -0,0 +1,219 @@
+"""
+Context Packer
+--------------
+Empaqueta el contexto RAG del RetrieverAgent con un presupuesto de tokens.
+
+✔️ Maximal marginal relevance (MMR) con los embeddings que ya devuelve la búsqueda vectorial:
+   entre chunks casi idénticos solo entra uno.
+✔️ Fusiona chunks contiguos del mismo documento y página (el splitter de la ingesta solapa
+   `chunk_overlap=50` caracteres): el texto compartido se paga una sola vez.
+✔️ Llena un presupuesto de tokens (CONTEXT_TOKEN_BUDGET) en lugar de MAX_CONTEXT_CHARS.
+✔️ Informa de los tokens ahorrados frente a concatenar los mismos chunks tal cual; el contexto
+   va a los prompts del refinador, GeneratorA y GeneratorB, así que el ahorro se multiplica.
+
+Uso:
+    selected, context, unused, report = pack_context(results, limit=5, min_chars=500)
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.core.metrics import RETRIEVER_CONTEXT_TOKENS
+from backend.core.token_budget import count_tokens, truncate_to_tokens
+
+# --- Config (tuneable vía .env) ---
+# mmr → este empaquetador; chars → selección por caracteres (MAX_CONTEXT_CHARS) de antes
+CONTEXT_PACKER = os.getenv("CONTEXT_PACKER", "mmr").lower()
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+# Peso de la relevancia frente a la diversidad (1 = solo relevancia)
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Coseno a partir del cual un chunk se considera duplicado de uno ya elegido
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95"))
+# Solape (caracteres) entre el final de un chunk y el principio del siguiente para fusionarlos
+CONTEXT_MERGE_MIN_OVERLAP = int(os.getenv("CONTEXT_MERGE_MIN_OVERLAP", "20"))
+CONTEXT_MERGE_MAX_OVERLAP = int(os.getenv("CONTEXT_MERGE_MAX_OVERLAP", "120"))
+# Hueco mínimo para incluir un último chunk recortado
+CONTEXT_MIN_TAIL_TOKENS = int(os.getenv("CONTEXT_MIN_TAIL_TOKENS", "32"))
+
+SEPARATOR = "\n\n"
+
+
+def text_overlap(a: str, b: str, min_chars: int = CONTEXT_MERGE_MIN_OVERLAP,
+                 max_chars: int = CONTEXT_MERGE_MAX_OVERLAP) -> int:
+    """Longitud del mayor sufijo de `a` que es prefijo de `b` (0 si no llega a `min_chars`)."""
+    for k in range(min(max_chars, len(a), len(b)), min_chars - 1, -1):
+        if a.endswith(b[:k]):
+            return k
+    return 0
+
+
+def _relevance(candidates: List[Dict[str, Any]]) -> np.ndarray:
+    """Relevancia en [0, 1]: score del rerank si lo hay, si no el de la búsqueda; posición como respaldo."""
+    key = "rerank_score" if all("rerank_score" in c for c in candidates) else "score"
+    n = len(candidates)
+    raw = [c.get(key) for c in candidates]
+    if any(s is None for s in raw):
+        return np.linspace(1.0, 0.0, n) if n > 1 else np.ones(n)
+    scores = np.asarray(raw, dtype=np.float32)
+    span = float(scores.max() - scores.min())
+    return (scores - scores.min()) / span if span > 0 else np.ones(n, dtype=np.float32)
+
+
+def _similarity(candidates: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """Matriz de cosenos entre candidatos (NaN donde falta el embedding)."""
+    dims = {len(c["embedding"]) for c in candidates if c.get("embedding") is not None}
+    if len(dims) != 1:
+        return None
+    dim = dims.pop()
+    vectors = np.full((len(candidates), dim), np.nan, dtype=np.float32)
+    for i, c in enumerate(candidates):
+        if c.get("embedding") is not None:
+            v = np.asarray(c["embedding"], dtype=np.float32)
+            vectors[i] = v / max(float(np.linalg.norm(v)), 1e-12)
+    return vectors @ vectors.T
+
+
+class _Segment:
+    """Bloque del contexto: uno o varios chunks contiguos del mismo documento y página."""
+
+    __slots__ = ("text", "key", "tokens")
+
+    def __init__(self, text: str, key):
+        self.text = text
+        self.key = key
+        self.tokens = count_tokens(text)
+
+
+def _merge(segment: _Segment, text: str) -> Optional[str]:
+    """Texto del segmento con `text` fusionado si son contiguos (en cualquier orden)."""
+    k = text_overlap(segment.text, text)
+    if k:
+        return segment.text + text[k:]
+    k = text_overlap(text, segment.text)
+    if k:
+        return text + segment.text[k:]
+    if text in segment.text:
+        return segment.text
+    return None
+
+
+def pack_context(
+    results: List[Dict[str, Any]],
+    limit: int,
+    min_chars: int = 0,
+    budget_tokens: int = CONTEXT_TOKEN_BUDGET,
+    mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+    dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+) -> Tuple[List[Dict[str, Any]], str, int, Dict[str, Any]]:
+    """
+    Selecciona chunks por MMR sobre los resultados sobre-capturados (ordenados por relevancia)
+    y los empaqueta hasta `budget_tokens`.
+    Como `select_context`: toma `limit` chunks y, si el contexto no llega a `min_chars`, sigue
+    con los siguientes. Devuelve (seleccionados, contexto, no usados por falta de presupuesto, informe).
+    """
+    candidates, seen = [], set()
+    for r in results:
+        t = (r.get("text") or "").strip()
+        if t and t not in seen:
+            seen.add(t)
+            candidates.append((r, t))
+
+    report: Dict[str, Any] = {
+        "strategy": "mmr", "budget_tokens": budget_tokens, "candidates": len(candidates),
+        "near_duplicates": 0, "merged": 0, "truncated": False,
+    }
+    relevance = _relevance([r for r, _ in candidates]) if candidates else np.zeros(0)
+    similarity = _similarity([r for r, _ in candidates]) if candidates else None
+
+    selected: List[Dict[str, Any]] = []
+    segments: List[_Segment] = []
+    picked: List[int] = []
+    remaining = list(range(len(candidates)))
+    raw_texts: List[str] = []
+    used_tokens = 0
+    out_of_budget = False
+
+    while remaining:
+        context_chars = sum(len(s.text) for s in segments) + len(SEPARATOR) * max(0, len(segments) - 1)
+        if len(selected) >= limit and context_chars >= min_chars:
+            break
+
+        # --- MMR: relevancia menos el parecido con lo ya elegido ---
+        best, best_value, best_redundancy = None, None, 0.0
+        for i in remaining:
+            redundancy = 0.0
+            if similarity is not None and picked:
+                sims = similarity[i, picked]
+                sims = sims[~np.isnan(sims)]
+                redundancy = float(sims.max()) if len(sims) else 0.0
+            value = mmr_lambda * float(relevance[i]) - (1 - mmr_lambda) * redundancy
+            if best_value is None or value > best_value:
+                best, best_value, best_redundancy = i, value, redundancy
+        remaining.remove(best)
+        r, text = candidates[best]
+
+        if best_redundancy >= dedup_threshold:
+            report["near_duplicates"] += 1
+            raw_texts.append(text)
+            continue
+
+        # --- Fusión con un chunk contiguo del mismo documento y página ---
+        key = (r.get("source"), r.get("page"))
+        target, merged_text = None, None
+        if key[0] is not None:
+            for segment in segments:
+                if segment.key == key:
+                    merged_text = _merge(segment, text)
+                    if merged_text is not None:
+                        target = segment
+                        break
+
+        if target is not None:
+            cost = count_tokens(merged_text) - target.tokens
+            if used_tokens + cost > budget_tokens:
+                out_of_budget = True
+                break
+            used_tokens += cost
+            target.text, target.tokens = merged_text, target.tokens + cost
+            report["merged"] += 1
+        else:
+            separator = count_tokens(SEPARATOR) if segments else 0
+            segment = _Segment(text, key)
+            if used_tokens + separator + segment.tokens > budget_tokens:
+                room = budget_tokens - used_tokens - separator
+                if room >= CONTEXT_MIN_TAIL_TOKENS:
+                    segment = _Segment(truncate_to_tokens(text, room), key)
+                    segments.append(segment)
+                    selected.append(r)
+                    picked.append(best)
+                    raw_texts.append(segment.text)  # el recorte no cuenta como ahorro
+                    report["truncated"] = True
+                out_of_budget = True
+                break
+            used_tokens += separator + segment.tokens
+            segments.append(segment)
+
+        selected.append(r)
+        picked.append(best)
+        raw_texts.append(text)
+
+    context = SEPARATOR.join(s.text for s in segments)
+    unused = 0
+    if out_of_budget:
+        unused = max(0, min(limit, len(candidates) - report["near_duplicates"]) - len(selected))
+
+    # Ahorro frente a concatenar tal cual los mismos chunks (incluidos los duplicados descartados)
+    tokens = count_tokens(context)
+    tokens_raw = count_tokens(SEPARATOR.join(raw_texts))
+    report.update({
+        "selected": len(selected),
+        "segments": len(segments),
+        "tokens": tokens,
+        "tokens_raw": tokens_raw,
+        "tokens_saved": max(0, tokens_raw - tokens),
+    })
+    RETRIEVER_CONTEXT_TOKENS.inc(tokens, kind="packed")
+    RETRIEVER_CONTEXT_TOKENS.inc(report["tokens_saved"], kind="saved")
+    return selected, context, unused, report
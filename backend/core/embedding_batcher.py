@@ -0,0 +1,144 @@
+"""
+Embedding Batcher
+-----------------
+Codificación de consultas con SentenceTransformer fuera del event loop.
+
+✔️ Un hilo dedicado hace todas las inferencias: el event loop nunca ejecuta `encode`.
+✔️ Micro-batching: las consultas que llegan en una ventana de EMBED_BATCH_MAX_WAIT_MS
+   se agrupan en una sola llamada `encode` (hasta EMBED_BATCH_SIZE textos).
+✔️ Hilos de torch configurables (EMBED_TORCH_THREADS) para no competir con uvicorn.
+✔️ Sirve a corutinas de cualquier event loop y a llamadas síncronas.
+✔️ Tamaño de lote, espera en cola y duración de `encode` en /metrics.
+
+Uso:
+    batcher = EmbeddingBatcher(SentenceTransformer(MODEL_NAME))
+    vector = await batcher.encode("texto de la consulta")
+"""
+
+import os
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, List, Optional
+
+from backend.core.metrics import EMBEDDING_BATCH_SIZE, EMBEDDING_QUEUE_WAIT, EMBEDDING_ENCODE_DURATION
+
+# --- Config (tuneable vía .env) ---
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+# 0 = no tocar la configuración de torch
+EMBED_TORCH_THREADS = int(os.getenv("EMBED_TORCH_THREADS", "0"))
+
+_STOP = object()
+
+
+class _Request:
+    __slots__ = ("text", "future", "enqueued")
+
+    def __init__(self, text: str, future: Future):
+        self.text = text
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    """
+    Cola de consultas atendida por un único hilo que agrupa y codifica por lotes.
+    El hilo arranca con la primera petición y se detiene con `close()`.
+    """
+
+    def __init__(self, model, batch_size: int = None, max_wait_ms: float = None,
+                 torch_threads: int = None, name: str = "embed"):
+        self.model = model
+        self.batch_size = max(1, batch_size or EMBED_BATCH_SIZE)
+        self.max_wait_ms = EMBED_BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+        self.torch_threads = EMBED_TORCH_THREADS if torch_threads is None else torch_threads
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # ---------------- API ----------------
+    async def encode(self, text: str) -> List[float]:
+        """Embedding de `text` sin bloquear el event loop."""
+        return await asyncio.wrap_future(self._submit(text))
+
+    def encode_sync(self, text: str, timeout: Optional[float] = None) -> List[float]:
+        """Embedding de `text` desde código síncrono (comparte lotes con las corutinas)."""
+        return self._submit(text).result(timeout=timeout)
+
+    def close(self) -> None:
+        """Detiene el hilo tras atender lo ya encolado."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout=5)
+
+    # ---------------- Interno ----------------
+    def _submit(self, text: str) -> Future:
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put(_Request(text, future))
+        return future
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-batcher", daemon=True)
+                self._thread.start()
+
+    def _configure_torch(self) -> None:
+        if self.torch_threads <= 0:
+            return
+        try:
+            import torch
+            torch.set_num_threads(self.torch_threads)
+        except Exception as e:
+            print(f"⚠️ [EmbeddingBatcher] No se pudo fijar EMBED_TORCH_THREADS={self.torch_threads}: {e}")
+
+    def _collect(self, first: _Request) -> List[Any]:
+        """Agrupa las peticiones que llegan durante la ventana de espera (hasta batch_size)."""
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _run(self) -> None:
+        self._configure_torch()
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            stop = batch[-1] is _STOP
+            requests = [r for r in batch if r is not _STOP and r.future.set_running_or_notify_cancel()]
+            if requests:
+                self._encode_batch(requests)
+            if stop:
+                return
+
+    def _encode_batch(self, requests: List[_Request]) -> None:
+        started = time.perf_counter()
+        for r in requests:
+            EMBEDDING_QUEUE_WAIT.observe(started - r.enqueued, model=self.name)
+        EMBEDDING_BATCH_SIZE.observe(len(requests), model=self.name)
+        try:
+            with EMBEDDING_ENCODE_DURATION.time(model=self.name):
+                vectors = self.model.encode([r.text for r in requests])
+        except Exception as e:
+            for r in requests:
+                r.future.set_exception(e)
+            return
+        for r, vector in zip(requests, vectors):
+            r.future.set_result(vector.tolist() if hasattr(vector, "tolist") else list(vector))
@@ -0,0 +1,187 @@
+"""
+Query Embedding Cache
+---------------------
+Caché LRU de embeddings de consultas, compartida por el RetrieverAgent y /normativa/search.
+
+✔️ Clave = (modelo, texto normalizado): NFC, espacios colapsados y sin espacios en los extremos.
+✔️ LRU acotado en memoria (QUERY_EMBEDDING_CACHE_ENTRIES); seguro entre hilos.
+✔️ Aciertos/fallos por modelo y tamaño de la caché en /metrics.
+✔️ Persistencia opcional en disco (QUERY_EMBEDDING_CACHE_PATH, .npz): se carga al crear
+   la caché y se guarda al apagar la aplicación.
+"""
+
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.core.metrics import QUERY_EMBEDDING_CACHE_LOOKUPS, QUERY_EMBEDDING_CACHE_SIZE
+
+# --- Config (tuneable vía .env) ---
+QUERY_EMBEDDING_CACHE_ENABLED = os.getenv("QUERY_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+QUERY_EMBEDDING_CACHE_ENTRIES = int(os.getenv("QUERY_EMBEDDING_CACHE_ENTRIES", "4096"))
+# Vacío = solo en memoria
+QUERY_EMBEDDING_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH", "")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Forma canónica de la consulta (el tokenizador ignora estas diferencias)."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+def canonical_model_name(model: str) -> str:
+    """'sentence-transformers/all-MiniLM-L6-v2' y 'all-MiniLM-L6-v2' son el mismo modelo."""
+    return (model or "").removeprefix("sentence-transformers/")
+
+
+class QueryEmbeddingCache:
+    """LRU de vectores por (modelo, consulta normalizada)."""
+
+    def __init__(self, max_entries: int = QUERY_EMBEDDING_CACHE_ENTRIES, path: str = QUERY_EMBEDDING_CACHE_PATH,
+                 enabled: bool = True):
+        self.max_entries = max(1, max_entries)
+        self.path = path or None
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        if self.path:
+            self.load()
+
+    @staticmethod
+    def key(text: str, model: str) -> Tuple[str, str]:
+        return canonical_model_name(model), normalize_query(text)
+
+    def get(self, text: str, model: str) -> Optional[List[float]]:
+        if not self.enabled:
+            return None
+        key = self.key(text, model)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        QUERY_EMBEDDING_CACHE_LOOKUPS.inc(model=key[0], result="hit" if vector is not None else "miss")
+        return vector
+
+    def put(self, text: str, model: str, vector: List[float]) -> None:
+        if not self.enabled:
+            return
+        key = self.key(text, model)
+        with self._lock:
+            self._entries[key] = list(vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            size = len(self._entries)
+        QUERY_EMBEDDING_CACHE_SIZE.set(size)
+
+    async def aget_or_compute(self, text: str, model: str,
+                              compute: Callable[[str], Awaitable[List[float]]]) -> List[float]:
+        """Vector cacheado o calculado con `compute(texto_normalizado)` y guardado."""
+        vector = self.get(text, model)
+        if vector is None:
+            normalized = normalize_query(text)
+            vector = await compute(normalized)
+            self.put(normalized, model, vector)
+        return vector
+
+    def get_or_compute(self, text: str, model: str, compute: Callable[[str], List[float]]) -> List[float]:
+        vector = self.get(text, model)
+        if vector is None:
+            normalized = normalize_query(text)
+            vector = compute(normalized)
+            self.put(normalized, model, vector)
+        return vector
+
+    def stats(self) -> Dict[str, float]:
+        """Tamaño y tasa de aciertos acumulada de esta caché."""
+        lookups = self.hits + self.misses
+        return {"entries": len(self), "hits": self.hits, "lookups": lookups,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---------------- Persistencia ----------------
+    def load(self) -> int:
+        """Carga el volcado de disco (si existe); devuelve las entradas cargadas."""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                models, texts, vectors = data["models"], data["texts"], data["vectors"]
+                with self._lock:
+                    for model, text, vector in zip(models, texts, vectors):
+                        self._entries[(str(model), str(text))] = vector.tolist()
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        except Exception as e:
+            print(f"⚠️ [EmbeddingCache] No se pudo cargar {self.path}: {e}")
+            return 0
+        QUERY_EMBEDDING_CACHE_SIZE.set(len(self._entries))
+        print(f"[EmbeddingCache] {len(self._entries)} embeddings cargados de {self.path}")
+        return len(self._entries)
+
+    def save(self) -> bool:
+        """Vuelca la caché a disco (escritura atómica). Solo si hay cambios."""
+        if not self.path or not self._dirty:
+            return False
+        with self._lock:
+            items = list(self._entries.items())
+            self._dirty = False
+        if not items:
+            return False
+        # Los vectores de distintos modelos pueden tener otra dimensión: se guarda solo la mayoritaria
+        dims = [len(v) for _, v in items]
+        dim = max(set(dims), key=dims.count)
+        items = [(k, v) for k, v in items if len(v) == dim]
+        tmp = f"{self.path}.tmp.npz"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            np.savez(
+                tmp,
+                models=np.array([k[0] for k, _ in items]),
+                texts=np.array([k[1] for k, _ in items]),
+                vectors=np.array([v for _, v in items], dtype=np.float32),
+            )
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"⚠️ [EmbeddingCache] No se pudo guardar {self.path}: {e}")
+            return False
+        return True
+
+
+# ============================================================
+#   Runtime de proceso
+# ============================================================
+_query_embedding_cache: Optional[QueryEmbeddingCache] = None
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    global _query_embedding_cache
+    if _query_embedding_cache is None:
+        _query_embedding_cache = QueryEmbeddingCache(enabled=QUERY_EMBEDDING_CACHE_ENABLED)
+    return _query_embedding_cache
+
+
+def set_query_embedding_cache(cache: Optional[QueryEmbeddingCache]) -> None:
+    """Sustituye la caché del proceso (tests y benchmarks)."""
+    global _query_embedding_cache
+    _query_embedding_cache = cache
+
+
+def save_query_embedding_cache() -> bool:
+    """Persiste la caché del proceso si tiene ruta configurada (apagado de la aplicación)."""
+    return _query_embedding_cache.save() if _query_embedding_cache is not None else False
@@ -0,0 +1,142 @@
+"""
+Embedding Service
+-----------------
+Un único modelo de embeddings por proceso para el RetrieverAgent, las rutas
+(/normativa/search, /justificacion/generar_jn) y la ingesta.
+
+✔️ Una sola instancia de SentenceTransformer (EMBEDDING_MODEL) en lugar de una por módulo.
+✔️ Carga perezosa o al arrancar (EMBEDDING_LOAD=lazy|startup): importar la app no carga
+   torch ni el modelo.
+✔️ `encode` por lotes, `aencode` asíncrono con micro-batching (EmbeddingBatcher) y
+   `aencode_batch` en un hilo.
+✔️ Es un `Embeddings` de LangChain: los MongoDBAtlasVectorSearch lo usan directamente y
+   `embed_query` pasa por la caché de embeddings de consultas.
+
+Uso:
+    service = get_embedding_service()
+    vector = await service.aencode("texto de la consulta")
+"""
+
+import asyncio
+import os
+import threading
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from backend.core.embedding_batcher import EMBED_BATCH_SIZE, EmbeddingBatcher
+from backend.core.embedding_cache import get_query_embedding_cache
+
+# --- Config (tuneable vía .env) ---
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")  # 'cuda' si hay GPU
+# startup → se carga en el lifespan de la app; lazy → con la primera consulta
+EMBEDDING_LOAD = os.getenv("EMBEDDING_LOAD", "startup").lower()
+# Cache local para modelos (evita timeouts de HuggingFace)
+LOCAL_CACHE_DIR = os.getenv("SENTENCE_TRANSFORMERS_HOME", "./models_cache")
+
+
+class EmbeddingService(Embeddings):
+    """Modelo de embeddings compartido; se carga una vez, en el primer uso o con `load()`."""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, model=None, device: str = EMBEDDING_DEVICE,
+                 batch_size: int = EMBED_BATCH_SIZE):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self._model = model
+        self._load_lock = threading.Lock()
+        # Las consultas individuales se agrupan en un hilo dedicado (carga el modelo allí si hace falta)
+        self.batcher = EmbeddingBatcher(self, name=model_name)
+
+    # ---------------- Modelo ----------------
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        """Carga el SentenceTransformer (una sola vez por proceso)."""
+        if self._model is not None:
+            return self._model
+        with self._load_lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+
+                os.makedirs(LOCAL_CACHE_DIR, exist_ok=True)
+                try:
+                    self._model = SentenceTransformer(self.model_name, cache_folder=LOCAL_CACHE_DIR, device=self.device)
+                except Exception as e:
+                    print(f"⚠️ Error cargando modelo desde HuggingFace: {e}")
+                    print(f"💡 Tip: Descarga el modelo manualmente en {LOCAL_CACHE_DIR} o usa OpenAI embeddings")
+                    raise
+                print(f"[Embeddings] Modelo cargado: {self.model_name} ({self.device}, cache {LOCAL_CACHE_DIR})")
+        return self._model
+
+    async def aload(self) -> None:
+        """Carga el modelo sin bloquear el event loop (lifespan)."""
+        await asyncio.to_thread(self.load)
+
+    # ---------------- Codificación ----------------
+    def encode(self, texts: List[str]):
+        """Embeddings de `texts` en una llamada por lotes (interfaz de SentenceTransformer.encode)."""
+        return self.load().encode(texts, batch_size=self.batch_size, show_progress_bar=False)
+
+    async def aencode(self, text: str) -> List[float]:
+        """Embedding de una consulta sin bloquear el event loop (micro-batching con otras consultas)."""
+        return await self.batcher.encode(text)
+
+    async def aencode_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings de varios textos en un hilo."""
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    # ---------------- LangChain Embeddings ----------------
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Igual que HuggingFaceEmbeddings (con el que se vectorizó el corpus): sin saltos de línea
+        vectors = self.encode([t.replace("\n", " ") for t in texts])
+        return [v.tolist() if hasattr(v, "tolist") else list(v) for v in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return get_query_embedding_cache().get_or_compute(text, self.model_name, self.batcher.encode_sync)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.aencode_batch(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await get_query_embedding_cache().aget_or_compute(text, self.model_name, self.aencode)
+
+    def close(self) -> None:
+        """Detiene el hilo de micro-batching (el modelo se mantiene cargado)."""
+        self.batcher.close()
+
+
+# ============================================================
+#   Runtime de proceso
+# ============================================================
+_embedding_service: Optional[EmbeddingService] = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Servicio compartido del proceso (se crea sin cargar el modelo)."""
+    global _embedding_service
+    if _embedding_service is None:
+        _embedding_service = EmbeddingService()
+    return _embedding_service
+
+
+def set_embedding_service(service: Optional[EmbeddingService]) -> None:
+    """Sustituye el servicio del proceso (tests y benchmarks)."""
+    global _embedding_service
+    _embedding_service = service
+
+
+async def init_embedding_service(load: bool = EMBEDDING_LOAD == "startup") -> EmbeddingService:
+    """Lifespan: crea el servicio y, con EMBEDDING_LOAD=startup, carga el modelo al arrancar."""
+    service = get_embedding_service()
+    if load:
+        await service.aload()
+    return service
+
+
+def shutdown_embedding_service() -> None:
+    if _embedding_service is not None:
+        _embedding_service.close()
@@ -0,0 +1,176 @@
+"""
+Fake LLM (modo offline)
+-----------------------
+Modelo de chat determinista para ejecutar el pipeline sin proveedores reales.
+Se activa con `LLM_PROVIDER=fake` (ver `get_llm`).
+
+✔️ Respuestas enlatadas por `task_type` (JSON_A, reparación, narrativa, refinador).
+✔️ Latencia configurable (+ jitter reproducible con semilla) para benchmarks.
+✔️ Soporta ainvoke / invoke / astream y rellena `usage_metadata` (métricas de tokens).
+✔️ `with_structured_output`: parsea la respuesta enlatada como JSON (salida estructurada offline).
+
+Variables de entorno:
+    FAKE_LLM_LATENCY_MS            latencia base por llamada (default 50)
+    FAKE_LLM_LATENCY_MS_<TASK>     latencia específica, p.ej. FAKE_LLM_LATENCY_MS_JSON_B=400
+    FAKE_LLM_JITTER_MS             jitter uniforme ±ms (default 0)
+    FAKE_LLM_SEED                  semilla del jitter (default 0)
+    FAKE_LLM_RESPONSES_FILE        JSON {"task_type": "respuesta"} que sustituye las respuestas por defecto
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+from typing import Any, Dict, Iterator, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FAKE_MODEL_NAME = "fake-celia"
+
+# --- Respuestas por defecto (coherentes entre sí para que ValidatorB apruebe) ---
+_FAKE_SECCIONES_JN = {
+    "objeto": "Instalación de un mercadillo municipal con 15 puestos",
+    "alcance": "Montaje, gestión y desmontaje de los puestos durante la temporada",
+    "ambito": "Plaza Mayor del municipio",
+}
+
+DEFAULT_RESPONSES: Dict[str, str] = {
+    "json_a": json.dumps({"secciones_JN": _FAKE_SECCIONES_JN}, ensure_ascii=False),
+    "json_repair": json.dumps({"secciones_JN": _FAKE_SECCIONES_JN}, ensure_ascii=False),
+    "json_b": (
+        f"El objeto del contrato es la {_FAKE_SECCIONES_JN['objeto'].lower()}. "
+        f"El alcance comprende {_FAKE_SECCIONES_JN['alcance'].lower()}. "
+        f"El ámbito de aplicación es la {_FAKE_SECCIONES_JN['ambito']}, "
+        "conforme a la normativa municipal vigente."
+    ),
+    "prompt_refiner": (
+        "Extrae el objeto, el alcance y el ámbito del contrato a partir del texto del usuario "
+        "y del contexto normativo, sin inventar datos."
+    ),
+    "generic": "Respuesta simulada del modelo fake.",
+}
+
+
+def _load_responses() -> Dict[str, str]:
+    responses = dict(DEFAULT_RESPONSES)
+    path = os.getenv("FAKE_LLM_RESPONSES_FILE")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+        for task_type, value in overrides.items():
+            responses[task_type] = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return responses
+
+
+def _latency_ms(task_type: str) -> float:
+    specific = os.getenv(f"FAKE_LLM_LATENCY_MS_{task_type.upper()}")
+    return float(specific if specific is not None else os.getenv("FAKE_LLM_LATENCY_MS", "50"))
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model determinista: devuelve la respuesta enlatada de su `task_type`."""
+
+    model_name: str = FAKE_MODEL_NAME
+    task_type: str = "generic"
+    latency_ms: float = 50.0
+    jitter_ms: float = 0.0
+    responses: Dict[str, str] = {}
+    stream_chunk_chars: int = 16
+    rng: Any = None
+
+    @classmethod
+    def from_env(cls, task_type: str = "generic", **kwargs) -> "FakeChatModel":
+        return cls(
+            task_type=task_type,
+            latency_ms=_latency_ms(task_type),
+            jitter_ms=float(os.getenv("FAKE_LLM_JITTER_MS", "0")),
+            responses=_load_responses(),
+            rng=random.Random(int(os.getenv("FAKE_LLM_SEED", "0"))),
+            **kwargs,
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-celia"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "task_type": self.task_type}
+
+    # ---------------- helpers ----------------
+    def _response_text(self) -> str:
+        responses = self.responses or DEFAULT_RESPONSES
+        return responses.get(self.task_type, responses.get("generic", DEFAULT_RESPONSES["generic"]))
+
+    def _delay_seconds(self) -> float:
+        delay = self.latency_ms
+        if self.jitter_ms:
+            delay += (self.rng or random).uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, delay) / 1000
+
+    def _result(self, messages: List[BaseMessage], text: str) -> ChatResult:
+        prompt_tokens = sum(_approx_tokens(str(m.content)) for m in messages)
+        completion_tokens = _approx_tokens(text)
+        message = AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            response_metadata={"model_name": self.model_name},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, text: str) -> List[str]:
+        size = max(1, self.stream_chunk_chars)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def with_structured_output(self, schema, **kwargs):
+        """Las respuestas enlatadas ya cumplen el esquema: basta con parsearlas."""
+        return self | JsonOutputParser()
+
+    # ---------------- BaseChatModel ----------------
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._delay_seconds())
+        return self._result(messages, self._response_text())
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._delay_seconds())
+        return self._result(messages, self._response_text())
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        chunks = self._chunks(self._response_text())
+        step = self._delay_seconds() / max(len(chunks), 1)
+        for piece in chunks:
+            time.sleep(step)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        text = self._response_text()
+        chunks = self._chunks(text)
+        # La latencia total se reparte entre los fragmentos (simula time-to-first-token + ritmo de salida)
+        step = self._delay_seconds() / max(len(chunks), 1)
+        prompt_tokens = sum(_approx_tokens(str(m.content)) for m in messages)
+        for i, piece in enumerate(chunks):
+            await asyncio.sleep(step)
+            usage = None
+            if i == len(chunks) - 1:
+                completion_tokens = _approx_tokens(text)
+                usage = {
+                    "input_tokens": prompt_tokens,
+                    "output_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
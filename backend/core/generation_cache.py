@@ -0,0 +1,292 @@
+"""
+Generation Cache
+----------------
+Caché direccionada por contenido delante del orquestador.
+
+✔️ Clave = sha256 canónico de (expediente_id, documento, seccion, user_text normalizado)
+   + opciones que cambian la salida (retrieval_mode, rerank, hedge_llm, contexto precargado)
+   + versión de prompts, esquemas, modelo y corpus normativo.
+✔️ En un acierto se devuelven JSON_A / JSON_B desde el ledger `outputs` (sin rehacer el grafo).
+✔️ `force_regenerate` omite la consulta y sobrescribe la entrada con el nuevo resultado.
+✔️ Cambiar prompts, esquemas, modelo o ingerir normativa cambia la clave → invalidación automática.
+
+Solo se guardan ejecuciones completadas con JSON_B validado.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from bson import ObjectId
+
+from backend.core.logic_jn import sha256_hex
+from backend.core.metrics import GENERATION_CACHE_LOOKUPS
+from backend.database.mongo import get_collection
+from backend.database.corpus_repository import get_corpus_version
+from backend.prompts.jn_prompts import prompt_a_template, prompt_b_template, PROMPT_PARSER_SLOTS_JN
+from backend.agents.schemas.json_schemas import BinderSchemas
+from backend.models.schemas_jn import OutputJsonA
+
+# --- Config (tuneable vía .env) ---
+GENERATION_CACHE_ENABLED = os.getenv("GENERATION_CACHE_ENABLED", "true").lower() == "true"
+GENERATION_CACHE_BACKEND = os.getenv("GENERATION_CACHE_BACKEND", "mongo").lower()  # mongo | memory
+GENERATION_CACHE_TTL_SECONDS = int(os.getenv("GENERATION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Sal manual: subirla invalida todas las entradas (p.ej. tras cambiar el prompt embebido en GeneratorA)
+GENERATION_CACHE_VERSION = os.getenv("GENERATION_CACHE_VERSION", "1")
+
+CACHEABLE_PATHS = ("completed", "completed_after_retry")
+
+
+def _template_texts(template) -> list:
+    return [getattr(getattr(m, "prompt", None), "template", str(m)) for m in template.messages]
+
+
+# Versiones derivadas del contenido: cambian solas al editar prompts o esquemas
+PROMPT_VERSION = sha256_hex({
+    "prompt_a": _template_texts(prompt_a_template),
+    "prompt_b": _template_texts(prompt_b_template),
+    "slots": PROMPT_PARSER_SLOTS_JN,
+})[:16]
+SCHEMA_VERSION = sha256_hex({
+    "json_a": BinderSchemas.JSON_A_SCHEMA,
+    "json_b": BinderSchemas.JSON_B_SCHEMA,
+    "sections": BinderSchemas.SECTION_SCHEMAS,
+    "output_json_a": OutputJsonA.model_json_schema(),
+})[:16]
+
+
+def model_version() -> str:
+    """Proveedor y modelos configurados (una respuesta de otro modelo no es un acierto)."""
+    return ":".join([
+        os.getenv("LLM_PROVIDER", "openai").lower(),
+        os.getenv("OPENAI_MODEL", "gpt-5"),
+        os.getenv("GROQ_MODEL", ""),
+    ])
+
+
+def normalize_user_text(text: str) -> str:
+    """Colapsa espacios para que reenvíos con diferencias triviales compartan clave."""
+    return " ".join((text or "").split())
+
+
+def generation_options(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Opciones por petición que cambian la salida. Con contexto precargado (lotes)
+    se incluye el texto con el que se recuperó, que puede diferir del de la sección.
+    """
+    options = {
+        "retrieval_mode": state.get("retrieval_mode"),
+        "rerank": state.get("rerank"),
+        "hedge_llm": state.get("hedge_llm"),
+        "rag_prefetched": bool(state.get("rag_prefetched")),
+    }
+    if options["rag_prefetched"]:
+        options["rag_query"] = normalize_user_text(state.get("rag_query", ""))
+    return options
+
+
+def generation_key(expediente_id: str, documento: str, seccion: str, user_text: str, corpus_version: str,
+                   options: Optional[Dict[str, Any]] = None) -> str:
+    return sha256_hex({
+        "inputs": {
+            "expediente_id": expediente_id,
+            "documento": documento,
+            "seccion": seccion,
+            "user_text": normalize_user_text(user_text),
+        },
+        "options": options or generation_options({}),
+        "prompt_version": PROMPT_VERSION,
+        "schema_version": SCHEMA_VERSION,
+        "model_version": model_version(),
+        "corpus_version": corpus_version,
+        "cache_version": GENERATION_CACHE_VERSION,
+    })
+
+
+def _entry_from_state(key: str, state: Dict[str, Any], corpus_version: str) -> Dict[str, Any]:
+    return {
+        "key": key,
+        "expediente_id": state.get("expediente_id"),
+        "documento": state.get("documento"),
+        "seccion": state.get("seccion"),
+        "output_ids": dict(state.get("output_ids") or {}),
+        "path_taken": state.get("path_taken"),
+        "validation_b_result": state.get("validation_b_result"),
+        "corpus_version": corpus_version,
+        "created_at": datetime.utcnow(),
+    }
+
+
+# ============================================================
+#   Stores
+# ============================================================
+class MongoGenerationCacheStore:
+    """
+    Índice `generation_cache` (clave → ids en `outputs`). El contenido se lee
+    siempre del ledger `outputs`, que sigue siendo la fuente de verdad.
+    """
+
+    def __init__(self, collection_name: str = "generation_cache", outputs_collection: str = "outputs",
+                 ttl_seconds: int = GENERATION_CACHE_TTL_SECONDS):
+        self.collection = get_collection(collection_name)
+        self.outputs = get_collection(outputs_collection)
+        self.ttl_seconds = ttl_seconds
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = await self.collection.find_one({"key": key}, {"_id": 0})
+        if not entry:
+            return None
+        # El índice TTL borra con retraso: se filtra también aquí
+        if entry["created_at"] < datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+            return None
+
+        output_ids = entry.get("output_ids") or {}
+        if not output_ids.get("A") or not output_ids.get("B"):
+            return None
+        cursor = self.outputs.find({"_id": {"$in": [ObjectId(output_ids["A"]), ObjectId(output_ids["B"])]}})
+        by_node = {doc["nodo"]: doc.get("raw") for doc in await cursor.to_list(length=2)}
+        if not by_node.get("A") or not by_node.get("B"):
+            return None  # outputs borrados del ledger → fallo de caché
+        return dict(entry, json_a=by_node["A"], json_b=by_node["B"])
+
+    async def put(self, key: str, state: Dict[str, Any], corpus_version: str) -> None:
+        entry = _entry_from_state(key, state, corpus_version)
+        if not entry["output_ids"].get("A") or not entry["output_ids"].get("B"):
+            return
+        await self.collection.replace_one({"key": key}, entry, upsert=True)
+
+    async def invalidate(self, expediente_id: Optional[str] = None) -> int:
+        query = {"expediente_id": expediente_id} if expediente_id else {}
+        result = await self.collection.delete_many(query)
+        return result.deleted_count
+
+
+class InMemoryGenerationCacheStore:
+    """Caché en memoria (tests y desarrollo): guarda JSON_A/JSON_B junto a la entrada."""
+
+    def __init__(self, ttl_seconds: int = GENERATION_CACHE_TTL_SECONDS):
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.ttl_seconds = ttl_seconds
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(key)
+        if not entry or entry["created_at"] < datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+            return None
+        return dict(entry)
+
+    async def put(self, key: str, state: Dict[str, Any], corpus_version: str) -> None:
+        entry = _entry_from_state(key, state, corpus_version)
+        entry.update(json_a=state.get("json_a"), json_b=state.get("json_b"))
+        self.entries[key] = entry
+
+    async def invalidate(self, expediente_id: Optional[str] = None) -> int:
+        keys = [k for k, e in self.entries.items() if not expediente_id or e["expediente_id"] == expediente_id]
+        for k in keys:
+            del self.entries[k]
+        return len(keys)
+
+
+# ============================================================
+#   Caché
+# ============================================================
+class GenerationCache:
+    def __init__(self, store, corpus_version_fn: Callable[[], Awaitable[str]] = get_corpus_version,
+                 enabled: bool = GENERATION_CACHE_ENABLED):
+        self.store = store
+        self.corpus_version_fn = corpus_version_fn
+        self.enabled = enabled
+
+    async def _key_for(self, state: Dict[str, Any]) -> tuple:
+        corpus_version = await self.corpus_version_fn()
+        key = generation_key(
+            state.get("expediente_id", ""),
+            state.get("documento", "JN"),
+            state.get("seccion", ""),
+            state.get("user_text", ""),
+            corpus_version,
+            generation_options(state),
+        )
+        return key, corpus_version
+
+    async def lookup(self, state: Dict[str, Any], force_regenerate: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Calcula la clave de la sección (la deja en `state["generation_key"]`) y
+        devuelve el estado final cacheado si existe. Errores de la caché → fallo, nunca excepción.
+        """
+        if not self.enabled:
+            return None
+        try:
+            key, corpus_version = await self._key_for(state)
+            state["generation_key"] = key
+            state["corpus_version"] = corpus_version
+            if force_regenerate:
+                GENERATION_CACHE_LOOKUPS.inc(result="bypass")
+                return None
+            entry = await self.store.get(key)
+        except Exception as e:
+            print(f"⚠️ [GenerationCache] Consulta fallida, se ejecuta el grafo: {e}")
+            GENERATION_CACHE_LOOKUPS.inc(result="error")
+            return None
+
+        if not entry:
+            GENERATION_CACHE_LOOKUPS.inc(result="miss")
+            return None
+        GENERATION_CACHE_LOOKUPS.inc(result="hit")
+        print(f"♻️ [GenerationCache] Acierto para {state.get('expediente_id')}/{state.get('seccion')} ({key[:12]})")
+        return {
+            "expediente_id": state.get("expediente_id"),
+            "documento": state.get("documento", "JN"),
+            "seccion": state.get("seccion"),
+            "user_text": state.get("user_text", ""),
+            "json_a": entry["json_a"],
+            "json_b": entry["json_b"],
+            "validation_b_result": entry.get("validation_b_result"),
+            "validation_b_passed": True,
+            "path_taken": entry.get("path_taken") or "completed",
+            "route_history": [],
+            "generation_a_attempts": 0,
+            "output_ids": entry.get("output_ids") or {},
+            "generation_key": key,
+            "cache_hit": True,
+        }
+
+    async def remember(self, final_state: Dict[str, Any]) -> None:
+        """Guarda el resultado de una ejecución completada (no cachea rechazos ni fallos de ValidatorB)."""
+        key = (final_state or {}).get("generation_key")
+        if not self.enabled or not key or final_state.get("cache_hit"):
+            return
+        if final_state.get("path_taken") not in CACHEABLE_PATHS or not final_state.get("validation_b_passed"):
+            return
+        try:
+            await self.store.put(key, final_state, final_state.get("corpus_version", ""))
+        except Exception as e:
+            print(f"⚠️ [GenerationCache] No se pudo guardar la entrada: {e}")
+
+    async def invalidate(self, expediente_id: Optional[str] = None) -> int:
+        return await self.store.invalidate(expediente_id)
+
+
+# ============================================================
+#   Runtime de proceso
+# ============================================================
+_generation_cache: Optional[GenerationCache] = None
+
+
+def build_generation_cache_store(backend: str = GENERATION_CACHE_BACKEND):
+    """Selecciona el backend (GENERATION_CACHE_BACKEND=mongo|memory)."""
+    if backend == "memory":
+        return InMemoryGenerationCacheStore()
+    return MongoGenerationCacheStore()
+
+
+def get_generation_cache() -> GenerationCache:
+    global _generation_cache
+    if _generation_cache is None:
+        _generation_cache = GenerationCache(build_generation_cache_store())
+    return _generation_cache
+
+
+def set_generation_cache(cache: Optional[GenerationCache]) -> None:
+    """Sustituye la caché del proceso (tests y benchmarks)."""
+    global _generation_cache
+    _generation_cache = cache
@@ -0,0 +1,166 @@
+"""
+Hedged LLM requests
+-------------------
+Peticiones "hedged" para recortar la latencia de cola (p99) de los proveedores LLM.
+
+✔️ Se lanza el prompt al proveedor principal; si no hay respuesta válida tras
+   LLM_HEDGE_DELAY_MS (0 = inmediatamente) se lanza el mismo prompt al alternativo.
+✔️ Gana la primera respuesta aceptada (p.ej. que parsee con OutputParser.parse_json);
+   la otra petición se cancela y se espera (libera circuito y limitador antes de responder).
+✔️ Si el principal falla o devuelve algo inválido antes del retardo, el alternativo se lanza ya.
+✔️ Con proveedor alternativo disponible, las llamadas hedged no hacen además el failover
+   de LLMHandle (no se duplica la petición al mismo proveedor).
+✔️ Se registra el proveedor ganador y su latencia (metadata + /metrics).
+
+Uso:
+    hedged = HedgedLLM(llm, task_type="json_a", accept=lambda c: OutputParser.parse_json(c)[1] is None)
+    response, hedge_info = await hedged.ainvoke(prompt)
+"""
+
+import os
+import time
+import asyncio
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from backend.core.llm_resilience import suppress_failover
+from backend.core.metrics import LLM_HEDGE_REQUESTS, LLM_HEDGE_LATENCY
+
+# --- Config (tuneable vía .env) ---
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", "2000"))
+# Proveedor alternativo; vacío → el otro de openai/groq
+LLM_HEDGE_PROVIDER = os.getenv("LLM_HEDGE_PROVIDER", "").lower()
+
+
+def alternate_provider(provider: str) -> str:
+    return LLM_HEDGE_PROVIDER or {"openai": "groq", "groq": "openai"}.get(provider, provider)
+
+
+def hedging_enabled(override: Optional[bool] = None) -> bool:
+    """Preferencia por petición (estado `hedge_llm`) o LLM_HEDGING_ENABLED."""
+    return LLM_HEDGING_ENABLED if override is None else bool(override)
+
+
+def _non_empty(content: Any) -> bool:
+    return isinstance(content, str) and bool(content.strip())
+
+
+class HedgedLLM:
+    """
+    Envuelve un LLMHandle principal y crea bajo demanda el del proveedor alternativo.
+    `accept(content) -> bool` decide si una respuesta puede ganar la carrera.
+    """
+
+    def __init__(self, primary, task_type: str, temperature: Optional[float] = None,
+                 accept: Callable[[Any], bool] = _non_empty, delay_ms: float = None, secondary=None):
+        self.primary = primary
+        self.task_type = task_type
+        self.temperature = temperature
+        self.accept = accept
+        self.delay_ms = LLM_HEDGE_DELAY_MS if delay_ms is None else delay_ms
+        self._secondary = secondary
+        self._secondary_resolved = secondary is not None
+
+    def secondary(self):
+        """LLMHandle del proveedor alternativo (None si no está disponible o coincide con el principal)."""
+        if not self._secondary_resolved:
+            self._secondary_resolved = True
+            from backend.core.llm_client import get_llm
+
+            provider = alternate_provider(self.primary.provider)
+            try:
+                handle = get_llm(provider=provider, temperature=self.temperature, task_type=self.task_type)
+            except Exception as e:
+                print(f"⚠️ [Hedging] Proveedor alternativo {provider} no disponible: {e}")
+                handle = None
+            # get_llm cae a OpenAI si el alternativo falla: sin segundo proveedor no hay hedging
+            if handle is not None and handle.provider == self.primary.provider and handle.provider != "fake":
+                handle = None
+            self._secondary = handle
+        return self._secondary
+
+    async def ainvoke(self, input, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+        """Devuelve (respuesta ganadora, info del hedge)."""
+        started = time.perf_counter()
+        # El alternativo ya cubre el failover: LLMHandle no repite la petición en ese proveedor
+        hedged = self.secondary() is not None
+
+        def launch(handle) -> asyncio.Task:
+            with suppress_failover(hedged):
+                return asyncio.create_task(handle.ainvoke(input, **kwargs))
+
+        handles = {"primary": self.primary}
+        tasks = {launch(self.primary): "primary"}
+        secondary_fired = False
+        discarded = []
+        fallback = None  # primera respuesta no aceptada: se devuelve si ninguna lo es
+        last_error = None
+
+        def fire_secondary():
+            nonlocal secondary_fired
+            secondary_fired = True
+            if hedged:
+                handles["secondary"] = self.secondary()
+                tasks[launch(handles["secondary"])] = "secondary"
+
+        try:
+            while tasks:
+                timeout = None if secondary_fired else self.delay_ms / 1000
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    fire_secondary()  # el principal tarda más que el retardo
+                    continue
+
+                winner = None
+                for task in done:
+                    role = tasks.pop(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        last_error = e
+                        discarded.append({"role": role, "provider": handles[role].provider, "reason": f"error: {e}"})
+                        continue
+                    if winner is None and self.accept(response.content):
+                        winner = (role, response)
+                    else:
+                        fallback = fallback or (role, response)
+                        discarded.append({"role": role, "provider": handles[role].provider, "reason": "unparseable"})
+
+                if winner is not None:
+                    return winner[1], self._record(winner[0], handles, started, secondary_fired, discarded, True)
+                if not secondary_fired:
+                    fire_secondary()  # el principal terminó sin respuesta válida: no tiene sentido esperar
+        finally:
+            # Las perdedoras se esperan: su cancelación libera circuito y limitador antes de responder
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if fallback is not None:
+            return fallback[1], self._record(fallback[0], handles, started, secondary_fired, discarded, False)
+        LLM_HEDGE_REQUESTS.inc(task_type=self.task_type, outcome="all_failed")
+        raise last_error
+
+    def _record(self, role: str, handles: Dict[str, Any], started: float, secondary_fired: bool,
+                discarded: list, accepted: bool) -> Dict[str, Any]:
+        latency = time.perf_counter() - started
+        handle = handles[role]
+        if not secondary_fired:
+            outcome = "primary_only"
+        else:
+            outcome = f"{role}_won" if accepted else "none_accepted"
+        LLM_HEDGE_REQUESTS.inc(task_type=self.task_type, outcome=outcome)
+        LLM_HEDGE_LATENCY.observe(latency, task_type=self.task_type, provider=handle.provider)
+        if secondary_fired:
+            print(f"🏁 [Hedging] {self.task_type}: gana {handle.provider} ({role}) en {latency * 1000:.0f} ms")
+        return {
+            "winner": handle.provider,
+            "model": handle.model_name,
+            "role": role,
+            "accepted": accepted,
+            "latency_ms": round(latency * 1000, 1),
+            "delay_ms": self.delay_ms,
+            "secondary_fired": secondary_fired,
+            "secondary_provider": handles["secondary"].provider if "secondary" in handles else None,
+            "discarded": discarded,
+        }
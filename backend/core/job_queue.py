@@ -0,0 +1,193 @@
+"""
+Job Queue
+---------
+Cola de generación asíncrona con pool acotado de workers en el propio proceso.
+
+✔️ submit / get / cancel sobre un store persistente (Mongo `jobs` o memoria).
+✔️ Back-pressure: si la cola está llena, `submit` lanza JobQueueFullError (→ HTTP 429).
+✔️ Progreso por nodo: el runner notifica cada nodo completado del grafo.
+✔️ Cancelación de jobs encolados o en ejecución.
+✔️ Al arrancar, los jobs que un reinicio dejó en queued/running pasan a failed
+   (JOB_RECONCILE_ON_START; supone un único proceso dueño de la colección `jobs`).
+
+El runner es una corrutina `runner(request, on_node) -> dict` que ejecuta la
+generación y llama a `on_node({"node": ..., "elapsed_ms": ...})` por cada nodo.
+"""
+
+import os
+import uuid
+import asyncio
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from backend.database.jobs_repository import (
+    InMemoryJobStore,
+    MongoJobStore,
+    TERMINAL_STATUSES,
+    new_job_document,
+)
+
+# --- Config (tuneable vía .env) ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "mongo").lower()  # mongo | memory
+# Marcar como fallidos al arrancar los jobs huérfanos de un proceso anterior
+JOB_RECONCILE_ON_START = os.getenv("JOB_RECONCILE_ON_START", "true").lower() == "true"
+
+JobRunner = Callable[[Dict[str, Any], Callable[[Dict[str, Any]], Awaitable[None]]], Awaitable[Dict[str, Any]]]
+
+
+class JobQueueFullError(Exception):
+    """La cola ha alcanzado JOB_MAX_PENDING jobs pendientes."""
+
+
+class JobQueue:
+    def __init__(self, store, runner: JobRunner, workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING,
+                 reconcile_on_start: bool = JOB_RECONCILE_ON_START):
+        self.store = store
+        self.runner = runner
+        self.workers = max(1, workers)
+        self.reconcile_on_start = reconcile_on_start
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_pending))
+        self._reserved = 0  # huecos apartados por submits que aún están guardando el job
+        self._worker_tasks = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled = set()
+
+    # ---------------- ciclo de vida ----------------
+    async def start(self):
+        if self._worker_tasks:
+            return
+        if self.reconcile_on_start:
+            # Un job en queued/running de un proceso anterior ya no lo ejecutará nadie
+            orphans = await self.store.fail_unfinished("Interrumpido por un reinicio del servidor")
+            if orphans:
+                print(f"⚠️ [JobQueue] {orphans} job(s) huérfanos marcados como failed")
+        self._worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"[JobQueue] {self.workers} workers iniciados (max_pending={self._queue.maxsize})")
+
+    async def stop(self):
+        for task in list(self._running.values()):
+            task.cancel()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    # ---------------- API pública ----------------
+    async def submit(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Encola un job. Lanza JobQueueFullError si no hay hueco (back-pressure)."""
+        # El hueco se aparta antes de esperar al store: submits concurrentes no pueden pasarse del límite
+        if self._queue.qsize() + self._reserved >= self._queue.maxsize:
+            raise JobQueueFullError(f"Cola llena ({self._queue.maxsize} jobs pendientes)")
+        self._reserved += 1
+        job = new_job_document(str(uuid.uuid4()), request)
+        try:
+            await self.store.create(job)
+        finally:
+            self._reserved -= 1
+        self._queue.put_nowait(job["job_id"])
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.store.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancela un job encolado o en ejecución. Devuelve el job actualizado o None."""
+        job = await self.store.get(job_id)
+        if not job:
+            return None
+        if job["status"] in TERMINAL_STATUSES:
+            return job
+
+        self._cancelled.add(job_id)
+        running = self._running.get(job_id)
+        if running:
+            running.cancel()  # el worker marca el estado al capturar la cancelación
+            await asyncio.gather(running, return_exceptions=True)
+        else:
+            await self._finish(job_id, "cancelled")
+        return await self.store.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "pending": self._queue.qsize() + self._reserved,
+            "max_pending": self._queue.maxsize,
+            "running": len(self._running),
+        }
+
+    # ---------------- internos ----------------
+    async def _finish(self, job_id: str, status: str, result=None, error: str = None):
+        await self.store.update(job_id, {
+            "status": status,
+            "result": result,
+            "error": error,
+            "finished_at": datetime.utcnow().isoformat(),
+        })
+
+    async def _run_job(self, job_id: str):
+        job = await self.store.get(job_id)
+        if not job or job["status"] != "queued" or job_id in self._cancelled:
+            return
+
+        await self.store.update(job_id, {"status": "running", "started_at": datetime.utcnow().isoformat()})
+
+        async def on_node(node_event: Dict[str, Any]):
+            await self.store.add_node_progress(job_id, node_event)
+
+        try:
+            result = await self.runner(job["request"], on_node)
+            await self._finish(job_id, "succeeded", result=result)
+        except asyncio.CancelledError:
+            await self._finish(job_id, "cancelled")
+        except Exception as e:
+            print(f"❌ [JobQueue] Job {job_id} falló: {e}")
+            await self._finish(job_id, "failed", error=f"{type(e).__name__}: {e}")
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                task = asyncio.create_task(self._run_job(job_id))
+                self._running[job_id] = task
+                await asyncio.gather(task, return_exceptions=True)
+            finally:
+                self._running.pop(job_id, None)
+                self._cancelled.discard(job_id)
+                self._queue.task_done()
+
+
+# ============================================================
+#   Runtime de proceso
+# ============================================================
+_job_queue: Optional[JobQueue] = None
+
+
+def build_job_store(backend: str = JOB_STORE_BACKEND):
+    """Selecciona el backend de persistencia (JOB_STORE_BACKEND=mongo|memory)."""
+    if backend == "memory":
+        return InMemoryJobStore()
+    return MongoJobStore()
+
+
+async def init_job_queue(runner: JobRunner, store=None) -> JobQueue:
+    """Crea y arranca la cola del proceso (lifespan de FastAPI)."""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(store or build_job_store(), runner)
+        await _job_queue.start()
+    return _job_queue
+
+
+def get_job_queue() -> JobQueue:
+    if _job_queue is None:
+        raise RuntimeError("La cola de jobs no está inicializada (init_job_queue en el lifespan)")
+    return _job_queue
+
+
+async def shutdown_job_queue():
+    global _job_queue
+    if _job_queue is not None:
+        await _job_queue.stop()
+        _job_queue = None
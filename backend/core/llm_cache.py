@@ -0,0 +1,237 @@
+"""
+LLM Response Cache
+------------------
+Caché exacta de respuestas LLM en dos niveles, consultada desde `get_llm`.
+
+✔️ Clave = sha256 de (provider, model, temperature, max_tokens, mensajes renderizados).
+✔️ Nivel 1: LRU en memoria del proceso (sin E/S).
+✔️ Nivel 2: colección Mongo `llm_cache` compartida entre procesos, con TTL y
+   expulsión por tamaño (las entradas menos usadas recientemente primero).
+✔️ Contadores de aciertos/fallos por task_type y nivel en /metrics.
+✔️ `bypass_llm_cache()` desactiva la consulta (p.ej. con force_regenerate).
+
+Activación por tarea: LLM_CACHE_TASKS (lista separada por comas) o el
+parámetro `cache=` de `get_llm`.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, convert_to_messages
+from langchain_core.prompt_values import PromptValue
+
+from backend.core.logic_jn import sha256_hex
+from backend.core.metrics import LLM_CACHE_LOOKUPS
+from backend.database.mongo import get_collection
+
+# --- Config (tuneable vía .env) ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TASKS = [t.strip() for t in os.getenv("LLM_CACHE_TASKS", "prompt_refiner,json_a,json_b").split(",") if t.strip()]
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "mongo").lower()  # mongo | memory
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Cada cuántas escrituras se comprueba el tamaño de la colección
+LLM_CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", "50"))
+
+_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_llm_cache(active: bool = True):
+    """Dentro del bloque las llamadas no consultan la caché (sí guardan la nueva respuesta)."""
+    token = _bypass.set(active)
+    try:
+        yield
+    finally:
+        try:
+            _bypass.reset(token)
+        except ValueError:
+            pass  # generador asíncrono cerrado desde otro contexto: el contexto original ya no existe
+
+
+def bypass_llm_cache_active() -> bool:
+    return _bypass.get()
+
+
+def render_messages(input: Any) -> List[BaseMessage]:
+    """Normaliza la entrada de un chat model (str, PromptValue o lista de mensajes)."""
+    if isinstance(input, str):
+        return [HumanMessage(content=input)]
+    if isinstance(input, PromptValue):
+        return input.to_messages()
+    return convert_to_messages(input)
+
+
+def llm_cache_key(provider: str, model: str, temperature: Optional[float], max_tokens: Optional[int],
+                  input: Any, **kwargs) -> str:
+    return sha256_hex({
+        "provider": provider,
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "messages": [{"type": m.type, "content": m.content} for m in render_messages(input)],
+        "kwargs": {k: v for k, v in kwargs.items() if isinstance(v, (str, int, float, bool, list, type(None)))},
+    })
+
+
+# ============================================================
+#   Niveles
+# ============================================================
+class MemoryLRUTier:
+    """LRU acotado con caducidad por entrada."""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MEMORY_ENTRIES, ttl_seconds: int = LLM_CACHE_TTL_SECONDS):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        content, expires_at = item
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return content
+
+    def put(self, key: str, content: str) -> None:
+        self._entries[key] = (content, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class MongoLLMCacheStore:
+    """Nivel persistente en la colección `llm_cache` (índice TTL sobre created_at)."""
+
+    def __init__(self, collection_name: str = "llm_cache", max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 ttl_seconds: int = LLM_CACHE_TTL_SECONDS):
+        self.collection = get_collection(collection_name)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._writes = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        doc = await self.collection.find_one_and_update(
+            {"key": key, "created_at": {"$gt": datetime.utcnow() - timedelta(seconds=self.ttl_seconds)}},
+            {"$set": {"last_access": datetime.utcnow()}},
+            projection={"_id": 0, "content": 1},
+        )
+        return doc["content"] if doc else None
+
+    async def put(self, key: str, content: str, task_type: str, model: str) -> None:
+        now = datetime.utcnow()
+        await self.collection.replace_one(
+            {"key": key},
+            {"key": key, "content": content, "task_type": task_type, "model": model,
+             "created_at": now, "last_access": now},
+            upsert=True,
+        )
+        self._writes += 1
+        if self._writes % max(1, LLM_CACHE_EVICT_EVERY) == 0:
+            await self.evict()
+
+    async def evict(self) -> int:
+        """Expulsa las entradas menos usadas recientemente si se supera max_entries."""
+        excess = await self.collection.estimated_document_count() - self.max_entries
+        if excess <= 0:
+            return 0
+        cursor = self.collection.find({}, {"last_access": 1}).sort("last_access", 1).skip(excess - 1).limit(1)
+        boundary = await cursor.to_list(length=1)
+        if not boundary:
+            return 0
+        result = await self.collection.delete_many({"last_access": {"$lte": boundary[0]["last_access"]}})
+        return result.deleted_count
+
+
+# ============================================================
+#   Caché
+# ============================================================
+class LLMResponseCache:
+    def __init__(self, memory: MemoryLRUTier = None, store=None, enabled: bool = True):
+        self.memory = memory or MemoryLRUTier()
+        self.store = store
+        self.enabled = enabled
+
+    async def aget(self, key: str, task_type: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        if _bypass.get():
+            LLM_CACHE_LOOKUPS.inc(task_type=task_type, result="bypass")
+            return None
+        content = self.memory.get(key)
+        if content is not None:
+            LLM_CACHE_LOOKUPS.inc(task_type=task_type, result="hit_memory")
+            return content
+        if self.store is not None:
+            try:
+                content = await self.store.get(key)
+            except Exception as e:
+                print(f"⚠️ [LLMCache] Consulta persistente fallida: {e}")
+                content = None
+            if content is not None:
+                self.memory.put(key, content)
+                LLM_CACHE_LOOKUPS.inc(task_type=task_type, result="hit_persistent")
+                return content
+        LLM_CACHE_LOOKUPS.inc(task_type=task_type, result="miss")
+        return None
+
+    def get(self, key: str, task_type: str) -> Optional[str]:
+        """Consulta síncrona: solo el nivel en memoria."""
+        if not self.enabled:
+            return None
+        if _bypass.get():
+            LLM_CACHE_LOOKUPS.inc(task_type=task_type, result="bypass")
+            return None
+        content = self.memory.get(key)
+        LLM_CACHE_LOOKUPS.inc(task_type=task_type, result="hit_memory" if content is not None else "miss")
+        return content
+
+    async def aput(self, key: str, content: str, task_type: str, model: str) -> None:
+        if not self.enabled or not content:
+            return
+        self.memory.put(key, content)
+        if self.store is not None:
+            try:
+                await self.store.put(key, content, task_type, model)
+            except Exception as e:
+                print(f"⚠️ [LLMCache] No se pudo persistir la respuesta: {e}")
+
+    def put(self, key: str, content: str) -> None:
+        if self.enabled and content:
+            self.memory.put(key, content)
+
+
+# ============================================================
+#   Runtime de proceso
+# ============================================================
+_llm_cache: Optional[LLMResponseCache] = None
+
+
+def cache_enabled_for(task_type: str) -> bool:
+    return LLM_CACHE_ENABLED and task_type in LLM_CACHE_TASKS
+
+
+def get_llm_cache() -> LLMResponseCache:
+    global _llm_cache
+    if _llm_cache is None:
+        store = MongoLLMCacheStore() if LLM_CACHE_BACKEND == "mongo" else None
+        _llm_cache = LLMResponseCache(store=store)
+    return _llm_cache
+
+
+def set_llm_cache(cache: Optional[LLMResponseCache]) -> None:
+    """Sustituye la caché del proceso (tests y benchmarks)."""
+    global _llm_cache
+    _llm_cache = cache
@@ -7,10 +7,37 @@ Cliente centralizado para inicializar modelos LLM en Mini-CELIA.
 ✔️ Permite fallback automático si un proveedor falla.
 ✔️ Configura límites de tokens por tipo de agente (A/B).
 ✔️ Evita dependencias innecesarias si no hay configuración para otros LLMs.
+✔️ Modo offline `LLM_PROVIDER=fake` (modelo determinista para tests y benchmarks).
+✔️ Registro de clientes compartidos por (provider, model, temperature, max_tokens)
+   con pools HTTP keep-alive por proveedor (cerrados en el lifespan).
+✔️ Caché exacta de respuestas activable por task_type (ver backend.core.llm_cache);
+   `cache_accept` decide por llamada qué respuestas se pueden guardar.
 """
 
 import os
+import json
+import time
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Tuple
+
+import httpx
 from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import Runnable
+from backend.core.metrics import LLM_REQUESTS, LLM_PROMPT_TOKENS, LLM_COMPLETION_TOKENS, LLM_LENGTH_RETRIES
+from backend.core.fake_llm import FakeChatModel, FAKE_MODEL_NAME
+from backend.core.llm_cache import LLMResponseCache, cache_enabled_for, get_llm_cache, llm_cache_key, render_messages
+from backend.core.token_budget import count_tokens, default_max_tokens
+from backend.core.rate_limiter import get_rate_limiter
+from backend.core.llm_resilience import (
+    call_deadline_seconds,
+    call_with_retries,
+    call_with_retries_sync,
+    failover_provider,
+    record_failover,
+    should_failover,
+)
 
 # Modelos soportados (solo si hay configuración disponible)
 from langchain_openai import ChatOpenAI
@@ -23,6 +50,467 @@ except ImportError:
 
 load_dotenv()
 
+# --- Pools HTTP compartidos (tuneables vía .env) ---
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_TIMEOUT_SECONDS", "120"))
+# Respuesta cortada por max_tokens (finish_reason=length): se repite una vez con el límite multiplicado
+LLM_LENGTH_RETRY_FACTOR = float(os.getenv("LLM_LENGTH_RETRY_FACTOR", "2"))
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    Callback de LangChain que contabiliza llamadas y tokens por `task_type`
+    (expuestos en /metrics).
+    """
+
+    def __init__(self, task_type: str, model_name: str):
+        self.task_type = task_type
+        self.model_name = model_name
+
+    def on_llm_end(self, response, **kwargs):
+        prompt_tokens, completion_tokens = 0, 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+
+        # Algunos proveedores solo informan el uso en llm_output
+        if not prompt_tokens and not completion_tokens:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = token_usage.get("prompt_tokens", 0)
+            completion_tokens = token_usage.get("completion_tokens", 0)
+
+        labels = {"task_type": self.task_type, "model": self.model_name}
+        LLM_REQUESTS.inc(**labels)
+        LLM_PROMPT_TOKENS.inc(prompt_tokens, **labels)
+        LLM_COMPLETION_TOKENS.inc(completion_tokens, **labels)
+
+
+class LLMHandle(Runnable):
+    """
+    Vista por tarea de un cliente compartido del registro.
+
+    El cliente (y su pool de conexiones) se comparte entre todas las tareas que
+    usan el mismo (provider, model, temperature, max_tokens); el handle solo
+    añade el callback de métricas con su `task_type`, el límite de tokens de
+    respuesta de la tarea (MAX_TOKENS_* del .env, por llamada) y, si está
+    activada, la caché de respuestas. Cada llamada pasa por el envoltorio de
+    resiliencia (reintentos con backoff, circuit breaker por proveedor con
+    failover y deadline; ver llm_resilience). Es un Runnable, por lo que
+    funciona en cadenas LCEL (`prompt | llm | parser`). La salida estructurada
+    nativa va por `ainvoke_structured` (mismo camino de caché, límite y resiliencia).
+    """
+
+    def __init__(self, client, provider: str, model_name: str, task_type: str,
+                 temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                 cache: Optional[LLMResponseCache] = None):
+        self.client = client
+        self.provider = provider
+        self.task_type = task_type
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.cache = cache
+        self._model_name = model_name
+        # Límite por tarea: se envía por llamada para no fragmentar el registro de clientes
+        self.default_max_tokens = None if max_tokens else default_max_tokens(task_type, model_name)
+        self._bound = client.with_config(callbacks=[LLMMetricsCallback(task_type, model_name)])
+        self._failover: Optional["LLMHandle"] = None
+        self._failover_resolved = False
+        self._structured: Dict[str, Any] = {}
+
+    @property
+    def model_name(self) -> str:
+        return self._model_name
+
+    # ---------------- caché ----------------
+    def _cache_key(self, input, **kwargs) -> str:
+        max_tokens = kwargs.pop("max_tokens", self.max_tokens)
+        return llm_cache_key(self.provider, self._model_name, self.temperature, max_tokens, input, **kwargs)
+
+    def _call_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if "max_tokens" in kwargs and kwargs["max_tokens"] is None:
+            kwargs = {k: v for k, v in kwargs.items() if k != "max_tokens"}  # sin límite: no se envía
+        if self.default_max_tokens and "max_tokens" not in kwargs:
+            return {**kwargs, "max_tokens": self.default_max_tokens}
+        return kwargs
+
+    def _length_retry_kwargs(self, response, kwargs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Si la respuesta se cortó por max_tokens (p.ej. un modelo de razonamiento que gastó el
+        límite pensando y devolvió `content` vacío), kwargs con el límite ampliado; si no, None.
+        """
+        metadata = getattr(response, "response_metadata", None) or {}
+        max_tokens = kwargs.get("max_tokens") or self.max_tokens
+        if metadata.get("finish_reason") != "length" or not max_tokens or LLM_LENGTH_RETRY_FACTOR <= 1:
+            return None
+        raised = int(max_tokens * LLM_LENGTH_RETRY_FACTOR)
+        LLM_LENGTH_RETRIES.inc(task_type=self.task_type, model=self._model_name)
+        print(f"⚠️ [LLM Client] {self.task_type}: respuesta cortada con max_tokens={max_tokens}; "
+              f"se repite con {raised}")
+        return {**kwargs, "max_tokens": raised}
+
+    def _cached_message(self, content: str) -> AIMessage:
+        return AIMessage(content=content, response_metadata={"model_name": self._model_name, "llm_cache": "hit"})
+
+    @staticmethod
+    def _cacheable(content: Any, accept: Optional[Callable[[str], bool]]) -> bool:
+        """Solo se guardan respuestas no vacías que `accept` da por buenas (p.ej. JSON que valida)."""
+        if not content or not isinstance(content, str):
+            return False
+        try:
+            return accept is None or bool(accept(content))
+        except Exception:
+            return False
+
+    # ---------------- resiliencia ----------------
+    def failover_handle(self) -> Optional["LLMHandle"]:
+        """Handle del proveedor alternativo (sin caché propia), creado bajo demanda."""
+        if not self._failover_resolved:
+            self._failover_resolved = True
+            provider = failover_provider(self.provider)
+            if provider:
+                try:
+                    handle = get_llm(provider=provider, temperature=self.temperature, max_tokens=self.max_tokens,
+                                     task_type=self.task_type, cache=False)
+                    self._failover = handle if handle.provider != self.provider else None
+                except Exception as e:
+                    print(f"⚠️ [LLM Client] Failover a {provider} no disponible: {e}")
+        return self._failover
+
+    # ---------------- salida estructurada ----------------
+    def _runnable(self, structured_schema: Optional[dict] = None):
+        """Cliente con callbacks; con esquema, su variante de salida estructurada nativa (memoizada)."""
+        if structured_schema is None:
+            return self._bound
+        key = json.dumps(structured_schema, sort_keys=True)
+        if key not in self._structured:
+            try:
+                self._structured[key] = self.client.with_structured_output(
+                    structured_schema, method="json_schema"
+                ).with_config(callbacks=[LLMMetricsCallback(self.task_type, self._model_name)])
+            except (NotImplementedError, ValueError, TypeError) as e:
+                self._structured[key] = e
+        runnable = self._structured[key]
+        if isinstance(runnable, Exception):
+            raise NotImplementedError(f"{self.provider}/{self._model_name} sin salida estructurada: {runnable}")
+        return runnable
+
+    async def ainvoke_structured(self, input, schema: dict,
+                                 cache_accept: Optional[Callable[[str], bool]] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Invoca el modelo con salida estructurada nativa (JSON schema del proveedor).
+        Devuelve el objeto ya parseado. Lanza NotImplementedError si el modelo no la soporta.
+        """
+        kwargs = self._call_kwargs(kwargs)
+        key = None
+        if self.cache is not None:
+            key = self._cache_key(input, structured_schema=json.dumps(schema, sort_keys=True), **kwargs)
+            cached = await self.cache.aget(key, self.task_type)
+            if cached is not None:
+                return json.loads(cached)
+        result = await self._call(input, None, structured_schema=schema, **kwargs)
+        if hasattr(result, "model_dump"):
+            result = result.model_dump()
+        if key is not None:
+            content = json.dumps(result, ensure_ascii=False)
+            if self._cacheable(content, cache_accept):
+                await self.cache.aput(key, content, self.task_type, self._model_name)
+        return result
+
+    # ---------------- límite de ritmo (RPM/TPM) ----------------
+    def _estimate_tokens(self, input, kwargs: Dict[str, Any]) -> int:
+        """Coste estimado para el bucket TPM: tokens del prompt + tokens máximos de respuesta."""
+        prompt = "\n".join(str(m.content) for m in render_messages(input))
+        return count_tokens(prompt, self._model_name) + (kwargs.get("max_tokens") or self.max_tokens or 0)
+
+    async def _attempt(self, input, config, structured_schema: Optional[dict] = None, **kwargs):
+        """Un intento contra el proveedor, tras esperar turno en su limitador."""
+        runnable = self._runnable(structured_schema)
+        limiter = get_rate_limiter(self.provider, self._model_name)
+        if limiter is None:
+            return await runnable.ainvoke(input, config, **kwargs)
+        estimated = self._estimate_tokens(input, kwargs)
+        await limiter.acquire(estimated)
+        response = await runnable.ainvoke(input, config, **kwargs)
+        limiter.settle(estimated, (getattr(response, "usage_metadata", None) or {}).get("total_tokens"))
+        return response
+
+    def _attempt_sync(self, input, config, **kwargs):
+        limiter = get_rate_limiter(self.provider, self._model_name)
+        if limiter is None:
+            return self._bound.invoke(input, config, **kwargs)
+        estimated = self._estimate_tokens(input, kwargs)
+        limiter.acquire_sync(estimated)
+        response = self._bound.invoke(input, config, **kwargs)
+        limiter.settle(estimated, (getattr(response, "usage_metadata", None) or {}).get("total_tokens"))
+        return response
+
+    async def _call(self, input, config, **kwargs):
+        response = await self._call_resilient(input, config, **kwargs)
+        retry_kwargs = self._length_retry_kwargs(response, kwargs)
+        if retry_kwargs is not None:
+            response = await self._call_resilient(input, config, **retry_kwargs)
+        return response
+
+    def _call_sync(self, input, config, **kwargs):
+        response = self._call_resilient_sync(input, config, **kwargs)
+        retry_kwargs = self._length_retry_kwargs(response, kwargs)
+        if retry_kwargs is not None:
+            response = self._call_resilient_sync(input, config, **retry_kwargs)
+        return response
+
+    async def _call_resilient(self, input, config, **kwargs):
+        deadline = time.monotonic() + call_deadline_seconds(self.task_type)
+        try:
+            return await call_with_retries(lambda: self._attempt(input, config, **kwargs),
+                                           self.provider, self.task_type, deadline)
+        except Exception as e:
+            failover = self.failover_handle() if should_failover(e) else None
+            if failover is None:
+                raise
+            record_failover(self.provider, failover.provider, self.task_type, e)
+            return await call_with_retries(lambda: failover._attempt(input, config, **kwargs),
+                                           failover.provider, self.task_type, deadline)
+
+    def _call_resilient_sync(self, input, config, **kwargs):
+        deadline = time.monotonic() + call_deadline_seconds(self.task_type)
+        try:
+            return call_with_retries_sync(lambda: self._attempt_sync(input, config, **kwargs),
+                                          self.provider, self.task_type, deadline)
+        except Exception as e:
+            failover = self.failover_handle() if should_failover(e) else None
+            if failover is None:
+                raise
+            record_failover(self.provider, failover.provider, self.task_type, e)
+            return call_with_retries_sync(lambda: failover._attempt_sync(input, config, **kwargs),
+                                          failover.provider, self.task_type, deadline)
+
+    async def _open_stream(self, input, config, **kwargs):
+        """
+        Abre el stream con la misma resiliencia que `_call` hasta el primer fragmento
+        (después ya no se puede reintentar sin duplicar tokens emitidos).
+        """
+        async def first_chunk(handle):
+            limiter = get_rate_limiter(handle.provider, handle.model_name)
+            if limiter is not None:
+                await limiter.acquire(handle._estimate_tokens(input, kwargs))
+            iterator = handle._bound.astream(input, config, **kwargs).__aiter__()
+            try:
+                return iterator, await iterator.__anext__()
+            except StopAsyncIteration:
+                return iterator, None
+
+        deadline = time.monotonic() + call_deadline_seconds(self.task_type)
+        try:
+            return await call_with_retries(lambda: first_chunk(self), self.provider, self.task_type, deadline)
+        except Exception as e:
+            failover = self.failover_handle() if should_failover(e) else None
+            if failover is None:
+                raise
+            record_failover(self.provider, failover.provider, self.task_type, e)
+            return await call_with_retries(lambda: first_chunk(failover), failover.provider, self.task_type, deadline)
+
+    def _open_stream_sync(self, input, config, **kwargs):
+        """Variante síncrona de `_open_stream` (limitador + reintentos + failover hasta el primer fragmento)."""
+        def first_chunk(handle):
+            limiter = get_rate_limiter(handle.provider, handle.model_name)
+            if limiter is not None:
+                limiter.acquire_sync(handle._estimate_tokens(input, kwargs))
+            iterator = iter(handle._bound.stream(input, config, **kwargs))
+            return iterator, next(iterator, None)
+
+        deadline = time.monotonic() + call_deadline_seconds(self.task_type)
+        try:
+            return call_with_retries_sync(lambda: first_chunk(self), self.provider, self.task_type, deadline)
+        except Exception as e:
+            failover = self.failover_handle() if should_failover(e) else None
+            if failover is None:
+                raise
+            record_failover(self.provider, failover.provider, self.task_type, e)
+            return call_with_retries_sync(lambda: first_chunk(failover), failover.provider, self.task_type, deadline)
+
+    def _stream_chunks_sync(self, input, config, **kwargs) -> Iterator[Any]:
+        iterator, first = self._open_stream_sync(input, config, **kwargs)
+        if first is None:
+            return
+        yield first
+        yield from iterator
+
+    async def _stream_chunks(self, input, config, **kwargs) -> AsyncIterator[Any]:
+        iterator, first = await self._open_stream(input, config, **kwargs)
+        if first is None:
+            return
+        yield first
+        async for chunk in iterator:
+            yield chunk
+
+    # ---------------- Runnable ----------------
+    def invoke(self, input, config=None, cache_accept: Optional[Callable[[str], bool]] = None, **kwargs):
+        kwargs = self._call_kwargs(kwargs)
+        if self.cache is None:
+            return self._call_sync(input, config, **kwargs)
+        key = self._cache_key(input, **kwargs)
+        cached = self.cache.get(key, self.task_type)
+        if cached is not None:
+            return self._cached_message(cached)
+        response = self._call_sync(input, config, **kwargs)
+        if self._cacheable(response.content, cache_accept):
+            self.cache.put(key, response.content)
+        return response
+
+    async def ainvoke(self, input, config=None, cache_accept: Optional[Callable[[str], bool]] = None, **kwargs):
+        kwargs = self._call_kwargs(kwargs)
+        if self.cache is None:
+            return await self._call(input, config, **kwargs)
+        key = self._cache_key(input, **kwargs)
+        cached = await self.cache.aget(key, self.task_type)
+        if cached is not None:
+            return self._cached_message(cached)
+        response = await self._call(input, config, **kwargs)
+        if self._cacheable(response.content, cache_accept):
+            await self.cache.aput(key, response.content, self.task_type, self._model_name)
+        return response
+
+    def stream(self, input, config=None, cache_accept: Optional[Callable[[str], bool]] = None,
+               **kwargs) -> Iterator[Any]:
+        kwargs = self._call_kwargs(kwargs)
+        if self.cache is None:
+            yield from self._stream_chunks_sync(input, config, **kwargs)
+            return
+        key = self._cache_key(input, **kwargs)
+        cached = self.cache.get(key, self.task_type)
+        if cached is not None:
+            yield AIMessageChunk(content=cached, response_metadata={"llm_cache": "hit"})
+            return
+        parts = []
+        for chunk in self._stream_chunks_sync(input, config, **kwargs):
+            if isinstance(chunk.content, str):
+                parts.append(chunk.content)
+            yield chunk
+        content = "".join(parts)
+        if self._cacheable(content, cache_accept):
+            self.cache.put(key, content)
+
+    async def astream(self, input, config=None, cache_accept: Optional[Callable[[str], bool]] = None,
+                      **kwargs) -> AsyncIterator[Any]:
+        kwargs = self._call_kwargs(kwargs)
+        if self.cache is None:
+            async for chunk in self._stream_chunks(input, config, **kwargs):
+                yield chunk
+            return
+        key = self._cache_key(input, **kwargs)
+        cached = await self.cache.aget(key, self.task_type)
+        if cached is not None:
+            # En un acierto la respuesta completa llega en un único fragmento
+            yield AIMessageChunk(content=cached, response_metadata={"llm_cache": "hit"})
+            return
+        parts = []
+        async for chunk in self._stream_chunks(input, config, **kwargs):
+            if isinstance(chunk.content, str):
+                parts.append(chunk.content)
+            yield chunk
+        content = "".join(parts)
+        if self._cacheable(content, cache_accept):
+            await self.cache.aput(key, content, self.task_type, self._model_name)
+
+    def __repr__(self) -> str:
+        return f"LLMHandle(provider={self.provider}, model={self._model_name}, task_type={self.task_type})"
+
+
+# ============================================================
+#   Registro de clientes y pools HTTP
+# ============================================================
+_registry_lock = threading.Lock()
+_CLIENTS: Dict[Tuple[str, str, Optional[float], Optional[int]], Any] = {}
+_HTTP_POOLS: Dict[str, Dict[str, Any]] = {}
+
+
+def _http_pool(provider: str) -> Dict[str, Any]:
+    """Un par de clientes httpx (sync/async) con keep-alive por proveedor."""
+    pool = _HTTP_POOLS.get(provider)
+    if pool is None:
+        limits = httpx.Limits(
+            max_connections=LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(LLM_HTTP_TIMEOUT_SECONDS)
+        pool = {
+            "sync": httpx.Client(limits=limits, timeout=timeout),
+            "async": httpx.AsyncClient(limits=limits, timeout=timeout),
+        }
+        _HTTP_POOLS[provider] = pool
+    return pool
+
+
+def _build_client(provider: str, model_name: str, temperature: Optional[float], max_tokens: Optional[int]):
+    if provider == "groq":
+        api_key = os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise ValueError("Falta GROQ_API_KEY en .env")
+        pool = _http_pool("groq")
+        print(f"[LLM Client] Nuevo cliente Groq model={model_name}")
+        return ChatGroq(
+            model=model_name,
+            api_key=api_key,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            max_retries=0,  # los reintentos los gestiona llm_resilience (backoff + circuito)
+            http_client=pool["sync"],
+            http_async_client=pool["async"],
+        )
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("Falta OPENAI_API_KEY en .env")
+    pool = _http_pool("openai")
+    print(f"[LLM Client] Nuevo cliente OpenAI model={model_name}")
+    return ChatOpenAI(
+        model=model_name,
+        api_key=api_key,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream_usage=True,
+        max_retries=0,
+        http_client=pool["sync"],
+        http_async_client=pool["async"],
+    )
+
+
+def _get_client(provider: str, model_name: str, temperature: Optional[float], max_tokens: Optional[int]):
+    """Devuelve el cliente memoizado para la clave, creándolo la primera vez."""
+    key = (provider, model_name, temperature, max_tokens)
+    with _registry_lock:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = _build_client(provider, model_name, temperature, max_tokens)
+            _CLIENTS[key] = client
+        return client
+
+
+def llm_registry_stats() -> Dict[str, Any]:
+    return {
+        "clients": [
+            {"provider": p, "model": m, "temperature": t, "max_tokens": mt}
+            for (p, m, t, mt) in _CLIENTS
+        ],
+        "http_pools": sorted(_HTTP_POOLS),
+    }
+
+
+async def aclose_llm_clients():
+    """Cierra los pools HTTP compartidos y vacía el registro (apagado de la aplicación)."""
+    with _registry_lock:
+        pools = list(_HTTP_POOLS.values())
+        _HTTP_POOLS.clear()
+        _CLIENTS.clear()
+    for pool in pools:
+        await pool["async"].aclose()
+        pool["sync"].close()
+
 
 def get_llm(
     provider: str = None,
@@ -30,58 +518,49 @@ def get_llm(
     temperature: float = 0.2,
     max_tokens: int = None,
     task_type: str = "generic",
-):
+    cache: Optional[bool] = None,
+) -> LLMHandle:
     """
-    Devuelve una instancia configurada de LLM según el proveedor disponible.
+    Devuelve un LLM configurado según el proveedor disponible.
+    El cliente subyacente se reutiliza entre llamadas con la misma configuración.
 
     Args:
-        provider: "openai" (default), "groq"
+        provider: "openai" (default), "groq", "fake"
         model_name: nombre del modelo (p.ej., gpt-5, mixtral-8x7b)
         temperature: creatividad del modelo
-        max_tokens: límite de tokens (puede venir del .env)
+        max_tokens: límite de tokens de la respuesta; None → MAX_TOKENS_<TAREA> del .env
         task_type: identifica el tipo de tarea (json_a, json_b, validator…)
+        cache: activa/desactiva la caché de respuestas; None → según LLM_CACHE_TASKS
 
     Ejemplo:
         llm = get_llm(task_type="json_a", temperature=0.2)
     """
 
+    use_cache = cache_enabled_for(task_type) if cache is None else cache
+    response_cache = get_llm_cache() if use_cache else None
+
+    # --- Modo offline: LLM_PROVIDER=fake se impone a cualquier proveedor explícito ---
+    if provider == "fake" or os.getenv("LLM_PROVIDER", "").lower() == "fake":
+        # El modelo fake no abre conexiones: se crea por tarea (sus respuestas dependen de ella)
+        return LLMHandle(FakeChatModel.from_env(task_type=task_type), "fake", FAKE_MODEL_NAME, task_type,
+                         temperature, max_tokens, cache=response_cache)
+
     # --- Config general ---
     provider = provider or os.getenv("LLM_PROVIDER", "openai").lower()
-    model_name = model_name or os.getenv("OPENAI_MODEL", "gpt-5")
-
-    '''# --- Límite de tokens configurable por tipo de tarea ---
-    default_max = {
-        "json_a": int(os.getenv("MAX_TOKENS_JSON_A", "1500")),
-        "json_b": int(os.getenv("MAX_TOKENS_JSON_B", "2500")),
-        "validator": int(os.getenv("MAX_TOKENS_VALIDATOR", "1800")),
-        "generic": int(os.getenv("MAX_TOKENS_DEFAULT", "2000")),
-    }
-    max_tokens = max_tokens or default_max.get(task_type, 2000)
-    '''
+    if provider == "groq" and HAS_GROQ:
+        model_name = model_name or os.getenv("GROQ_MODEL", "openai/gpt-oss-120b")
+    else:
+        provider = "openai"
+        model_name = model_name or os.getenv("OPENAI_MODEL", "gpt-5")
+
     # --- Inicialización segura ---
     try:
-        if provider == "groq" and HAS_GROQ:
-            api_key = os.getenv("GROQ_API_KEY")
-            model_name = model_name or os.getenv("GROQ_MODEL", "openai/gpt-oss-120b")
-            if not api_key:
-                raise ValueError("Falta GROQ_API_KEY en .env")
-            print(f"[LLM Client] Usando Groq model={model_name}")
-            return ChatGroq(model=model_name, api_key=api_key, temperature=temperature)
-
-        # Fallback predeterminado: OpenAI
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("Falta OPENAI_API_KEY en .env")
-        print(f"[LLM Client] Usando OpenAI model={model_name}")
-        return ChatOpenAI(model=model_name, api_key=api_key, temperature=temperature, max_tokens=max_tokens)
+        client = _get_client(provider, model_name, temperature, max_tokens)
+        return LLMHandle(client, provider, model_name, task_type, temperature, max_tokens, cache=response_cache)
 
     except Exception as e:
         # Fallback automático → OpenAI si algo falla
         print(f"[LLM Client] ⚠️ Error al cargar {provider}: {e}. Usando fallback OpenAI.")
-        fallback_api = os.getenv("OPENAI_API_KEY")
-        return ChatOpenAI(
-            model=os.getenv("OPENAI_MODEL", "gpt-5"),
-            api_key=fallback_api,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
+        fallback_model = os.getenv("OPENAI_MODEL", "gpt-5")
+        client = _get_client("openai", fallback_model, temperature, max_tokens)
+        return LLMHandle(client, "openai", fallback_model, task_type, temperature, max_tokens, cache=response_cache)
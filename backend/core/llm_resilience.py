@@ -0,0 +1,344 @@
+"""
+LLM Resilience
+--------------
+Envoltorio de invocación compartido por todas las llamadas LLM (lo aplica `LLMHandle`).
+
+✔️ Reintentos con backoff exponencial con jitter ("full jitter") en errores reintentables
+   (429, timeouts, errores de conexión y 5xx).
+✔️ Respeta la cabecera `Retry-After` / `retry-after-ms` del proveedor.
+✔️ Circuit breaker por proveedor: tras N fallos seguidos se abre durante un tiempo y las
+   llamadas pasan directamente al proveedor alternativo (failover openai ⇄ groq).
+✔️ Deadline por llamada: el total de intentos + esperas nunca supera LLM_CALL_DEADLINE_SECONDS.
+✔️ Métricas de fallos, reintentos, failovers y estado de los circuitos en /metrics.
+
+Los errores no reintentables (400, 401, 404…) se propagan sin reintentar ni contar para el circuito.
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from backend.core.metrics import LLM_CALL_FAILURES, LLM_RETRIES, LLM_FAILOVERS, LLM_CIRCUIT_STATE
+
+# --- Config (tuneable vía .env) ---
+LLM_RETRY_MAX_ATTEMPTS = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "3"))
+LLM_RETRY_BASE_DELAY_MS = float(os.getenv("LLM_RETRY_BASE_DELAY_MS", "500"))
+LLM_RETRY_MAX_DELAY_MS = float(os.getenv("LLM_RETRY_MAX_DELAY_MS", "20000"))
+LLM_CALL_DEADLINE_SECONDS = float(os.getenv("LLM_CALL_DEADLINE_SECONDS", "120"))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+LLM_FAILOVER_ENABLED = os.getenv("LLM_FAILOVER_ENABLED", "true").lower() == "true"
+# Proveedor de failover; vacío → el otro de openai/groq
+LLM_FAILOVER_PROVIDER = os.getenv("LLM_FAILOVER_PROVIDER", "").lower()
+
+_CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+_failover_suppressed: ContextVar[bool] = ContextVar("llm_failover_suppressed", default=False)
+
+
+class CircuitOpenError(RuntimeError):
+    """El circuito del proveedor está abierto: no se intenta la llamada."""
+
+
+class DeadlineExceededError(TimeoutError):
+    """Se agotó el deadline de la llamada (intentos + esperas)."""
+
+
+def call_deadline_seconds(task_type: str) -> float:
+    """Deadline por tarea: LLM_CALL_DEADLINE_SECONDS_<TASK> o el global."""
+    specific = os.getenv(f"LLM_CALL_DEADLINE_SECONDS_{task_type.upper()}")
+    return float(specific) if specific is not None else LLM_CALL_DEADLINE_SECONDS
+
+
+def failover_provider(provider: str) -> Optional[str]:
+    if not LLM_FAILOVER_ENABLED or provider == "fake":
+        return None
+    alternate = LLM_FAILOVER_PROVIDER or {"openai": "groq", "groq": "openai"}.get(provider)
+    return alternate if alternate and alternate != provider else None
+
+
+# ============================================================
+#   Clasificación de errores
+# ============================================================
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(exc: BaseException) -> str:
+    """rate_limit | timeout | connection | server_error | deadline | circuit_open | client_error | other"""
+    if isinstance(exc, DeadlineExceededError):
+        return "deadline"
+    if isinstance(exc, CircuitOpenError):
+        return "circuit_open"
+    status = _status_code(exc)
+    if status == 429:
+        return "rate_limit"
+    if status is not None and status >= 500:
+        return "server_error"
+    if status == 408:
+        return "timeout"
+    name = type(exc).__name__
+    # Mismos nombres en los SDK de OpenAI y Groq
+    if isinstance(exc, (asyncio.TimeoutError, httpx.TimeoutException)) or name == "APITimeoutError":
+        return "timeout"
+    if isinstance(exc, httpx.TransportError) or name == "APIConnectionError":
+        return "connection"
+    if status is not None:
+        return "client_error"
+    return "other"
+
+
+def is_retryable(exc: BaseException) -> bool:
+    return classify_error(exc) in ("rate_limit", "timeout", "connection", "server_error")
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Segundos indicados por el proveedor en Retry-After / retry-after-ms (None si no hay)."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def backoff_delay(attempt: int, base_ms: float = None, max_ms: float = None) -> float:
+    """Full jitter: uniforme en [0, min(max, base·2^attempt)] (segundos)."""
+    base_ms = LLM_RETRY_BASE_DELAY_MS if base_ms is None else base_ms
+    max_ms = LLM_RETRY_MAX_DELAY_MS if max_ms is None else max_ms
+    return random.uniform(0, min(max_ms, base_ms * (2 ** attempt))) / 1000
+
+
+# ============================================================
+#   Circuit breaker por proveedor
+# ============================================================
+class CircuitBreaker:
+    """
+    closed → (N fallos seguidos) → open → (reset_seconds) → half_open
+    half_open deja pasar una llamada de prueba: éxito → closed, fallo → open.
+    """
+
+    def __init__(self, provider: str, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.provider = provider
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._publish()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+            self._publish()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probe_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._probe_in_flight:
+                    print(f"🔌 [LLMResilience] Circuito de {self.provider} abierto tras {self.failures} fallo(s)")
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+            self._publish()
+
+    def release(self) -> None:
+        """Libera la llamada de prueba si se canceló sin resultado (p.ej. perdedora de un hedge)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _publish(self) -> None:
+        LLM_CIRCUIT_STATE.set(_CIRCUIT_STATES[self.state], provider=self.provider)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(provider)
+        return breaker
+
+
+def reset_breakers() -> None:
+    """Cierra y olvida todos los circuitos (tests)."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+# ============================================================
+#   Invocación con reintentos, circuito y failover
+# ============================================================
+def _settle_non_retryable(breaker: "CircuitBreaker", exc: BaseException) -> None:
+    """
+    Error no reintentable: un client_error prueba que el proveedor respondió (cierra el circuito);
+    el resto ("other": SDK, parseo…) no demuestra nada y solo libera la llamada de prueba.
+    """
+    if classify_error(exc) == "client_error":
+        breaker.record_success()
+    else:
+        breaker.release()
+
+
+def _record_failure(exc: BaseException, provider: str, task_type: str) -> str:
+    reason = classify_error(exc)
+    LLM_CALL_FAILURES.inc(provider=provider, task_type=task_type, reason=reason)
+    return reason
+
+
+async def call_with_retries(call: Callable[[], Awaitable[Any]], provider: str, task_type: str,
+                            deadline: float, max_attempts: int = None) -> Any:
+    """
+    Ejecuta `call` con reintentos hasta `deadline` (time.monotonic()).
+    Solo los errores reintentables cuentan para el circuito del proveedor.
+    """
+    breaker = get_breaker(provider)
+    max_attempts = max(1, LLM_RETRY_MAX_ATTEMPTS if max_attempts is None else max_attempts)
+    for attempt in range(max_attempts):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            exc = DeadlineExceededError(f"Deadline agotado antes del intento {attempt + 1} ({provider})")
+            _record_failure(exc, provider, task_type)
+            raise exc
+        if not breaker.allow():
+            exc = CircuitOpenError(f"Circuito de {provider} abierto")
+            _record_failure(exc, provider, task_type)
+            raise exc
+        # asyncio.timeout (no wait_for): la llamada sigue en la tarea actual y conserva su contexto
+        timeout = asyncio.timeout(remaining)
+        try:
+            async with timeout:
+                result = await call()
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            if timeout.expired():
+                breaker.record_failure()
+                exc = DeadlineExceededError(f"Deadline agotado durante la llamada a {provider}")
+                _record_failure(exc, provider, task_type)
+                raise exc from e
+            _record_failure(e, provider, task_type)
+            if not is_retryable(e):
+                _settle_non_retryable(breaker, e)
+                raise
+            breaker.record_failure()
+            if attempt == max_attempts - 1:
+                raise
+            delay = retry_after_seconds(e)
+            delay = backoff_delay(attempt) if delay is None else delay
+            if time.monotonic() + delay >= deadline:
+                raise
+            LLM_RETRIES.inc(provider=provider, task_type=task_type)
+            print(f"🔁 [LLMResilience] {provider}/{task_type}: {classify_error(e)}; reintento {attempt + 2}/{max_attempts} en {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+def call_with_retries_sync(call: Callable[[], Any], provider: str, task_type: str,
+                           deadline: float, max_attempts: int = None) -> Any:
+    """Variante síncrona (el deadline solo se comprueba entre intentos)."""
+    breaker = get_breaker(provider)
+    max_attempts = max(1, LLM_RETRY_MAX_ATTEMPTS if max_attempts is None else max_attempts)
+    for attempt in range(max_attempts):
+        if time.monotonic() >= deadline:
+            exc = DeadlineExceededError(f"Deadline agotado antes del intento {attempt + 1} ({provider})")
+            _record_failure(exc, provider, task_type)
+            raise exc
+        if not breaker.allow():
+            exc = CircuitOpenError(f"Circuito de {provider} abierto")
+            _record_failure(exc, provider, task_type)
+            raise exc
+        try:
+            result = call()
+        except Exception as e:
+            _record_failure(e, provider, task_type)
+            if not is_retryable(e):
+                _settle_non_retryable(breaker, e)
+                raise
+            breaker.record_failure()
+            delay = retry_after_seconds(e)
+            delay = backoff_delay(attempt) if delay is None else delay
+            if attempt == max_attempts - 1 or time.monotonic() + delay >= deadline:
+                raise
+            LLM_RETRIES.inc(provider=provider, task_type=task_type)
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+@contextmanager
+def suppress_failover(active: bool = True):
+    """
+    Dentro del bloque (y en las tareas creadas en él) LLMHandle no hace failover:
+    lo usa HedgedLLM, que ya lanza la misma petición al proveedor alternativo.
+    """
+    token = _failover_suppressed.set(active)
+    try:
+        yield
+    finally:
+        _failover_suppressed.reset(token)
+
+
+def should_failover(exc: BaseException) -> bool:
+    if _failover_suppressed.get():
+        return False
+    return isinstance(exc, CircuitOpenError) or is_retryable(exc)
+
+
+def record_failover(from_provider: str, to_provider: str, task_type: str, exc: BaseException) -> None:
+    LLM_FAILOVERS.inc(from_provider=from_provider, to_provider=to_provider, task_type=task_type)
+    print(f"↪️ [LLMResilience] {task_type}: failover {from_provider} → {to_provider} ({classify_error(exc)})")
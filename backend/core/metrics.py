@@ -0,0 +1,328 @@
+"""
+Metrics
+-------
+Registro de métricas en proceso con exposición en formato de texto Prometheus.
+Sin dependencias externas: contadores, gauges e histogramas con etiquetas.
+
+Las métricas del pipeline se declaran al final del módulo y se importan
+desde los agentes para instrumentar cada etapa:
+
+    from backend.core.metrics import NODE_DURATION
+    with NODE_DURATION.time(node="retriever"):
+        ...
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+# Buckets pensados para latencias de LLM (de milisegundos a un par de minutos)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Iterable[str], labelvalues: Iterable[str], extra: Dict[str, str] = None) -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, labelvalues)]
+    for k, v in (extra or {}).items():
+        pairs.append(f'{k}="{_escape(v)}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: etiquetas esperadas {self.labelnames}, recibidas {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Un contador solo puede incrementarse")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], Dict[str, object]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mide el tiempo de pared del bloque (también si lanza excepción)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series["count"] if series else 0
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, series["counts"]):
+                    labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                base = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{base} {_format_value(series['sum'])}")
+                lines.append(f"{self.name}_count{base} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing  # idempotente (recargas del módulo, tests)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+# ============================================================
+#   Métricas del pipeline Mini-CELIA
+# ============================================================
+NODE_DURATION = REGISTRY.histogram(
+    "celia_orchestrator_node_duration_seconds",
+    "Tiempo de pared de cada nodo del orquestador LangGraph",
+    ["node"],
+)
+LLM_REQUESTS = REGISTRY.counter(
+    "celia_llm_requests_total",
+    "Llamadas a LLM completadas por tipo de tarea",
+    ["task_type", "model"],
+)
+LLM_PROMPT_TOKENS = REGISTRY.counter(
+    "celia_llm_prompt_tokens_total",
+    "Tokens de prompt consumidos por tipo de tarea",
+    ["task_type", "model"],
+)
+LLM_COMPLETION_TOKENS = REGISTRY.counter(
+    "celia_llm_completion_tokens_total",
+    "Tokens de respuesta generados por tipo de tarea",
+    ["task_type", "model"],
+)
+RETRIEVER_VECTOR_SEARCH_DURATION = REGISTRY.histogram(
+    "celia_retriever_vector_search_duration_seconds",
+    "Latencia de cada búsqueda vectorial del retriever por backend (atlas/local)",
+    ["backend"],
+)
+RETRIEVER_LEXICAL_SEARCH_DURATION = REGISTRY.histogram(
+    "celia_retriever_lexical_search_duration_seconds",
+    "Latencia de la búsqueda léxica ($text) de la recuperación híbrida",
+)
+RETRIEVER_ESCALATIONS = REGISTRY.counter(
+    "celia_retriever_num_candidates_escalations_total",
+    "Veces que la política aprendida del retriever amplió numCandidates",
+)
+RETRIEVER_POLICY_ADJUSTMENTS = REGISTRY.counter(
+    "celia_retriever_policy_adjustments_total",
+    "Ajustes de la política numCandidates/limit del retriever por dirección (grow/shrink)",
+    ["direction"],
+)
+VALIDATOR_REPAIRS = REGISTRY.counter(
+    "celia_validator_repair_attempts_total",
+    "Intentos de reparación automática de JSON_A por resultado",
+    ["result"],
+)
+GENERATION_CACHE_LOOKUPS = REGISTRY.counter(
+    "celia_generation_cache_lookups_total",
+    "Consultas a la caché de generación por resultado (hit/miss/bypass/error)",
+    ["result"],
+)
+LLM_CACHE_LOOKUPS = REGISTRY.counter(
+    "celia_llm_cache_lookups_total",
+    "Consultas a la caché de respuestas LLM por tarea y resultado (hit_memory/hit_persistent/miss/bypass)",
+    ["task_type", "result"],
+)
+LLM_HEDGE_REQUESTS = REGISTRY.counter(
+    "celia_llm_hedge_requests_total",
+    "Peticiones hedged por tarea y resultado (primary_only/primary_won/secondary_won/none_accepted/all_failed)",
+    ["task_type", "outcome"],
+)
+LLM_HEDGE_LATENCY = REGISTRY.histogram(
+    "celia_llm_hedge_winner_latency_seconds",
+    "Latencia de la respuesta ganadora de una petición hedged por proveedor",
+    ["task_type", "provider"],
+)
+LLM_CALL_FAILURES = REGISTRY.counter(
+    "celia_llm_call_failures_total",
+    "Fallos de llamadas LLM por proveedor, tarea y motivo (rate_limit/timeout/connection/server_error/deadline/circuit_open/…)",
+    ["provider", "task_type", "reason"],
+)
+LLM_RETRIES = REGISTRY.counter(
+    "celia_llm_retries_total",
+    "Reintentos de llamadas LLM tras un error reintentable",
+    ["provider", "task_type"],
+)
+LLM_LENGTH_RETRIES = REGISTRY.counter(
+    "celia_llm_length_retries_total",
+    "Respuestas LLM cortadas por max_tokens (finish_reason=length) y repetidas con más margen",
+    ["task_type", "model"],
+)
+LLM_FAILOVERS = REGISTRY.counter(
+    "celia_llm_failovers_total",
+    "Llamadas LLM desviadas al proveedor alternativo",
+    ["from_provider", "to_provider", "task_type"],
+)
+LLM_CIRCUIT_STATE = REGISTRY.gauge(
+    "celia_llm_circuit_state",
+    "Estado del circuit breaker por proveedor (0=closed, 1=half_open, 2=open)",
+    ["provider"],
+)
+LLM_RATE_LIMIT_QUEUE_DEPTH = REGISTRY.gauge(
+    "celia_llm_rate_limit_queue_depth",
+    "Llamadas LLM esperando turno en el limitador RPM/TPM",
+    ["provider", "model"],
+)
+LLM_RATE_LIMIT_WAIT = REGISTRY.histogram(
+    "celia_llm_rate_limit_wait_seconds",
+    "Tiempo de espera en el limitador RPM/TPM antes de llamar al proveedor",
+    ["provider", "model"],
+)
+GENERATOR_A_OUTPUTS = REGISTRY.counter(
+    "celia_generator_a_outputs_total",
+    "Generaciones de JSON_A por modo de salida (structured/text/text_fallback)",
+    ["mode"],
+)
+EMBEDDING_BATCH_SIZE = REGISTRY.histogram(
+    "celia_embedding_batch_size",
+    "Consultas agrupadas en cada llamada encode del modelo de embeddings",
+    ["model"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+EMBEDDING_QUEUE_WAIT = REGISTRY.histogram(
+    "celia_embedding_queue_wait_seconds",
+    "Espera de una consulta en la cola del micro-batcher de embeddings",
+    ["model"],
+)
+EMBEDDING_ENCODE_DURATION = REGISTRY.histogram(
+    "celia_embedding_encode_duration_seconds",
+    "Duración de cada llamada encode por lotes del modelo de embeddings",
+    ["model"],
+)
+QUERY_EMBEDDING_CACHE_LOOKUPS = REGISTRY.counter(
+    "celia_query_embedding_cache_lookups_total",
+    "Consultas a la caché de embeddings de consultas por modelo y resultado (hit/miss)",
+    ["model", "result"],
+)
+QUERY_EMBEDDING_CACHE_SIZE = REGISTRY.gauge(
+    "celia_query_embedding_cache_entries",
+    "Embeddings de consultas guardados en la caché LRU del proceso",
+)
+RERANK_DURATION = REGISTRY.histogram(
+    "celia_retriever_rerank_duration_seconds",
+    "Tiempo de la etapa de rerank (cross-encoder) del retriever por resultado",
+    ["outcome"],
+)
+RERANK_OUTCOMES = REGISTRY.counter(
+    "celia_retriever_rerank_total",
+    "Reranks del retriever por resultado (ok/timeout/busy/error/unavailable/skipped)",
+    ["outcome"],
+)
+RETRIEVER_CONTEXT_TOKENS = REGISTRY.counter(
+    "celia_retriever_context_tokens_total",
+    "Tokens del contexto RAG: enviados (packed) y ahorrados (saved) por el empaquetado MMR",
+    ["kind"],
+)
+RETRIEVAL_CACHE_LOOKUPS = REGISTRY.counter(
+    "celia_retrieval_cache_lookups_total",
+    "Consultas a la caché de resultados del retriever por resultado (hit/miss/bypass)",
+    ["result"],
+)
@@ -0,0 +1,182 @@
+"""
+LLM Rate Limiter
+----------------
+Limitador de ritmo por proceso, por (proveedor, modelo), para no disparar los
+límites RPM/TPM de OpenAI y Groq bajo carga.
+
+✔️ Dos token buckets: peticiones por minuto (RPM) y tokens estimados por minuto (TPM).
+✔️ Cola FIFO: las llamadas esperan su turno en orden de llegada (sin inanición).
+✔️ Coste estimado = tokens del prompt + max_tokens; se devuelve la diferencia
+   cuando el proveedor informa del consumo real.
+✔️ Profundidad de la cola y tiempo de espera en /metrics.
+✔️ Lo aplica `LLMHandle` antes de cada intento: cubre refinador, generadores y reparación.
+
+Límites (0 o vacío = sin límite):
+    LLM_RATE_LIMIT_RPM_<PROVIDER>            p.ej. LLM_RATE_LIMIT_RPM_OPENAI=500
+    LLM_RATE_LIMIT_TPM_<PROVIDER>            p.ej. LLM_RATE_LIMIT_TPM_GROQ=60000
+    LLM_RATE_LIMIT_RPM_<PROVIDER>__<MODEL>   por modelo (no alfanuméricos → "_"),
+                                             p.ej. LLM_RATE_LIMIT_TPM_GROQ__OPENAI_GPT_OSS_120B
+"""
+
+import os
+import re
+import time
+import asyncio
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+
+from backend.core.metrics import LLM_RATE_LIMIT_QUEUE_DEPTH, LLM_RATE_LIMIT_WAIT
+
+# --- Config (tuneable vía .env) ---
+LLM_RATE_LIMIT_ENABLED = os.getenv("LLM_RATE_LIMIT_ENABLED", "true").lower() == "true"
+_DEFAULT_LIMITS = {
+    "openai": {"RPM": 500, "TPM": 200000},
+    "groq": {"RPM": 30, "TPM": 60000},
+}
+
+
+def _env_name(value: str) -> str:
+    return re.sub(r"[^A-Z0-9]", "_", value.upper())
+
+
+def configured_limit(kind: str, provider: str, model: str) -> float:
+    """Límite `kind` (RPM|TPM) para el modelo: por modelo > por proveedor > valor por defecto."""
+    for name in (f"LLM_RATE_LIMIT_{kind}_{_env_name(provider)}__{_env_name(model)}",
+                 f"LLM_RATE_LIMIT_{kind}_{_env_name(provider)}"):
+        value = os.getenv(name)
+        if value not in (None, ""):
+            return float(value)
+    return float(_DEFAULT_LIMITS.get(provider, {}).get(kind, 0))
+
+
+class TokenBucket:
+    """Bucket de capacidad `per_minute` que se rellena de forma continua."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Segundos hasta disponer de `amount` (0 si ya hay)."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate) if missing > 0 else 0.0
+
+    def consume(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Limitador RPM/TPM de un (proveedor, modelo). El estado de los buckets se
+    protege con un lock de hilo; el orden de llegada, con un lock FIFO por event loop
+    (asyncio.Lock despierta a los que esperan en orden).
+    """
+
+    def __init__(self, provider: str, model: str, rpm: float = 0, tpm: float = 0):
+        self.provider = provider
+        self.model = model
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.waiting = 0
+        self._state_lock = threading.Lock()
+        self._sync_fifo = threading.Lock()
+        self._async_fifo: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+    def _reserve(self, tokens: float) -> float:
+        """Consume 1 petición + `tokens` si hay saldo; si no, devuelve los segundos a esperar."""
+        with self._state_lock:
+            now = time.monotonic()
+            wait = max(
+                self.requests.wait_time(1, now) if self.requests else 0.0,
+                self.tokens.wait_time(tokens, now) if self.tokens else 0.0,
+            )
+            if wait > 0:
+                return wait
+            if self.requests:
+                self.requests.consume(1)
+            if self.tokens:
+                self.tokens.consume(tokens)
+            return 0.0
+
+    def _fifo(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        lock = self._async_fifo.get(loop)
+        if lock is None:
+            lock = self._async_fifo[loop] = asyncio.Lock()
+        return lock
+
+    def _enter(self) -> float:
+        with self._state_lock:
+            self.waiting += 1
+        LLM_RATE_LIMIT_QUEUE_DEPTH.inc(provider=self.provider, model=self.model)
+        return time.perf_counter()
+
+    def _exit(self, started: float) -> None:
+        with self._state_lock:
+            self.waiting -= 1
+        LLM_RATE_LIMIT_QUEUE_DEPTH.dec(provider=self.provider, model=self.model)
+        LLM_RATE_LIMIT_WAIT.observe(time.perf_counter() - started, provider=self.provider, model=self.model)
+
+    async def acquire(self, tokens: float = 0) -> float:
+        """Espera turno y saldo; devuelve los segundos esperados."""
+        started = self._enter()
+        try:
+            async with self._fifo():
+                while (wait := self._reserve(tokens)) > 0:
+                    await asyncio.sleep(wait)
+        finally:
+            self._exit(started)
+        return time.perf_counter() - started
+
+    def acquire_sync(self, tokens: float = 0) -> float:
+        started = self._enter()
+        try:
+            with self._sync_fifo:
+                while (wait := self._reserve(tokens)) > 0:
+                    time.sleep(wait)
+        finally:
+            self._exit(started)
+        return time.perf_counter() - started
+
+    def settle(self, estimated: float, actual: Optional[float]) -> None:
+        """Devuelve al bucket TPM los tokens estimados de más (consumo real informado por el proveedor)."""
+        if self.tokens and actual is not None and actual < estimated:
+            with self._state_lock:
+                self.tokens.refund(estimated - actual)
+
+
+# ============================================================
+#   Registro de proceso
+# ============================================================
+_limiters: Dict[Tuple[str, str], Optional[RateLimiter]] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: str) -> Optional[RateLimiter]:
+    """Limitador compartido del (proveedor, modelo); None si no hay límites configurados."""
+    if not LLM_RATE_LIMIT_ENABLED:
+        return None
+    key = (provider, model)
+    with _limiters_lock:
+        if key not in _limiters:
+            rpm = configured_limit("RPM", provider, model)
+            tpm = configured_limit("TPM", provider, model)
+            _limiters[key] = RateLimiter(provider, model, rpm, tpm) if (rpm > 0 or tpm > 0) else None
+        return _limiters[key]
+
+
+def reset_rate_limiters() -> None:
+    """Olvida los limitadores (tests o cambio de configuración)."""
+    with _limiters_lock:
+        _limiters.clear()
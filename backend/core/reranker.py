@@ -0,0 +1,156 @@
+"""
+Cross-Encoder Reranker
+----------------------
+Etapa opcional de rerank del RetrieverAgent con un cross-encoder pequeño en CPU.
+
+✔️ El retriever sobre-captura RERANK_CANDIDATES candidatos y se puntúan todos en una
+   sola llamada por lotes (pares consulta–chunk).
+✔️ Se conservan los RERANK_TOP_K mejores: menos chunks por prompt con mejor precisión.
+✔️ Presupuesto de latencia duro (RERANK_BUDGET_MS): si se supera, o el modelo está ocupado
+   con una petición anterior, se sigue con el orden vectorial sin esperar.
+✔️ El modelo se carga (perezosamente o en el warmup) desde SENTENCE_TRANSFORMERS_HOME.
+✔️ Tiempo de rerank y resultado (ok/timeout/busy/error/unavailable) en /metrics.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.core.metrics import RERANK_DURATION, RERANK_OUTCOMES
+
+# --- Config (tuneable vía .env) ---
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+# Multilingüe (el corpus está en español); cualquier CrossEncoder de sentence-transformers sirve
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+# Chunks que se conservan tras el rerank (0 = el `limit` de la política del retriever)
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "0"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "250"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+LOCAL_CACHE_DIR = os.getenv("SENTENCE_TRANSFORMERS_HOME", "./models_cache")
+
+
+def rerank_enabled(override: Optional[bool] = None) -> bool:
+    """Preferencia por petición (`rerank`) o RERANK_ENABLED."""
+    return RERANK_ENABLED if override is None else bool(override)
+
+
+class CrossEncoderReranker:
+    """
+    Reranker con un hilo propio: como mucho una puntuación en curso, de modo que una
+    petición que agotó su presupuesto no retrasa a las siguientes (que saltan el rerank).
+    """
+
+    def __init__(self, model=None, model_name: str = RERANK_MODEL, budget_ms: float = RERANK_BUDGET_MS,
+                 batch_size: int = RERANK_BATCH_SIZE):
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self._model = model
+        self._load_error: Optional[str] = None
+        self._load_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._inflight: Optional[Future] = None
+
+    # ---------------- Modelo ----------------
+    def load(self):
+        """Carga el cross-encoder (una vez); None si no está disponible."""
+        with self._load_lock:
+            if self._model is None and self._load_error is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+
+                    self._model = CrossEncoder(self.model_name, cache_folder=LOCAL_CACHE_DIR, device="cpu",
+                                               max_length=RERANK_MAX_LENGTH)
+                    print(f"[Reranker] Modelo cargado: {self.model_name}")
+                except Exception as e:
+                    self._load_error = f"{type(e).__name__}: {e}"
+                    print(f"⚠️ [Reranker] No se pudo cargar {self.model_name}; se usa el orden vectorial: {e}")
+            return self._model
+
+    async def warmup(self) -> None:
+        """Carga y primera inferencia en el hilo del reranker (sin modelo se sigue sin rerank)."""
+        try:
+            await asyncio.wrap_future(self._executor.submit(self._score, "warmup", ["warmup"]))
+        except Exception:
+            pass  # ya avisado en load(); las peticiones usarán el orden vectorial
+
+    def _score(self, query: str, texts: List[str]) -> List[float]:
+        model = self.load()
+        if model is None:
+            raise RuntimeError(self._load_error or "reranker no disponible")
+        scores = model.predict([(query, t) for t in texts], batch_size=self.batch_size, show_progress_bar=False)
+        return [float(s) for s in scores]
+
+    # ---------------- Rerank ----------------
+    async def rerank(self, query: str, candidates: List[Dict[str, Any]],
+                     top_k: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Reordena `candidates` por relevancia (campo `rerank_score`) y devuelve los `top_k` primeros.
+        Si se agota el presupuesto o falla, devuelve los candidatos en su orden original.
+        """
+        started = time.perf_counter()
+        texts = [(c.get("text") or "").strip() for c in candidates]
+        info: Dict[str, Any] = {"model": self.model_name, "candidates": len(candidates), "budget_ms": self.budget_ms}
+
+        if not candidates:
+            return candidates, self._finish(info, "skipped", started)
+        if self._load_error is not None:
+            return candidates, self._finish(info, "unavailable", started)
+        if self._inflight is not None and not self._inflight.done():
+            return candidates, self._finish(info, "busy", started)
+
+        future = self._executor.submit(self._score, query, texts)
+        self._inflight = future
+        try:
+            async with asyncio.timeout(self.budget_ms / 1000):
+                scores = await asyncio.shield(asyncio.wrap_future(future))
+        except TimeoutError:
+            return candidates, self._finish(info, "timeout", started)
+        except Exception as e:
+            info["error"] = f"{type(e).__name__}: {e}"
+            outcome = "unavailable" if self._load_error is not None else "error"
+            return candidates, self._finish(info, outcome, started)
+
+        ranked = sorted(
+            ({**c, "rerank_score": s} for c, s in zip(candidates, scores)),
+            key=lambda c: c["rerank_score"], reverse=True,
+        )
+        if top_k:
+            ranked = ranked[:top_k]
+        info["kept"] = len(ranked)
+        return ranked, self._finish(info, "ok", started)
+
+    @staticmethod
+    def _finish(info: Dict[str, Any], outcome: str, started: float) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - started
+        RERANK_OUTCOMES.inc(outcome=outcome)
+        RERANK_DURATION.observe(elapsed, outcome=outcome)
+        info.update({"status": outcome, "latency_ms": round(elapsed * 1000, 1)})
+        return info
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ============================================================
+#   Runtime de proceso
+# ============================================================
+_reranker: Optional[CrossEncoderReranker] = None
+
+
+def get_reranker() -> CrossEncoderReranker:
+    global _reranker
+    if _reranker is None:
+        _reranker = CrossEncoderReranker()
+    return _reranker
+
+
+def set_reranker(reranker: Optional[CrossEncoderReranker]) -> None:
+    """Sustituye el reranker del proceso (tests y benchmarks)."""
+    global _reranker
+    _reranker = reranker
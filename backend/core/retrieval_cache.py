@@ -0,0 +1,188 @@
+"""
+Retrieval Cache
+---------------
+Caché de resultados del RetrieverAgent: la misma normativa se recupera una y otra vez
+para secciones parecidas de distintos expedientes.
+
+✔️ Clave = embedding de la consulta (exacto o cuantizado a int8) + k, numCandidates, limit,
+   filtros, modo de recuperación, rerank, backend y versión del corpus.
+✔️ La versión del corpus (`corpus_versions`) la sube la ingesta al cambiar `embeddings`:
+   las entradas de la versión anterior dejan de coincidir y se descartan. Por defecto se
+   lee en cada consulta (un find_one en Mongo, acotado por RETRIEVAL_CACHE_VERSION_TIMEOUT_MS),
+   así la invalidación es inmediata aunque la ingesta corra en otro proceso.
+   RETRIEVAL_CACHE_VERSION_REFRESH_SECONDS > 0 la relee en segundo plano y ahorra esa
+   consulta a cambio de servir la versión anterior hasta ese número de segundos.
+✔️ LRU acotado con caducidad por entrada (RETRIEVAL_CACHE_TTL_SECONDS).
+✔️ Un acierto no toca Atlas: ni búsqueda vectorial, ni léxica, ni rerank.
+✔️ Aciertos/fallos en /metrics. Si no se puede leer la versión del corpus no se cachea.
+✔️ El retriever no guarda resultados degradados (rerank en timeout/busy/error, léxica caída).
+"""
+
+import asyncio
+import copy
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.core.logic_jn import sha256_hex
+from backend.core.metrics import RETRIEVAL_CACHE_LOOKUPS
+from backend.database.corpus_repository import get_corpus_version
+
+# --- Config (tuneable vía .env) ---
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+RETRIEVAL_CACHE_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_ENTRIES", "1024"))
+RETRIEVAL_CACHE_TTL_SECONDS = int(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "3600"))
+# exact → bytes del embedding; int8 → embedding normalizado y cuantizado (consultas casi idénticas comparten clave)
+RETRIEVAL_CACHE_KEY = os.getenv("RETRIEVAL_CACHE_KEY", "exact").lower()
+# Corpus cuya versión invalida la caché (la que sube process_normativa_global)
+RETRIEVAL_CACHE_CORPUS = os.getenv("RETRIEVAL_CACHE_CORPUS", "normativa")
+# Cada cuántos segundos se relee la versión del corpus en segundo plano
+# (0 = en cada consulta, esperándola: invalidación inmediata a costa de un find_one por consulta)
+RETRIEVAL_CACHE_VERSION_REFRESH_SECONDS = float(os.getenv("RETRIEVAL_CACHE_VERSION_REFRESH_SECONDS", "0"))
+# Espera máxima de esa lectura: si Mongo tarda más se recupera sin caché
+RETRIEVAL_CACHE_VERSION_TIMEOUT_MS = float(os.getenv("RETRIEVAL_CACHE_VERSION_TIMEOUT_MS", "250"))
+
+
+def embedding_fingerprint(query_embedding: Sequence[float], mode: str = RETRIEVAL_CACHE_KEY) -> str:
+    """Huella del embedding de la consulta: exacta (float32) o cuantizada a int8."""
+    vector = np.asarray(query_embedding, dtype=np.float32)
+    if mode == "int8":
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        data = np.clip(np.rint(vector * 127), -127, 127).astype(np.int8).tobytes()
+    else:
+        data = vector.tobytes()
+    return hashlib.sha256(data).hexdigest()
+
+
+class RetrievalCache:
+    """LRU con TTL de respuestas del retriever, invalidado por la versión del corpus."""
+
+    def __init__(
+        self,
+        max_entries: int = RETRIEVAL_CACHE_ENTRIES,
+        ttl_seconds: float = RETRIEVAL_CACHE_TTL_SECONDS,
+        key_mode: str = RETRIEVAL_CACHE_KEY,
+        corpus_version_fn: Callable[[str], Awaitable[str]] = get_corpus_version,
+        corpus: str = RETRIEVAL_CACHE_CORPUS,
+        version_refresh_seconds: float = RETRIEVAL_CACHE_VERSION_REFRESH_SECONDS,
+        version_timeout_ms: float = RETRIEVAL_CACHE_VERSION_TIMEOUT_MS,
+        enabled: bool = RETRIEVAL_CACHE_ENABLED,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.key_mode = key_mode
+        self.corpus_version_fn = corpus_version_fn
+        self.corpus = corpus
+        self.version_refresh_seconds = version_refresh_seconds
+        self.version_timeout_ms = version_timeout_ms
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float, float]]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._version_checked: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    # ---------------- Versión del corpus ----------------
+    async def refresh_version(self) -> Optional[str]:
+        """Relee la versión del corpus; None si no se puede leer (entonces no se cachea)."""
+        try:
+            async with asyncio.timeout(self.version_timeout_ms / 1000):
+                version = await self.corpus_version_fn(self.corpus)
+        except Exception as e:
+            print(f"⚠️ [RetrievalCache] Versión del corpus no disponible, no se cachea: {type(e).__name__}: {e}")
+            version = None
+        if version != self._version:
+            self._entries.clear()  # las entradas de otra versión ya no pueden acertar
+        self._version, self._version_checked = version, time.monotonic()
+        return version
+
+    async def corpus_version(self) -> Optional[str]:
+        """
+        Última versión conocida. Si ha caducado se relee en segundo plano: la primera consulta
+        tras arrancar (o tras un fallo) no se cachea, pero ninguna espera a Mongo.
+        """
+        if self.version_refresh_seconds <= 0:
+            return await self.refresh_version()
+        now = time.monotonic()
+        stale = self._version_checked is None or now - self._version_checked >= self.version_refresh_seconds
+        if stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._version_checked = now  # una sola relectura en vuelo
+            self._refresh_task = asyncio.get_running_loop().create_task(self.refresh_version())
+        return self._version
+
+    def key(self, query_embedding: Sequence[float], corpus_version: str, **params: Any) -> str:
+        return sha256_hex({
+            "embedding": embedding_fingerprint(query_embedding, self.key_mode),
+            "key_mode": self.key_mode,
+            "corpus": self.corpus,
+            "corpus_version": corpus_version,
+            **params,
+        })
+
+    # ---------------- Consulta / guardado ----------------
+    async def lookup(self, query_embedding: Sequence[float], **params: Any) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Devuelve (clave, resultado cacheado). Clave None = no cachear esta consulta
+        (caché desactivada o versión del corpus desconocida).
+        """
+        if not self.enabled:
+            return None, None
+        corpus_version = await self.corpus_version()
+        if corpus_version is None:
+            RETRIEVAL_CACHE_LOOKUPS.inc(result="bypass")
+            return None, None
+
+        key = self.key(query_embedding, corpus_version, **params)
+        item = self._entries.get(key)
+        if item is not None and item[1] < time.monotonic():
+            del self._entries[key]
+            item = None
+        if item is None:
+            RETRIEVAL_CACHE_LOOKUPS.inc(result="miss")
+            return key, None
+
+        self._entries.move_to_end(key)
+        RETRIEVAL_CACHE_LOOKUPS.inc(result="hit")
+        result, _, stored_at = item
+        result = copy.deepcopy(result)
+        result["debug"] = {**(result.get("debug") or {}),
+                           "cache": {"hit": True, "age_s": round(time.monotonic() - stored_at, 1)}}
+        return key, result
+
+    def store(self, key: Optional[str], result: Dict[str, Any]) -> None:
+        """Guarda una respuesta correcta del retriever bajo `key` (de `lookup`)."""
+        if key is None or not self.enabled or (result or {}).get("status") != "ok":
+            return
+        now = time.monotonic()
+        self._entries[key] = (copy.deepcopy(result), now + self.ttl_seconds, now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# ============================================================
+#   Runtime de proceso
+# ============================================================
+_retrieval_cache: Optional[RetrievalCache] = None
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    global _retrieval_cache
+    if _retrieval_cache is None:
+        _retrieval_cache = RetrievalCache()
+    return _retrieval_cache
+
+
+def set_retrieval_cache(cache: Optional[RetrievalCache]) -> None:
+    """Sustituye la caché del proceso (tests y benchmarks)."""
+    global _retrieval_cache
+    _retrieval_cache = cache
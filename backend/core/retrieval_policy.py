@@ -0,0 +1,213 @@
+"""
+Retrieval Policy
+----------------
+Política aprendida de `numCandidates` / `limit` para la búsqueda vectorial, por corpus.
+
+✔️ Una sola agregación $vectorSearch por consulta: se piden `limit × VSEARCH_OVERFETCH_FACTOR`
+   resultados y la selección final (y el recorte del contexto) se hace en el cliente.
+✔️ Tras cada consulta se registra la calidad observada (contexto corto, resultados sin usar,
+   score medio) con medias móviles exponenciales.
+✔️ Si el contexto sale corto con frecuencia se amplían `limit` y `numCandidates`;
+   si sobran resultados de forma sostenida se reducen (siempre dentro de los límites configurados).
+✔️ La política se guarda en la colección `retrieval_policies` cada RETRIEVAL_POLICY_SAVE_EVERY
+   observaciones y se recupera al arrancar.
+
+Sustituye a la antigua "calibración automática", que repetía la agregación con 1.5× numCandidates.
+"""
+
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from backend.core.metrics import RETRIEVER_ESCALATIONS, RETRIEVER_POLICY_ADJUSTMENTS
+from backend.database.mongo import get_collection
+
+# --- Config (tuneable vía .env) ---
+RETRIEVAL_POLICY_ENABLED = os.getenv("RETRIEVAL_POLICY_ENABLED", "true").lower() == "true"
+RETRIEVAL_POLICY_BACKEND = os.getenv("RETRIEVAL_POLICY_BACKEND", "mongo").lower()  # mongo | memory
+# Resultados pedidos a Atlas por cada resultado que se quiere usar
+VSEARCH_OVERFETCH_FACTOR = float(os.getenv("VSEARCH_OVERFETCH_FACTOR", "2"))
+# Por debajo de estos caracteres de contexto la consulta se considera "corta"
+RETRIEVAL_MIN_CONTEXT_CHARS = int(os.getenv("RETRIEVAL_MIN_CONTEXT_CHARS", "500"))
+# Límites dentro de los que se mueve la política
+VSEARCH_LIMIT_MIN = int(os.getenv("VSEARCH_LIMIT_MIN", "3"))
+VSEARCH_LIMIT_MAX = int(os.getenv("VSEARCH_LIMIT_MAX", "10"))
+VSEARCH_NUM_CANDIDATES_MIN = int(os.getenv("VSEARCH_NUM_CANDIDATES_MIN", "100"))
+VSEARCH_NUM_CANDIDATES_MAX = int(os.getenv("VSEARCH_NUM_CANDIDATES_MAX", "1000"))
+# Peso de cada observación en las medias móviles y umbrales de ajuste
+RETRIEVAL_POLICY_ALPHA = float(os.getenv("RETRIEVAL_POLICY_ALPHA", "0.2"))
+RETRIEVAL_POLICY_GROW_AT = float(os.getenv("RETRIEVAL_POLICY_GROW_AT", "0.3"))
+RETRIEVAL_POLICY_SHRINK_AT = float(os.getenv("RETRIEVAL_POLICY_SHRINK_AT", "0.5"))
+# Observaciones mínimas entre dos ajustes y cada cuántas se persiste
+RETRIEVAL_POLICY_COOLDOWN = int(os.getenv("RETRIEVAL_POLICY_COOLDOWN", "5"))
+RETRIEVAL_POLICY_SAVE_EVERY = int(os.getenv("RETRIEVAL_POLICY_SAVE_EVERY", "20"))
+
+
+def _clamp(value: float, low: int, high: int) -> int:
+    return int(max(low, min(high, value)))
+
+
+class RetrievalPolicy:
+    """
+    Estado aprendido de un corpus.
+    short_rate: media móvil de consultas con contexto por debajo de RETRIEVAL_MIN_CONTEXT_CHARS.
+    unused_rate: media móvil de la fracción de resultados de `limit` que no cupieron en el contexto.
+    """
+
+    def __init__(self, corpus: str, num_candidates: int, limit: int, observations: int = 0,
+                 short_rate: float = 0.0, unused_rate: float = 0.0, mean_score: Optional[float] = None,
+                 last_adjusted: int = 0):
+        self.corpus = corpus
+        self.num_candidates = _clamp(num_candidates, VSEARCH_NUM_CANDIDATES_MIN, VSEARCH_NUM_CANDIDATES_MAX)
+        self.limit = _clamp(limit, VSEARCH_LIMIT_MIN, VSEARCH_LIMIT_MAX)
+        self.observations = observations
+        self.short_rate = short_rate
+        self.unused_rate = unused_rate
+        self.mean_score = mean_score
+        self.last_adjusted = last_adjusted
+
+    def fetch_limit(self) -> int:
+        """Resultados que se piden a Atlas (sobre-captura acotada por numCandidates)."""
+        return max(self.limit, min(self.num_candidates, int(round(self.limit * VSEARCH_OVERFETCH_FACTOR))))
+
+    def observe(self, context_chars: int, unused: int, mean_score: Optional[float]) -> Optional[str]:
+        """
+        Registra la calidad de una consulta y ajusta la política si procede.
+        unused: de los `limit` primeros resultados, los que no cupieron en el contexto.
+        Devuelve "grow" / "shrink" si hubo ajuste.
+        """
+        a = RETRIEVAL_POLICY_ALPHA
+        self.observations += 1
+        self.short_rate = (1 - a) * self.short_rate + a * (1.0 if context_chars < RETRIEVAL_MIN_CONTEXT_CHARS else 0.0)
+        self.unused_rate = (1 - a) * self.unused_rate + a * (unused / max(1, self.limit))
+        if mean_score is not None:
+            self.mean_score = mean_score if self.mean_score is None else (1 - a) * self.mean_score + a * mean_score
+
+        if self.observations - self.last_adjusted < RETRIEVAL_POLICY_COOLDOWN:
+            return None
+        if self.short_rate > RETRIEVAL_POLICY_GROW_AT:
+            return self._adjust("grow", self.limit + 1, self.num_candidates * 1.25)
+        if self.unused_rate > RETRIEVAL_POLICY_SHRINK_AT:
+            return self._adjust("shrink", self.limit - 1, self.num_candidates * 0.9)
+        return None
+
+    def _adjust(self, direction: str, limit: float, num_candidates: float) -> Optional[str]:
+        new_limit = _clamp(limit, VSEARCH_LIMIT_MIN, VSEARCH_LIMIT_MAX)
+        # Atlas recomienda numCandidates ≥ 10-20× limit para un buen recall del ANN
+        new_candidates = _clamp(max(num_candidates, new_limit * 10), VSEARCH_NUM_CANDIDATES_MIN, VSEARCH_NUM_CANDIDATES_MAX)
+        if (new_limit, new_candidates) == (self.limit, self.num_candidates):
+            return None
+        if new_candidates > self.num_candidates:
+            RETRIEVER_ESCALATIONS.inc()
+        print(f"[RetrievalPolicy] {self.corpus}: {direction} limit {self.limit}→{new_limit}, "
+              f"numCandidates {self.num_candidates}→{new_candidates}")
+        self.limit, self.num_candidates = new_limit, new_candidates
+        self.last_adjusted = self.observations
+        # Las medias se reinician a mitad de camino para juzgar la nueva configuración
+        self.short_rate /= 2
+        self.unused_rate /= 2
+        RETRIEVER_POLICY_ADJUSTMENTS.inc(direction=direction)
+        return direction
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "corpus": self.corpus,
+            "num_candidates": self.num_candidates,
+            "limit": self.limit,
+            "observations": self.observations,
+            "short_rate": round(self.short_rate, 4),
+            "unused_rate": round(self.unused_rate, 4),
+            "mean_score": round(self.mean_score, 4) if self.mean_score is not None else None,
+            "last_adjusted": self.last_adjusted,
+        }
+
+    @classmethod
+    def from_dict(cls, doc: Dict[str, Any]) -> "RetrievalPolicy":
+        return cls(
+            corpus=doc["corpus"],
+            num_candidates=doc["num_candidates"],
+            limit=doc["limit"],
+            observations=doc.get("observations", 0),
+            short_rate=doc.get("short_rate", 0.0),
+            unused_rate=doc.get("unused_rate", 0.0),
+            mean_score=doc.get("mean_score"),
+            last_adjusted=doc.get("last_adjusted", 0),
+        )
+
+
+class MongoRetrievalPolicyStore:
+    """Persistencia de políticas en la colección `retrieval_policies` (un documento por corpus)."""
+
+    def __init__(self, collection_name: str = "retrieval_policies"):
+        self.collection = get_collection(collection_name)
+
+    async def load(self, corpus: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"corpus": corpus}, {"_id": 0})
+
+    async def save(self, policy: RetrievalPolicy) -> None:
+        await self.collection.update_one(
+            {"corpus": policy.corpus},
+            {"$set": {**policy.to_dict(), "updated_at": datetime.utcnow()}},
+            upsert=True,
+        )
+
+
+class RetrievalPolicyManager:
+    """Políticas del proceso por corpus: carga perezosa, observación y guardado periódico."""
+
+    def __init__(self, store=None, default_num_candidates: int = 150, default_limit: int = 5,
+                 learning: bool = True):
+        self.store = store
+        self.default_num_candidates = default_num_candidates
+        self.default_limit = default_limit
+        self.learning = learning
+        self._policies: Dict[str, RetrievalPolicy] = {}
+
+    async def get(self, corpus: str) -> RetrievalPolicy:
+        policy = self._policies.get(corpus)
+        if policy is not None:
+            return policy
+        doc = None
+        if self.store is not None:
+            try:
+                doc = await self.store.load(corpus)
+            except Exception as e:
+                print(f"⚠️ [RetrievalPolicy] No se pudo cargar la política de {corpus}: {e}")
+        # Dos cargas concurrentes del mismo corpus: se queda la primera
+        return self._policies.setdefault(corpus, (
+            RetrievalPolicy.from_dict(doc) if doc
+            else RetrievalPolicy(corpus, self.default_num_candidates, self.default_limit)
+        ))
+
+    async def observe(self, policy: RetrievalPolicy, **quality) -> Optional[str]:
+        """Registra una observación; persiste la política al ajustarse o cada RETRIEVAL_POLICY_SAVE_EVERY."""
+        if not self.learning:
+            return None
+        adjusted = policy.observe(**quality)
+        if self.store is not None and (adjusted or policy.observations % max(1, RETRIEVAL_POLICY_SAVE_EVERY) == 0):
+            try:
+                await self.store.save(policy)
+            except Exception as e:
+                print(f"⚠️ [RetrievalPolicy] No se pudo guardar la política de {policy.corpus}: {e}")
+        return adjusted
+
+
+# ============================================================
+#   Runtime de proceso
+# ============================================================
+_manager: Optional[RetrievalPolicyManager] = None
+
+
+def get_retrieval_policy_manager(default_num_candidates: int = 150, default_limit: int = 5) -> RetrievalPolicyManager:
+    """Gestor compartido; los valores por defecto (VSEARCH_*) solo se usan para corpus sin política guardada."""
+    global _manager
+    if _manager is None:
+        store = MongoRetrievalPolicyStore() if RETRIEVAL_POLICY_BACKEND == "mongo" else None
+        _manager = RetrievalPolicyManager(store, default_num_candidates, default_limit, learning=RETRIEVAL_POLICY_ENABLED)
+    return _manager
+
+
+def set_retrieval_policy_manager(manager: Optional[RetrievalPolicyManager]) -> None:
+    """Sustituye el gestor del proceso (tests y benchmarks)."""
+    global _manager
+    _manager = manager
@@ -0,0 +1,203 @@
+"""
+Token Budget
+------------
+Presupuesto de tokens por tarea para los prompts de los agentes.
+
+✔️ Cuenta tokens con tiktoken (aproximación len/4 si la codificación no está disponible offline).
+✔️ Cada prompt se describe como segmentos con prioridad (esquema, contexto RAG, texto del usuario…).
+✔️ Si el prompt excede el presupuesto se recortan primero los segmentos de menor prioridad.
+✔️ `max_tokens` de la respuesta se ajusta al hueco que deja el prompt en la ventana de contexto
+   (sin límite para modelos de razonamiento, donde incluiría los tokens de razonamiento).
+✔️ Devuelve un desglose por segmento para los metadatos de la respuesta.
+
+Uso:
+    fitted, report = fit_prompt("json_a", [
+        PromptSegment("instrucciones", prompt_a, priority=100, trimmable=False),
+        PromptSegment("contexto_normativo", context, priority=50),
+    ], model="gpt-5")
+"""
+
+import os
+import math
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+
+
+def _env_cap(name: str, default: str) -> Optional[int]:
+    """Límite entero del .env; vacío → sin límite (no se envía max_tokens)."""
+    value = os.getenv(name, default).strip()
+    return int(value) if value else None
+
+
+# --- Config (tuneable vía .env) ---
+# Tokens máximos de la respuesta por tipo de tarea (el antiguo `default_max` de get_llm)
+COMPLETION_MAX_TOKENS = {
+    "json_a": _env_cap("MAX_TOKENS_JSON_A", "1500"),
+    "json_b": _env_cap("MAX_TOKENS_JSON_B", "2500"),
+    "json_repair": _env_cap("MAX_TOKENS_VALIDATOR", "1800"),
+    "validator": _env_cap("MAX_TOKENS_VALIDATOR", "1800"),
+    "prompt_refiner": _env_cap("MAX_TOKENS_PROMPT_REFINER", "800"),
+    "generic": _env_cap("MAX_TOKENS_DEFAULT", "2000"),
+}
+# Modelos de razonamiento: su límite (max_completion_tokens) incluye los tokens de razonamiento,
+# así que un tope por tarea puede dejar la respuesta vacía (finish_reason="length"); no se les envía
+REASONING_MODEL_PREFIXES = tuple(
+    p.strip().lower() for p in os.getenv("LLM_REASONING_MODEL_PREFIXES", "gpt-5,o1,o3,o4").split(",") if p.strip()
+)
+# Tokens máximos del prompt
+PROMPT_BUDGET_TOKENS = {
+    "json_a": int(os.getenv("PROMPT_BUDGET_JSON_A", "6000")),
+    "json_b": int(os.getenv("PROMPT_BUDGET_JSON_B", "4000")),
+    "json_repair": int(os.getenv("PROMPT_BUDGET_JSON_REPAIR", "3000")),
+    "prompt_refiner": int(os.getenv("PROMPT_BUDGET_PROMPT_REFINER", "3000")),
+    "generic": int(os.getenv("PROMPT_BUDGET_DEFAULT", "6000")),
+}
+# Ventana de contexto del modelo (prompt + respuesta)
+CONTEXT_WINDOW_TOKENS = int(os.getenv("LLM_CONTEXT_WINDOW_TOKENS", "128000"))
+TRUNCATION_MARKER = "…"
+
+
+# ============================================================
+#   Conteo de tokens
+# ============================================================
+@lru_cache(maxsize=16)
+def _encoding(model: Optional[str]):
+    """Codificación tiktoken del modelo (None si no está disponible, p.ej. sin red)."""
+    if not HAS_TIKTOKEN:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("o200k_base")
+    except KeyError:
+        pass  # modelo desconocido para tiktoken (Groq, fake…)
+    except Exception as e:
+        print(f"⚠️ [TokenBudget] tiktoken no disponible ({type(e).__name__}); se aproxima con len/4")
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def render_prompt(prompt: Any) -> str:
+    """Texto plano de un prompt (str o lista de mensajes de PromptManager)."""
+    if isinstance(prompt, (list, tuple)):
+        return "\n\n".join(str(getattr(m, "content", m)) for m in prompt)
+    return str(prompt or "")
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Tokens de `text` para `model` (len/4 si tiktoken no está disponible)."""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Recorta `text` a `max_tokens` (conserva el principio) marcando el corte."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    keep = max_tokens - 1  # un token para la marca de corte
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[: keep * 4].rstrip() + TRUNCATION_MARKER
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:keep]).rstrip() + TRUNCATION_MARKER
+
+
+# ============================================================
+#   Segmentos y ajuste al presupuesto
+# ============================================================
+class PromptSegment:
+    """
+    Fragmento de un prompt.
+    priority: mayor = más importante (se recorta el último).
+    trimmable: False para segmentos que no pueden perder contenido (esquema, instrucciones).
+    """
+
+    def __init__(self, name: str, text: str, priority: int = 50, trimmable: bool = True):
+        self.name = name
+        self.text = text or ""
+        self.priority = priority
+        self.trimmable = trimmable
+
+
+def is_reasoning_model(model: Optional[str]) -> bool:
+    name = (model or "").lower().rsplit("/", 1)[-1]
+    return bool(REASONING_MODEL_PREFIXES) and name.startswith(REASONING_MODEL_PREFIXES)
+
+
+def default_max_tokens(task_type: str, model: Optional[str] = None) -> Optional[int]:
+    """Límite de tokens de respuesta de la tarea; None = sin límite (modelo de razonamiento o .env vacío)."""
+    if is_reasoning_model(model):
+        return None
+    return COMPLETION_MAX_TOKENS.get(task_type, COMPLETION_MAX_TOKENS["generic"])
+
+
+def completion_budget(task_type: str, prompt_tokens: int, model: Optional[str] = None) -> Optional[int]:
+    """max_tokens de la respuesta: límite de la tarea acotado por el hueco de la ventana de contexto."""
+    cap = default_max_tokens(task_type, model)
+    if cap is None:
+        return None
+    return max(1, min(cap, CONTEXT_WINDOW_TOKENS - prompt_tokens))
+
+
+def fit_prompt(
+    task_type: str,
+    segments: List[PromptSegment],
+    model: Optional[str] = None,
+    budget: Optional[int] = None,
+) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """
+    Ajusta los segmentos al presupuesto de la tarea.
+    Devuelve ({nombre: texto_ajustado}, informe) con el desglose de tokens por segmento.
+    """
+    budget = budget or PROMPT_BUDGET_TOKENS.get(task_type, PROMPT_BUDGET_TOKENS["generic"])
+    original = {s.name: count_tokens(s.text, model) for s in segments}
+    tokens = dict(original)
+    texts = {s.name: s.text for s in segments}
+
+    excess = sum(tokens.values()) - budget
+    # Recorte de menor a mayor prioridad hasta caber
+    for segment in sorted(segments, key=lambda s: s.priority):
+        if excess <= 0:
+            break
+        if not segment.trimmable or not tokens[segment.name]:
+            continue
+        keep = max(0, tokens[segment.name] - excess)
+        texts[segment.name] = truncate_to_tokens(segment.text, keep, model)
+        tokens[segment.name] = count_tokens(texts[segment.name], model)
+        excess = sum(tokens.values()) - budget
+
+    prompt_tokens = sum(tokens.values())
+    report = {
+        "task_type": task_type,
+        "budget": budget,
+        "prompt_tokens": prompt_tokens,
+        "original_prompt_tokens": sum(original.values()),
+        "max_tokens": completion_budget(task_type, prompt_tokens, model),
+        "over_budget": prompt_tokens > budget,
+        "segments": {
+            s.name: {
+                "tokens": tokens[s.name],
+                "original_tokens": original[s.name],
+                "trimmed": tokens[s.name] < original[s.name],
+                "priority": s.priority,
+            }
+            for s in segments
+        },
+    }
+    if report["original_prompt_tokens"] > prompt_tokens:
+        trimmed = [n for n, seg in report["segments"].items() if seg["trimmed"]]
+        print(f"✂️ [TokenBudget] {task_type}: {report['original_prompt_tokens']} → {prompt_tokens} tokens "
+              f"(presupuesto {budget}; recortados: {', '.join(trimmed)})")
+    return texts, report
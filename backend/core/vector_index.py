@@ -0,0 +1,416 @@
+"""
+Local Vector Index
+------------------
+Índice vectorial local (ficheros memory-mapped) como alternativa a Atlas $vectorSearch.
+
+✔️ Vectores normalizados en una matriz float32 memory-mapped, o int8 con una escala por fila.
+✔️ Tabla de metadatos paralela (JSONL): texto, título, fuente, página e id del chunk.
+✔️ Top-k exacto vectorizado con NumPy (producto escalar por bloques + argpartition).
+✔️ Búsqueda aproximada opcional para corpus grandes (IVF: k-means + `nprobe` listas).
+✔️ Refresco incremental desde la colección de embeddings (solo los _id nuevos).
+✔️ Scores en la escala de Atlas con similitud coseno: (1 + cos) / 2.
+
+Construcción / refresco:
+    python -m backend.database.build_local_index [--rebuild] [--dtype int8]
+Selección en el RetrieverAgent: VECTOR_BACKEND=atlas|local
+"""
+
+import os
+import json
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# --- Config (tuneable vía .env) ---
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "atlas").lower()  # atlas | local
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "./vector_index")
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32").lower()  # float32 | int8
+# Filas a partir de las que se entrena el IVF (0 = siempre exacto)
+VECTOR_INDEX_ANN_MIN_ROWS = int(os.getenv("VECTOR_INDEX_ANN_MIN_ROWS", "100000"))
+# Listas del IVF (0 = 4·√filas) y listas exploradas por consulta como mínimo
+VECTOR_INDEX_NLIST = int(os.getenv("VECTOR_INDEX_NLIST", "0"))
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+# Cada cuántos segundos se comprueba si otro proceso ha actualizado el índice
+VECTOR_INDEX_RELOAD_SECONDS = float(os.getenv("VECTOR_INDEX_RELOAD_SECONDS", "30"))
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.bin"
+SCALES_FILE = "scales.bin"
+META_FILE = "meta.jsonl"
+CENTROIDS_FILE = "ivf_centroids.npy"
+ASSIGN_FILE = "ivf_assign.bin"
+
+_BLOCK_ROWS = 16384
+_META_FIELDS = ("chunk_id", "text", "title", "source", "page")
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def quantize_int8(vectors: np.ndarray):
+    """Cuantización simétrica por fila: v ≈ q · scale, q ∈ [-127, 127]."""
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+    q = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return q, scales.astype(np.float32)
+
+
+def _kmeans(x: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """k-means esférico (centroides normalizados) sobre filas ya normalizadas."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest_centroid(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        empty = np.bincount(assign, minlength=nlist) == 0
+        if empty.any():
+            # listas vacías: se resiembran con filas al azar
+            sums[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def _nearest_centroid(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    out = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), _BLOCK_ROWS):
+        out[start:start + _BLOCK_ROWS] = np.argmax(x[start:start + _BLOCK_ROWS] @ centroids.T, axis=1)
+    return out
+
+
+class _Snapshot:
+    """Estado abierto del índice; se sustituye entero al recargar (las búsquedas en curso conservan el suyo)."""
+
+    __slots__ = ("manifest", "vectors", "scales", "meta", "centroids", "order", "offsets", "mtime")
+
+    def __init__(self, manifest=None, vectors=None, scales=None, meta=None, centroids=None,
+                 order=None, offsets=None, mtime=None):
+        self.manifest = manifest or {}
+        self.vectors = vectors
+        self.scales = scales
+        self.meta = meta or []
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.mtime = mtime
+
+    @property
+    def count(self) -> int:
+        return int(self.manifest.get("count", 0))
+
+
+class LocalVectorIndex:
+    """
+    Índice en `path`. El manifiesto (escrito el último y de forma atómica) fija cuántas filas
+    son válidas: un lector nunca ve filas a medio escribir.
+    """
+
+    def __init__(self, path: str = VECTOR_INDEX_DIR, nprobe: int = VECTOR_INDEX_NPROBE):
+        self.path = path
+        self.nprobe = nprobe
+        self._state = _Snapshot()
+        self.load()
+
+    # ---------------- Lectura ----------------
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @property
+    def manifest(self) -> Dict[str, Any]:
+        return self._state.manifest
+
+    @property
+    def count(self) -> int:
+        return self._state.count
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.manifest.get("dim")
+
+    @property
+    def dtype(self) -> str:
+        return self.manifest.get("dtype", VECTOR_INDEX_DTYPE)
+
+    @property
+    def vectors(self):
+        return self._state.vectors
+
+    @property
+    def scales(self):
+        return self._state.scales
+
+    def _manifest_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self._file(MANIFEST_FILE))
+        except OSError:
+            return None
+
+    def load(self) -> "LocalVectorIndex":
+        """(Re)abre los ficheros del índice; vacío si aún no se ha construido."""
+        mtime = self._manifest_mtime()
+        if mtime is None:
+            self._state = _Snapshot()
+            return self
+        with open(self._file(MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        count, dim = manifest["count"], manifest["dim"]
+        dtype = np.int8 if manifest["dtype"] == "int8" else np.float32
+        vectors = np.memmap(self._file(VECTORS_FILE), dtype=dtype, mode="r", shape=(count, dim)) if count else None
+        scales = None
+        if manifest["dtype"] == "int8" and count:
+            scales = np.memmap(self._file(SCALES_FILE), dtype=np.float32, mode="r", shape=(count,))
+        meta = []
+        with open(self._file(META_FILE), encoding="utf-8") as f:
+            for line in f:
+                if len(meta) >= count:
+                    break
+                meta.append(json.loads(line))
+
+        centroids = order = offsets = None
+        if manifest.get("ivf") and count:
+            centroids = np.load(self._file(CENTROIDS_FILE))
+            assign = np.memmap(self._file(ASSIGN_FILE), dtype=np.int32, mode="r", shape=(count,))
+            order = np.argsort(assign, kind="stable").astype(np.int64)
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(centroids)))])
+
+        self._state = _Snapshot(manifest, vectors, scales, meta, centroids, order, offsets, mtime)
+        return self
+
+    def reload_if_changed(self) -> bool:
+        """Reabre el índice si otro proceso lo ha actualizado (cambia el manifiesto)."""
+        mtime = self._manifest_mtime()
+        if mtime is not None and mtime != self._state.mtime:
+            self.load()
+            return True
+        return False
+
+    # ---------------- Búsqueda ----------------
+    @staticmethod
+    def _score_rows(state: _Snapshot, q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Coseno de `q` con todas las filas (o las indicadas), por bloques."""
+        n = state.count if rows is None else len(rows)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, _BLOCK_ROWS):
+            idx = slice(start, start + _BLOCK_ROWS) if rows is None else rows[start:start + _BLOCK_ROWS]
+            block = state.vectors[idx]
+            if state.scales is not None:
+                scores[start:start + _BLOCK_ROWS] = (block.astype(np.float32) @ q) * state.scales[idx]
+            else:
+                scores[start:start + _BLOCK_ROWS] = block @ q
+        return scores
+
+    def _probe_rows(self, state: _Snapshot, q: np.ndarray, num_candidates: Optional[int]) -> np.ndarray:
+        """Filas de las listas IVF más cercanas; se exploran las necesarias para cubrir num_candidates."""
+        nlist = len(state.centroids)
+        nprobe = self.nprobe
+        if num_candidates:
+            nprobe = max(nprobe, math.ceil(num_candidates / max(1.0, state.count / nlist)))
+        nprobe = min(nlist, max(1, nprobe))
+        probes = np.argpartition(-(state.centroids @ q), nprobe - 1)[:nprobe]
+        return np.concatenate([state.order[state.offsets[p]:state.offsets[p + 1]] for p in probes])
+
+    def search(self, query: Sequence[float], k: int, num_candidates: Optional[int] = None,
+               exact: Optional[bool] = None, with_vectors: bool = False) -> List[Dict[str, Any]]:
+        """
+        Top-k por similitud coseno. Con IVF entrenado la búsqueda es aproximada salvo `exact=True`.
+        Devuelve los metadatos de cada fila más `score` (escala Atlas: (1 + cos) / 2) y,
+        con `with_vectors`, su `embedding` normalizado (para el empaquetado MMR del contexto).
+        """
+        state = self._state
+        if not state.count or k <= 0:
+            return []
+        q = np.asarray(query, dtype=np.float32)
+        if q.shape[0] != state.manifest["dim"]:
+            raise ValueError(f"Dimensión de la consulta {q.shape[0]} ≠ dimensión del índice {state.manifest['dim']}")
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+
+        use_ann = state.centroids is not None and not exact
+        rows = self._probe_rows(state, q, num_candidates) if use_ann else None
+        scores = self._score_rows(state, q, rows)
+        k = min(k, len(scores))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for i in top:
+            row = int(rows[i]) if rows is not None else int(i)
+            result = {**state.meta[row], "score": float((1.0 + scores[i]) / 2.0)}
+            if with_vectors:
+                vector = np.asarray(state.vectors[row], dtype=np.float32)
+                result["embedding"] = vector * state.scales[row] if state.scales is not None else vector
+            results.append(result)
+        return results
+
+    # ---------------- Escritura ----------------
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        manifest["updated_at"] = datetime.utcnow().isoformat()
+        tmp = self._file(MANIFEST_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._file(MANIFEST_FILE))
+
+    def append(self, vectors: np.ndarray, metas: List[Dict[str, Any]], last_id: Optional[str] = None,
+               model: Optional[str] = None, dtype: Optional[str] = None) -> int:
+        """Añade filas al final del índice (lo crea si no existe). Devuelve el total de filas."""
+        if len(vectors) != len(metas):
+            raise ValueError("vectors y metas deben tener la misma longitud")
+        if not len(vectors):
+            return self.count
+        vectors = normalize_rows(vectors)
+        os.makedirs(self.path, exist_ok=True)
+        manifest = dict(self.manifest) or {
+            "version": 1, "dim": int(vectors.shape[1]), "count": 0,
+            "dtype": (dtype or VECTOR_INDEX_DTYPE), "model": model, "ivf": None, "last_id": None,
+            "meta_bytes": 0,
+        }
+        if manifest["dim"] != vectors.shape[1]:
+            raise ValueError(f"Dimensión {vectors.shape[1]} ≠ dimensión del índice {manifest['dim']}")
+
+        # Se trunca a `count` filas por si una escritura anterior quedó a medias
+        with open(self._file(VECTORS_FILE), "ab") as f:
+            f.truncate(manifest["count"] * manifest["dim"] * (1 if manifest["dtype"] == "int8" else 4))
+            if manifest["dtype"] == "int8":
+                q, scales = quantize_int8(vectors)
+                f.write(q.tobytes())
+                with open(self._file(SCALES_FILE), "ab") as fs:
+                    fs.truncate(manifest["count"] * 4)
+                    fs.write(scales.tobytes())
+            else:
+                f.write(vectors.tobytes())
+        with open(self._file(META_FILE), "ab") as f:
+            f.truncate(manifest.get("meta_bytes", 0))
+            for meta in metas:
+                line = json.dumps({k: meta.get(k) for k in _META_FIELDS}, ensure_ascii=False, default=str)
+                f.write((line + "\n").encode("utf-8"))
+            manifest["meta_bytes"] = f.tell()
+        if manifest.get("ivf"):
+            centroids = np.load(self._file(CENTROIDS_FILE))
+            with open(self._file(ASSIGN_FILE), "ab") as f:
+                f.truncate(manifest["count"] * 4)
+                f.write(_nearest_centroid(vectors, centroids).tobytes())
+
+        manifest["count"] += len(vectors)
+        manifest["last_id"] = last_id if last_id is not None else manifest.get("last_id")
+        manifest["model"] = model or manifest.get("model")
+        self._write_manifest(manifest)
+        self.load()
+        return self.count
+
+    def _dense(self) -> np.ndarray:
+        """Matriz float32 completa (para entrenar el IVF)."""
+        if self.scales is not None:
+            return np.asarray(self.vectors, dtype=np.float32) * np.asarray(self.scales)[:, None]
+        return np.asarray(self.vectors)
+
+    def train_ivf(self, nlist: Optional[int] = None, sample_rows: int = 100000) -> int:
+        """Entrena el IVF (k-means sobre una muestra) y asigna todas las filas. Devuelve nlist."""
+        nlist = nlist or VECTOR_INDEX_NLIST or int(4 * math.sqrt(self.count))
+        nlist = max(1, min(nlist, self.count))
+        dense = self._dense()
+        rng = np.random.default_rng(0)
+        sample = dense if len(dense) <= sample_rows else dense[np.sort(rng.choice(len(dense), sample_rows, replace=False))]
+        centroids = _kmeans(sample, nlist)
+        np.save(self._file(CENTROIDS_FILE), centroids)
+        with open(self._file(ASSIGN_FILE), "wb") as f:
+            f.write(_nearest_centroid(dense, centroids).tobytes())
+        manifest = dict(self.manifest)
+        manifest["ivf"] = {"nlist": nlist, "trained_rows": self.count}
+        self._write_manifest(manifest)
+        self.load()
+        return nlist
+
+    def clear(self) -> None:
+        """Borra los ficheros del índice (reconstrucción completa)."""
+        for name in (MANIFEST_FILE, VECTORS_FILE, SCALES_FILE, META_FILE, CENTROIDS_FILE, ASSIGN_FILE):
+            try:
+                os.remove(self._file(name))
+            except FileNotFoundError:
+                pass
+        self.load()
+
+    def maybe_train_ivf(self) -> Optional[int]:
+        """Entrena (o reentrena) el IVF si el corpus ha superado VECTOR_INDEX_ANN_MIN_ROWS o se ha duplicado."""
+        if not VECTOR_INDEX_ANN_MIN_ROWS or self.count < VECTOR_INDEX_ANN_MIN_ROWS:
+            return None
+        ivf = self.manifest.get("ivf")
+        if ivf and self.count < 2 * ivf.get("trained_rows", 0):
+            return None
+        return self.train_ivf()
+
+
+# ============================================================
+#   Construcción desde la colección de embeddings
+# ============================================================
+def _doc_meta(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Mismos campos que la proyección de $vectorSearch del RetrieverAgent."""
+    metadata = doc.get("metadata") or {}
+    return {
+        "chunk_id": str(doc["_id"]),
+        "text": doc.get("text"),
+        "title": doc.get("title") or metadata.get("title"),
+        "source": doc.get("source") or metadata.get("source"),
+        "page": doc.get("page") if doc.get("page") is not None else metadata.get("page"),
+    }
+
+
+def _id_filter(last_id: Optional[str]) -> Dict[str, Any]:
+    if not last_id:
+        return {}
+    from bson import ObjectId
+
+    return {"_id": {"$gt": ObjectId(last_id) if ObjectId.is_valid(last_id) else last_id}}
+
+
+def refresh_from_collection(collection, index: LocalVectorIndex = None, rebuild: bool = False,
+                            dtype: Optional[str] = None, model: Optional[str] = None,
+                            batch_size: int = 2048) -> Dict[str, Any]:
+    """
+    Sincroniza el índice con una colección pymongo (síncrona) de embeddings.
+    Incremental: solo documentos con _id mayor que el último indexado. `rebuild` parte de cero.
+    """
+    index = index or LocalVectorIndex()
+    if rebuild:
+        index.clear()
+    before = index.count
+    cursor = collection.find(
+        _id_filter(index.manifest.get("last_id")),
+        {"_id": 1, "embedding": 1, "text": 1, "title": 1, "source": 1, "page": 1, "metadata": 1},
+    ).sort("_id", 1)
+
+    vectors, metas = [], []
+
+    def flush():
+        if vectors:
+            index.append(np.asarray(vectors, dtype=np.float32), metas, last_id=metas[-1]["chunk_id"],
+                         model=model, dtype=dtype)
+            vectors.clear()
+            metas.clear()
+
+    for doc in cursor:
+        if not doc.get("embedding"):
+            continue
+        vectors.append(doc["embedding"])
+        metas.append(_doc_meta(doc))
+        if len(vectors) >= batch_size:
+            flush()
+    flush()
+    nlist = index.maybe_train_ivf()
+    report = {"added": index.count - before, "count": index.count, "dtype": index.dtype, "ivf_nlist": nlist}
+    print(f"🗂️ [VectorIndex] {report['added']} chunks añadidos — total {index.count} ({index.dtype}) en {index.path}")
+    return report
+
+
+def build_from_records(records: Iterable[Dict[str, Any]], index: LocalVectorIndex = None,
+                       dtype: Optional[str] = None, model: Optional[str] = None) -> LocalVectorIndex:
+    """Construye/añade filas a partir de registros {embedding, text, title, source, page, chunk_id}."""
+    index = index or LocalVectorIndex()
+    records = list(records)
+    if records:
+        index.append(np.asarray([r["embedding"] for r in records], dtype=np.float32), records,
+                     model=model, dtype=dtype)
+    return index
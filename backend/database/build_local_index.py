@@ -0,0 +1,48 @@
+"""
+Construye o refresca el índice vectorial local (VECTOR_BACKEND=local) a partir
+de la colección de embeddings de Atlas.
+
+    python -m backend.database.build_local_index              # incremental (solo chunks nuevos)
+    python -m backend.database.build_local_index --rebuild    # desde cero
+    python -m backend.database.build_local_index --dtype int8 --ivf
+"""
+
+import os
+import argparse
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from backend.core.vector_index import VECTOR_INDEX_DIR, LocalVectorIndex, refresh_from_collection
+
+load_dotenv()
+
+DB_NAME = os.getenv("MONGO_DB", "Golden")
+COLLECTION_NAME = os.getenv("EMBEDDINGS_COLLECTION", "embeddings")
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+
+def build_local_index(rebuild: bool = False, dtype: str = None, path: str = VECTOR_INDEX_DIR, ivf: bool = False):
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise RuntimeError("❌ MONGO_URI no está definido en .env")
+    client = MongoClient(mongo_uri)
+    try:
+        index = LocalVectorIndex(path)
+        report = refresh_from_collection(
+            client[DB_NAME][COLLECTION_NAME], index, rebuild=rebuild, dtype=dtype, model=MODEL_NAME
+        )
+        if ivf and not report["ivf_nlist"] and index.count:
+            report["ivf_nlist"] = index.train_ivf()
+        return report
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice vectorial local desde la colección de embeddings")
+    parser.add_argument("--rebuild", action="store_true", help="Reconstruir desde cero")
+    parser.add_argument("--dtype", choices=["float32", "int8"], default=None, help="Solo al crear el índice")
+    parser.add_argument("--path", default=VECTOR_INDEX_DIR)
+    parser.add_argument("--ivf", action="store_true", help="Entrenar el IVF (búsqueda aproximada) aunque el corpus sea pequeño")
+    args = parser.parse_args()
+    print(build_local_index(args.rebuild, args.dtype, args.path, args.ivf))
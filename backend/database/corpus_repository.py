@@ -0,0 +1,36 @@
+"""
+Repositorio de versiones del corpus.
+Guarda un sello de versión por corpus (p.ej. `normativa`) en la colección
+`corpus_versions`. La ingesta lo actualiza al terminar y las cachés que dependen
+del contenido recuperado (generación, retrieval) lo incluyen en su clave, de modo
+que un cambio en la normativa invalida sus entradas automáticamente.
+"""
+
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from backend.database.mongo import get_collection
+
+CORPUS_VERSIONS_COLLECTION = "corpus_versions"
+DEFAULT_CORPUS_VERSION = "initial"
+
+
+async def get_corpus_version(corpus: str = "normativa") -> str:
+    """Devuelve el sello de versión actual del corpus (DEFAULT_CORPUS_VERSION si nunca se ha ingerido)."""
+    doc = await get_collection(CORPUS_VERSIONS_COLLECTION).find_one({"corpus": corpus}, {"_id": 0, "version": 1})
+    return (doc or {}).get("version", DEFAULT_CORPUS_VERSION)
+
+
+async def bump_corpus_version(corpus: str = "normativa", version: Optional[str] = None) -> str:
+    """
+    Registra una nueva versión del corpus. Si no se indica `version` se genera una aleatoria.
+    Devuelve la versión guardada.
+    """
+    version = version or uuid.uuid4().hex
+    await get_collection(CORPUS_VERSIONS_COLLECTION).update_one(
+        {"corpus": corpus},
+        {"$set": {"version": version, "updated_at": datetime.utcnow().isoformat()}},
+        upsert=True,
+    )
+    return version
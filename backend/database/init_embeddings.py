@@ -0,0 +1,14 @@
+import asyncio
+from backend.database.mongo import get_collection
+
+async def create_indexes():
+    collection = get_collection("embeddings")
+
+    # Índice de texto para la parte léxica de la recuperación híbrida (RETRIEVAL_MODE=hybrid):
+    # artículos ("artículo 28 LCSP") y códigos CPV que el modelo de embeddings no distingue bien
+    await collection.create_index([("text", "text")], default_language="spanish", name="text_lexical")
+
+    print("✅ Índices creados para embeddings (el índice vectorial se gestiona en Atlas).")
+
+if __name__ == "__main__":
+    asyncio.run(create_indexes())
@@ -0,0 +1,19 @@
+import asyncio
+from backend.database.mongo import get_collection
+from backend.database.corpus_repository import CORPUS_VERSIONS_COLLECTION
+from backend.core.generation_cache import GENERATION_CACHE_TTL_SECONDS
+
+async def create_indexes():
+    collection = get_collection("generation_cache")
+
+    await collection.create_index("key", unique=True)
+    await collection.create_index("expediente_id")
+    # TTL: Mongo elimina las entradas caducadas (created_at es un datetime)
+    await collection.create_index("created_at", expireAfterSeconds=GENERATION_CACHE_TTL_SECONDS)
+
+    await get_collection(CORPUS_VERSIONS_COLLECTION).create_index("corpus", unique=True)
+
+    print("✅ Índices creados para generation_cache y corpus_versions.")
+
+if __name__ == "__main__":
+    asyncio.run(create_indexes())
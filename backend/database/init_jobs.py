@@ -0,0 +1,15 @@
+import asyncio
+from backend.database.mongo import get_collection
+
+async def create_indexes():
+    collection = get_collection("jobs")
+
+    await collection.create_index("job_id", unique=True)
+    await collection.create_index("status")
+    await collection.create_index("created_at")
+    await collection.create_index("request.expediente_id")
+
+    print("✅ Índices creados para jobs.")
+
+if __name__ == "__main__":
+    asyncio.run(create_indexes())
@@ -0,0 +1,17 @@
+import asyncio
+from backend.database.mongo import get_collection
+from backend.core.llm_cache import LLM_CACHE_TTL_SECONDS
+
+async def create_indexes():
+    collection = get_collection("llm_cache")
+
+    await collection.create_index("key", unique=True)
+    # TTL: Mongo elimina las respuestas caducadas (created_at es un datetime)
+    await collection.create_index("created_at", expireAfterSeconds=LLM_CACHE_TTL_SECONDS)
+    # Expulsión por tamaño: se borran primero las menos usadas
+    await collection.create_index("last_access")
+
+    print("✅ Índices creados para llm_cache.")
+
+if __name__ == "__main__":
+    asyncio.run(create_indexes())
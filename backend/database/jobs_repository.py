@@ -0,0 +1,98 @@
+"""
+Repositorio de jobs de generación asíncrona.
+Cada job guarda la petición, su estado (queued → running → succeeded/failed/cancelled),
+el progreso por nodo del grafo y el resultado final.
+
+Dos backends con la misma interfaz:
+- MongoJobStore: colección `jobs` (producción).
+- InMemoryJobStore: diccionario local (tests y desarrollo sin Mongo).
+"""
+
+import copy
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from backend.database.mongo import get_collection
+
+# Estados terminales: el job ya no cambiará
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+# Estados que solo tienen sentido mientras vive el proceso que los encoló
+UNFINISHED_STATUSES = ("queued", "running")
+
+
+def new_job_document(job_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    """Documento inicial de un job recién encolado."""
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "request": request,
+        "progress": {"current_node": None, "nodes_completed": []},
+        "result": None,
+        "error": None,
+        "created_at": datetime.utcnow().isoformat(),
+        "started_at": None,
+        "finished_at": None,
+    }
+
+
+class MongoJobStore:
+    """Persistencia de jobs en la colección `jobs` de MongoDB."""
+
+    def __init__(self, collection_name: str = "jobs"):
+        self.collection = get_collection(collection_name)
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        await self.collection.insert_one(dict(job))
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"job_id": job_id}, {"_id": 0})
+
+    async def update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        await self.collection.update_one({"job_id": job_id}, {"$set": fields})
+
+    async def add_node_progress(self, job_id: str, node_event: Dict[str, Any]) -> None:
+        await self.collection.update_one(
+            {"job_id": job_id},
+            {
+                "$set": {"progress.current_node": node_event["node"]},
+                "$push": {"progress.nodes_completed": node_event},
+            },
+        )
+
+    async def fail_unfinished(self, error: str) -> int:
+        """Marca como fallidos los jobs que quedaron encolados o en ejecución (reinicio)."""
+        result = await self.collection.update_many(
+            {"status": {"$in": list(UNFINISHED_STATUSES)}},
+            {"$set": {"status": "failed", "error": error, "finished_at": datetime.utcnow().isoformat()}},
+        )
+        return result.modified_count
+
+
+class InMemoryJobStore:
+    """Persistencia en memoria (no sobrevive reinicios). Útil para tests."""
+
+    def __init__(self):
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        self.jobs[job["job_id"]] = copy.deepcopy(job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        return copy.deepcopy(job) if job else None
+
+    async def update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        if job_id in self.jobs:
+            self.jobs[job_id].update(copy.deepcopy(fields))
+
+    async def add_node_progress(self, job_id: str, node_event: Dict[str, Any]) -> None:
+        job = self.jobs.get(job_id)
+        if job:
+            job["progress"]["current_node"] = node_event["node"]
+            job["progress"]["nodes_completed"].append(dict(node_event))
+
+    async def fail_unfinished(self, error: str) -> int:
+        stale = [job for job in self.jobs.values() if job["status"] in UNFINISHED_STATUSES]
+        for job in stale:
+            job.update({"status": "failed", "error": error, "finished_at": datetime.utcnow().isoformat()})
+        return len(stale)
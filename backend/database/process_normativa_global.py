@@ -6,9 +6,12 @@ import asyncio
 from PyPDF2 import PdfReader
 from dotenv import load_dotenv
 from pymongo import MongoClient
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_mongodb import MongoDBAtlasVectorSearch
+from backend.core.logic_jn import sha256_hex
+from backend.database.corpus_repository import bump_corpus_version, get_corpus_version
+from backend.core.vector_index import VECTOR_BACKEND, LocalVectorIndex, refresh_from_collection
+from backend.core.embedding_service import EMBEDDING_MODEL, get_embedding_service
 
 # ---------- Configuración ----------
 load_dotenv()
@@ -20,7 +23,7 @@ DB_NAME = "Golden"
 COLL_NORMATIVA = "normativa_global"
 COLL_EMBEDDINGS = "embeddings"
 INDEX_NAME = "default"
-MODEL_NAME = "all-MiniLM-L6-v2"
+MODEL_NAME = EMBEDDING_MODEL
 
 # ---------- Utilidades ----------
 def extract_text_from_pdf(path: str) -> str:
@@ -45,7 +48,7 @@ async def process_pdfs():
     normativa_col = client[DB_NAME][COLL_NORMATIVA]
 
     # --- Configuración embeddings ---
-    embeddings = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+    embeddings = get_embedding_service()  # mismo modelo que el RetrieverAgent y las rutas
     vectorstore = MongoDBAtlasVectorSearch.from_connection_string(
         connection_string=mongo_uri,
         namespace=f"{DB_NAME}.{COLL_EMBEDDINGS}",
@@ -56,41 +59,59 @@ async def process_pdfs():
     splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
 
     # --- Procesar PDFs ---
-    for i, pdf_path in enumerate(pdf_files, start=1):
-        titulo = os.path.basename(pdf_path)
-        doc_id = f"normativa_{i:03d}"
-        print(f"📄 Procesando {titulo}...")
-
-        # Extraer texto
-        text = extract_text_from_pdf(pdf_path)
-        if not text:
-            print(f"⚠️ No se pudo extraer texto de {titulo}")
-            continue
-
-        # Hash y metadatos
-        hash_val = hashlib.sha256(text.encode()).hexdigest()
-        metadata = {
-            "title": titulo,
-            "source": pdf_path,
-            "id": doc_id,
-            "tipo": "normativa",
-            "fecha_insercion": datetime.datetime.utcnow().isoformat(),
-        }
-
-        # --- Insertar documento completo en normativa_global ---
-        normativa_doc = {
-            "id": doc_id,
-            "text": text,
-            "metadata": metadata,
-            "hash": hash_val,
-        }
-        normativa_col.insert_one(normativa_doc)
-
-        # --- Crear chunks y añadir a embeddings ---
-        chunks = splitter.create_documents([text], metadatas=[metadata])
-        vectorstore.add_documents(chunks)
-
-        print(f"✅ {titulo}: insertado en normativa_global y vectorizado ({len(chunks)} chunks)")
+    ingested_hashes = []
+    embeddings_changed = False
+    try:
+        for i, pdf_path in enumerate(pdf_files, start=1):
+            titulo = os.path.basename(pdf_path)
+            doc_id = f"normativa_{i:03d}"
+            print(f"📄 Procesando {titulo}...")
+
+            # Extraer texto
+            text = extract_text_from_pdf(pdf_path)
+            if not text:
+                print(f"⚠️ No se pudo extraer texto de {titulo}")
+                continue
+
+            # Hash y metadatos
+            hash_val = hashlib.sha256(text.encode()).hexdigest()
+            metadata = {
+                "title": titulo,
+                "source": pdf_path,
+                "id": doc_id,
+                "tipo": "normativa",
+                "fecha_insercion": datetime.datetime.utcnow().isoformat(),
+            }
+
+            # --- Insertar documento completo en normativa_global ---
+            normativa_doc = {
+                "id": doc_id,
+                "text": text,
+                "metadata": metadata,
+                "hash": hash_val,
+            }
+            normativa_col.insert_one(normativa_doc)
+
+            # --- Crear chunks y añadir a embeddings ---
+            chunks = splitter.create_documents([text], metadatas=[metadata])
+            embeddings_changed = True  # también si add_documents falla a medias
+            vectorstore.add_documents(chunks)
+            ingested_hashes.append({"id": doc_id, "hash": hash_val})
+
+            print(f"✅ {titulo}: insertado en normativa_global y vectorizado ({len(chunks)} chunks)")
+    finally:
+        # --- Nueva versión del corpus (invalida las cachés dependientes de la normativa) ---
+        # Se sube siempre que `embeddings` haya cambiado, aunque la ingesta se interrumpa:
+        # la caché de resultados del retriever y la de generación dejan de acertar al momento.
+        if embeddings_changed:
+            # Cada ingesta añade chunks al corpus existente: la versión encadena la anterior
+            previous = await get_corpus_version("normativa")
+            version = await bump_corpus_version("normativa", sha256_hex({"prev": previous, "docs": ingested_hashes}))
+            print(f"🔖 Versión del corpus normativa: {version[:12]}")
+
+            # --- Índice vectorial local: refresco incremental con los chunks recién vectorizados ---
+            if VECTOR_BACKEND == "local" or os.getenv("VECTOR_INDEX_REFRESH_ON_INGEST", "false").lower() == "true":
+                refresh_from_collection(client[DB_NAME][COLL_EMBEDDINGS], LocalVectorIndex(), model=MODEL_NAME)
 
     print("🎯 Todos los PDFs procesados correctamente.")
 
@@ -1,13 +1,39 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from backend.api.jn_routes import router as jn_router
 from backend.core.config import settings
+from backend.agents.orchestrator import init_orchestrator_runtime, shutdown_orchestrator_runtime
+from backend.core.job_queue import init_job_queue, shutdown_job_queue
+from backend.core.llm_client import aclose_llm_clients
+from backend.core.embedding_cache import save_query_embedding_cache
+from backend.core.embedding_service import init_embedding_service, shutdown_embedding_service
 from fastapi.middleware.cors import CORSMiddleware
 from backend.api.routes_expedientes import router as expedientes_router
 from backend.api.routes_outputs import router as outputs_router
 from backend.api.routes_normativa import router as normativa_router
-# from backend.api.routes_metrics import router as metrics_router  # Ojito: Implementar routes_metrics.py
+from backend.api.routes_jobs import router as jobs_router, run_generation_job
+from backend.api.routes_metrics import router as metrics_router
 
-app = FastAPI(title=settings.app_name)
+# Precalentar el modelo de embeddings al arrancar (desactivable en desarrollo)
+ORCHESTRATOR_WARMUP = os.getenv("ORCHESTRATOR_WARMUP", "true").lower() == "true"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Crea el grafo, los agentes y la cola de jobs una sola vez por proceso y los libera al apagar (incluidos los pools HTTP de los LLM y el volcado de la caché de embeddings)."""
+    await init_embedding_service()  # EMBEDDING_LOAD=startup: el modelo compartido se carga aquí
+    await init_orchestrator_runtime(warmup=ORCHESTRATOR_WARMUP)
+    await init_job_queue(runner=run_generation_job)
+    yield
+    await shutdown_job_queue()
+    await shutdown_orchestrator_runtime()
+    await aclose_llm_clients()
+    shutdown_embedding_service()
+    save_query_embedding_cache()
+
+
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,4 +57,5 @@ app.include_router(jn_router)
 app.include_router(expedientes_router)
 app.include_router(outputs_router)
 app.include_router(normativa_router)
-# app.include_router(metrics_router)  # Ojito: Descomentar cuando se implemente routes_metrics.py
\ No newline at end of file
+app.include_router(jobs_router)
+app.include_router(metrics_router)
\ No newline at end of file
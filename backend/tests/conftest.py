@@ -0,0 +1,101 @@
+"""
+Fixtures compartidas de los tests
+---------------------------------
+- make_retriever: RetrieverAgent construido con su constructor público, con backend,
+  búsqueda léxica y modelo de embeddings inyectados (sin Mongo ni SentenceTransformer),
+  y runtime aislado (caché de embeddings y política de búsqueda nuevas por test).
+- make_atlas_backend: AtlasVectorBackend real sobre FakeAtlasCollection (colección de
+  embeddings en memoria que responde a $vectorSearch y registra cada agregación).
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pytest
+
+from backend.agents.retriever_agent import AtlasVectorBackend, RetrieverAgent
+from backend.core.embedding_cache import QueryEmbeddingCache, set_query_embedding_cache
+from backend.core.embedding_service import EmbeddingService
+from backend.core.retrieval_policy import RetrievalPolicyManager, set_retrieval_policy_manager
+
+
+class ConstantEmbeddingModel:
+    """Modelo de embeddings fake: el mismo vector para cualquier texto (interfaz de SentenceTransformer)."""
+
+    def __init__(self, vector=(1.0, 0.0), delay: float = 0.0):
+        self.vector = list(vector)
+        self.delay = delay
+
+    def encode(self, texts, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        return [list(self.vector) for _ in texts]
+
+
+class FakeCursor:
+    def __init__(self, docs, delay: float = 0.0):
+        self.docs = docs
+        self.delay = delay
+
+    async def to_list(self, length=None):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.docs[:length]
+
+
+class FakeAtlasCollection:
+    """Devuelve `docs` respetando el `limit` de $vectorSearch y registra cada agregación."""
+
+    def __init__(self, docs, delay: float = 0.0):
+        self.docs = docs
+        self.delay = delay
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return FakeCursor(self.docs[: pipeline[0]["$vectorSearch"]["limit"]], self.delay)
+
+    @property
+    def limits(self):
+        return [pipeline[0]["$vectorSearch"]["limit"] for pipeline in self.pipelines]
+
+
+@pytest.fixture
+def make_atlas_backend():
+    """Fábrica de AtlasVectorBackend sobre FakeAtlasCollection: make_atlas_backend(docs, delay=0.0, **kwargs)."""
+    def make(docs, delay=0.0, **kwargs):
+        return AtlasVectorBackend(FakeAtlasCollection(docs, delay), **kwargs)
+
+    return make
+
+
+@pytest.fixture
+def make_retriever():
+    """
+    Fábrica de RetrieverAgent: make_retriever(backend, lexical=None, model=None, vector=(1.0, 0.0),
+    delay=0.0, policy_manager=None). Cierra los servicios de embeddings y restaura el runtime al terminar.
+    """
+    services = []
+    set_query_embedding_cache(QueryEmbeddingCache())
+    set_retrieval_policy_manager(RetrievalPolicyManager(store=None))
+
+    def make(backend, lexical=None, model=None, vector=(1.0, 0.0), delay=0.0, policy_manager=None):
+        embeddings = EmbeddingService(model_name="fake-embeddings", model=model or ConstantEmbeddingModel(vector, delay))
+        embeddings.batcher.max_wait_ms = 0
+        services.append(embeddings)
+        if policy_manager is not None:
+            set_retrieval_policy_manager(policy_manager)
+        return RetrieverAgent(backend=backend, embeddings=embeddings, lexical=lexical)
+
+    yield make
+
+    for embeddings in services:
+        embeddings.close()
+    set_query_embedding_cache(None)
+    set_retrieval_policy_manager(None)
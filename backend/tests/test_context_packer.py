@@ -0,0 +1,95 @@
+"""
+Test del empaquetado MMR del contexto
+-------------------------------------
+- Chunks contiguos del mismo documento y página se fusionan (el solape se paga una vez)
+- Casi-duplicados por embedding: entra uno y el hueco lo ocupa un chunk distinto
+- El contexto respeta el presupuesto de tokens
+- RetrieverAgent pide los embeddings a la búsqueda y expone el informe en debug
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import numpy as np
+
+from backend.core.context_packer import pack_context
+from backend.core.retrieval_policy import RetrievalPolicyManager
+from backend.core.token_budget import count_tokens
+
+ARTICULOS = " ".join(
+    f"Artículo {i}. El órgano de contratación podrá exigir garantías adicionales en el procedimiento "
+    f"abierto simplificado cuando concurran circunstancias especiales número {i}."
+    for i in range(40)
+)
+
+
+def _split(text, size=500, overlap=50):
+    """Como el splitter de la ingesta: chunks de `size` caracteres que solapan `overlap`."""
+    return [text[i:i + size] for i in range(0, len(text) - overlap, size - overlap)]
+
+
+def _vector(seed, dim=16):
+    return np.random.default_rng(seed).normal(size=dim).tolist()
+
+
+def test_adjacent_chunks_are_merged():
+    chunks = _split(ARTICULOS)[:3]
+    results = [
+        {"chunk_id": f"c{i}", "text": t, "source": "pdfs/lcsp.pdf", "page": 3, "score": 0.9 - i / 100,
+         "embedding": _vector(i)}
+        for i, t in enumerate([chunks[1], chunks[0], chunks[2]])
+    ]
+    selected, context, unused, report = pack_context(results, limit=3, budget_tokens=2000)
+
+    assert len(selected) == 3 and report["segments"] == 1 and report["merged"] == 2
+    assert context.startswith(chunks[0].strip()) and context.count("Artículo 3.") == 1
+    assert report["tokens_saved"] > 0 and report["tokens"] + report["tokens_saved"] == report["tokens_raw"]
+    print(f"✅ Chunks contiguos fusionados: {report}")
+
+
+def test_near_duplicates_are_dropped_for_diverse_chunks():
+    base = np.array(_vector(1))
+    results = [
+        {"chunk_id": "a", "text": "Texto del artículo 28 sobre necesidad e idoneidad del contrato.", "score": 0.95,
+         "embedding": base.tolist()},
+        {"chunk_id": "a2", "text": "Texto del artículo 28, sobre necesidad e idoneidad del contrato.", "score": 0.94,
+         "embedding": (base + 0.01).tolist()},
+        {"chunk_id": "b", "text": "Régimen de garantías provisionales y definitivas.", "score": 0.80,
+         "embedding": _vector(2)},
+    ]
+    selected, context, unused, report = pack_context(results, limit=2, budget_tokens=2000)
+    assert [r["chunk_id"] for r in selected] == ["a", "b"]
+    assert report["near_duplicates"] == 1 and report["tokens_saved"] > 0
+    print("✅ Casi-duplicado descartado")
+
+
+def test_context_fits_token_budget():
+    results = [{"chunk_id": f"c{i}", "text": t, "score": 1 - i / 100, "source": f"doc{i}.pdf", "page": 1}
+               for i, t in enumerate(_split(ARTICULOS))]
+    selected, context, unused, report = pack_context(results, limit=10, budget_tokens=300)
+    assert count_tokens(context) <= 300 and report["tokens"] <= 300
+    assert report["truncated"] and context.endswith("…")
+    assert unused == 10 - len(selected) > 0
+    print(f"✅ Presupuesto de tokens respetado: {report['tokens']}/300")
+
+
+def test_retriever_reports_context_packing(make_retriever, make_atlas_backend):
+    chunks = _split(ARTICULOS)
+    docs = [{"chunk_id": f"c{i}", "text": t, "title": "LCSP", "source": "pdfs/lcsp.pdf", "page": 3,
+             "score": 0.9 - i / 100, "embedding": _vector(i)} for i, t in enumerate(chunks)]
+    agent = make_retriever(make_atlas_backend(docs, include_embeddings=True), vector=_vector(0),
+                           policy_manager=RetrievalPolicyManager(store=None, default_limit=4))
+    collection = agent.backend.collection
+
+    result = asyncio.run(agent.ainvoke({"user_text": "garantías adicionales"}))
+
+    assert collection.pipelines[0][1]["$project"]["embedding"] == 1
+    packing = result["debug"]["context_packing"]
+    assert packing["strategy"] == "mmr" and packing["merged"] >= 1 and packing["tokens_saved"] > 0
+    assert all("embedding" not in m for m in result["matches"])
+    print(f"✅ RetrieverAgent con empaquetado MMR: {packing}")
@@ -0,0 +1,122 @@
+"""
+Test del micro-batcher de embeddings
+------------------------------------
+- Consultas concurrentes se agrupan en una sola llamada encode
+- El event loop sigue atendiendo otras tareas mientras se codifica
+- Los errores del modelo llegan a cada llamante
+- Llamadas síncronas y tamaño máximo de lote
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pytest
+
+from backend.core.embedding_batcher import EmbeddingBatcher
+
+
+class SlowModel:
+    """Sustituto de SentenceTransformer: bloquea el hilo `delay` segundos por lote."""
+
+    def __init__(self, delay: float = 0.05, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.batches = []
+        self.threads = set()
+
+    def encode(self, texts):
+        self.threads.add(threading.current_thread().name)
+        self.batches.append(list(texts))
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("modelo roto")
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+@pytest.fixture
+def model():
+    return SlowModel()
+
+
+def test_concurrent_queries_are_coalesced(model):
+    batcher = EmbeddingBatcher(model, batch_size=32, max_wait_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(batcher.encode("x" * i) for i in range(1, 11)))
+
+    try:
+        vectors = asyncio.run(run())
+    finally:
+        batcher.close()
+    assert [v[0] for v in vectors] == [float(i) for i in range(1, 11)]
+    assert len(model.batches) == 1
+    assert model.threads == {"embed-batcher"}
+    print(f"✅ 10 consultas concurrentes → {len(model.batches)} llamada encode")
+
+
+def test_event_loop_is_not_blocked(model):
+    model.delay = 0.3
+    batcher = EmbeddingBatcher(model, max_wait_ms=0)
+
+    async def run():
+        ticks = 0
+
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        beat = asyncio.create_task(heartbeat())
+        await batcher.encode("consulta")
+        beat.cancel()
+        return ticks
+
+    try:
+        ticks = asyncio.run(run())
+    finally:
+        batcher.close()
+    assert ticks >= 10
+    print(f"✅ Event loop libre durante encode ({ticks} latidos)")
+
+
+def test_model_errors_reach_every_caller():
+    batcher = EmbeddingBatcher(SlowModel(fail=True), max_wait_ms=20)
+
+    async def run():
+        return await asyncio.gather(batcher.encode("a"), batcher.encode("b"), return_exceptions=True)
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        batcher.close()
+    assert all(isinstance(r, RuntimeError) for r in results)
+    print("✅ Error del modelo propagado a todos los llamantes")
+
+
+def test_sync_callers_and_batch_size_limit(model):
+    model.delay = 0.01
+    batcher = EmbeddingBatcher(model, batch_size=4, max_wait_ms=50)
+    results = [None] * 10
+
+    def call(i):
+        results[i] = batcher.encode_sync("y" * (i + 1), timeout=5)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(10)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        batcher.close()
+    assert [r[0] for r in results] == [float(i + 1) for i in range(10)]
+    assert max(len(b) for b in model.batches) <= 4
+    print(f"✅ Lotes síncronos: {[len(b) for b in model.batches]}")
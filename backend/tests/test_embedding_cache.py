@@ -0,0 +1,64 @@
+"""
+Test de la caché de embeddings de consultas
+-------------------------------------------
+- Consultas que solo difieren en espacios comparten entrada; el modelo forma parte de la clave
+- Expulsión LRU y tasa de aciertos
+- Persistencia en disco entre instancias
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+from backend.core.embedding_cache import QueryEmbeddingCache
+from backend.core.metrics import QUERY_EMBEDDING_CACHE_LOOKUPS
+
+
+def test_normalized_text_and_model_form_the_key():
+    cache = QueryEmbeddingCache(max_entries=10)
+    calls = []
+
+    async def encode(text):
+        calls.append(text)
+        return [1.0, 2.0]
+
+    async def run():
+        await cache.aget_or_compute("  mercadillo   en la plaza ", "sentence-transformers/all-MiniLM-L6-v2", encode)
+        await cache.aget_or_compute("mercadillo en la plaza", "all-MiniLM-L6-v2", encode)
+        await cache.aget_or_compute("mercadillo en la plaza", "otro-modelo", encode)
+
+    hits_before = QUERY_EMBEDDING_CACHE_LOOKUPS.value(model="all-MiniLM-L6-v2", result="hit")
+    asyncio.run(run())
+    assert calls == ["mercadillo en la plaza", "mercadillo en la plaza"]
+    assert QUERY_EMBEDDING_CACHE_LOOKUPS.value(model="all-MiniLM-L6-v2", result="hit") == hits_before + 1
+    assert cache.stats()["hit_rate"] == round(1 / 3, 4)
+    print("✅ Clave = (modelo, texto normalizado)")
+
+
+def test_lru_eviction():
+    cache = QueryEmbeddingCache(max_entries=2)
+    cache.put("a", "m", [1.0])
+    cache.put("b", "m", [2.0])
+    assert cache.get("a", "m") == [1.0]  # "a" pasa a ser la más reciente
+    cache.put("c", "m", [3.0])
+    assert cache.get("b", "m") is None
+    assert cache.get("a", "m") == [1.0] and cache.get("c", "m") == [3.0]
+    print("✅ Expulsión LRU")
+
+
+def test_disk_persistence(tmp_path):
+    path = str(tmp_path / "query_embeddings.npz")
+    cache = QueryEmbeddingCache(path=path)
+    cache.put("consulta uno", "all-MiniLM-L6-v2", [0.25, 0.5])
+    cache.put("consulta dos", "all-MiniLM-L6-v2", [0.75, 1.0])
+    assert cache.save()
+    assert not cache.save()  # sin cambios no se reescribe
+
+    reloaded = QueryEmbeddingCache(path=path)
+    assert len(reloaded) == 2
+    assert reloaded.get("consulta dos", "sentence-transformers/all-MiniLM-L6-v2") == [0.75, 1.0]
+    print("✅ Caché persistida y recargada desde disco")
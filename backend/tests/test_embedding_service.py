@@ -0,0 +1,111 @@
+"""
+Test del servicio de embeddings compartido
+------------------------------------------
+- Importar el retriever no carga torch ni el modelo (carga perezosa)
+- Un solo modelo: el RetrieverAgent reutiliza el servicio del proceso (o el inyectado)
+- Consultas concurrentes agrupadas en una llamada `encode`; documentos por lotes
+- `embed_query` de LangChain pasa por la caché de embeddings de consultas
+"""
+
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import numpy as np
+import pytest
+
+import backend.agents.retriever_agent as retriever_module
+from backend.core.embedding_cache import QueryEmbeddingCache, set_query_embedding_cache
+from backend.core.embedding_service import EmbeddingService, get_embedding_service, set_embedding_service
+
+
+class FakeSentenceTransformer:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        self.calls.append(list(texts))
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def service():
+    model = FakeSentenceTransformer()
+    service = EmbeddingService(model_name="all-MiniLM-L6-v2", model=model)
+    service.fake = model
+    set_embedding_service(service)
+    set_query_embedding_cache(QueryEmbeddingCache())
+    yield service
+    service.close()
+    set_embedding_service(None)
+    set_query_embedding_cache(None)
+
+
+def test_import_does_not_load_the_model():
+    code = (
+        "import sys; import backend.agents.retriever_agent, backend.core.embedding_service; "
+        "print('sentence_transformers' in sys.modules, 'torch' in sys.modules)"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=root_dir, capture_output=True, text=True, timeout=120)
+    assert out.stdout.strip().splitlines()[-1] == "False False"
+    assert not EmbeddingService().loaded
+    print("✅ Importar no carga el modelo")
+
+
+def test_retriever_reuses_process_service(service, monkeypatch):
+    monkeypatch.setattr(retriever_module, "MONGO_URI", "mongodb://localhost:27017")
+    monkeypatch.setattr(retriever_module, "VECTOR_BACKEND", "atlas")
+    agent = retriever_module.RetrieverAgent()
+    try:
+        assert agent.embeddings is get_embedding_service() is service
+        assert agent.batcher is service.batcher
+    finally:
+        agent.close()
+    assert service.batcher is not None  # cerrar el agente no cierra el servicio compartido
+    print("✅ RetrieverAgent usa el modelo compartido")
+
+
+def test_retriever_with_injected_dependencies(make_retriever, monkeypatch):
+    """Con backend inyectado no se exige MONGO_URI ni se abre Motor; embeddings y léxica son los inyectados"""
+    monkeypatch.setattr(retriever_module, "MONGO_URI", None)
+    monkeypatch.setattr(retriever_module, "VECTOR_BACKEND", "atlas")
+    backend, lexical = retriever_module.AtlasVectorBackend(collection=None), object()
+
+    agent = make_retriever(backend, lexical=lexical)
+
+    assert agent.backend is backend and agent.lexical is lexical and agent.client is None
+    assert agent.embeddings.model_name == "fake-embeddings" and agent.batcher is agent.embeddings.batcher
+    assert make_retriever(backend).lexical is None  # sin léxica inyectada: solo vectorial
+    with pytest.raises(RuntimeError):
+        retriever_module.RetrieverAgent()  # sin backend sigue haciendo falta MONGO_URI
+    print("✅ RetrieverAgent con dependencias inyectadas")
+
+
+def test_async_queries_are_batched(service):
+    service.batcher.max_wait_ms = 20
+
+    async def run():
+        return await asyncio.gather(*(service.aencode(f"consulta {i}") for i in range(8)))
+
+    vectors = asyncio.run(run())
+    assert len(vectors) == 8 and vectors[3] == [10.0, 1.0]
+    assert len(service.fake.calls) < 8
+    print(f"✅ 8 consultas en {len(service.fake.calls)} llamada(s) a encode")
+
+
+def test_langchain_interface(service):
+    docs = service.embed_documents(["línea uno\nlínea dos", "otro"])
+    assert service.fake.calls[-1] == ["línea uno línea dos", "otro"]  # como HuggingFaceEmbeddings
+    assert docs == [[19.0, 1.0], [4.0, 1.0]]
+    assert asyncio.run(service.aembed_documents(["abc"])) == [[3.0, 1.0]]
+
+    calls = len(service.fake.calls)
+    first = service.embed_query("artículo 28  LCSP")
+    second = asyncio.run(service.aembed_query("artículo 28 LCSP"))
+    assert first == second and len(service.fake.calls) == calls + 1  # el segundo sale de la caché
+    print("✅ Interfaz Embeddings de LangChain con caché de consultas")
@@ -0,0 +1,170 @@
+"""
+Test del modo offline (LLM_PROVIDER=fake)
+-----------------------------------------
+- get_llm devuelve el modelo fake con respuestas por task_type
+- Streaming y métricas de tokens
+- Flujo completo del grafo sin proveedores, Atlas ni Mongo
+- Rutas tras ValidatorA: retry → completed_after_retry y retry → fail → rejected
+- Percentiles del benchmark
+"""
+
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pytest
+
+from backend.core.llm_cache import LLMResponseCache, set_llm_cache
+from backend.core.llm_client import get_llm
+from backend.core.fake_llm import DEFAULT_RESPONSES, FakeChatModel, FAKE_MODEL_NAME
+from backend.core.metrics import LLM_REQUESTS
+
+
+@pytest.fixture(autouse=True)
+def fake_provider(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "0")
+    set_llm_cache(LLMResponseCache())  # solo memoria: sin Mongo
+    yield
+    set_llm_cache(None)
+
+
+def test_get_llm_returns_fake_model():
+    """LLM_PROVIDER=fake se impone incluso a un proveedor explícito"""
+    llm = get_llm(provider="openai", task_type="json_a")
+    assert isinstance(llm.client, FakeChatModel)
+    assert llm.model_name == FAKE_MODEL_NAME
+
+    before = LLM_REQUESTS.value(task_type="json_a", model=FAKE_MODEL_NAME)
+    response = asyncio.run(llm.ainvoke("prompt"))
+    data = json.loads(response.content)
+    assert set(data["secciones_JN"]) == {"objeto", "alcance", "ambito"}
+    assert LLM_REQUESTS.value(task_type="json_a", model=FAKE_MODEL_NAME) == before + 1
+    print("✅ Modelo fake seleccionado y contabilizado")
+
+
+def test_fake_stream_and_latency():
+    """El streaming reconstruye la narrativa y respeta la latencia configurada"""
+    llm = FakeChatModel.from_env(task_type="json_b")
+    llm.latency_ms = 50
+
+    async def collect():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        parts = [chunk.content async for chunk in llm.astream("prompt")]
+        return parts, loop.time() - started
+
+    parts, elapsed = asyncio.run(collect())
+    assert len(parts) > 1
+    assert "".join(parts) == llm.invoke("prompt").content
+    assert elapsed >= 0.04
+    print(f"✅ Streaming fake: {len(parts)} fragmentos en {elapsed * 1000:.0f} ms")
+
+
+def test_offline_graph_completes():
+    """El grafo completo termina en 'completed' con agentes offline"""
+    from backend.benchmarks.bench_pipeline import BENCH_REQUEST, InMemoryOutputSink, OfflineRetriever
+    from backend.agents.orchestrator import OrchestratorAgents, build_orchestrator
+
+    sink = InMemoryOutputSink()
+    agents = OrchestratorAgents(retriever=OfflineRetriever(latency_ms=0), output_sink=sink)
+    graph = build_orchestrator(agents=agents)
+    final_state = asyncio.run(graph.ainvoke(dict(BENCH_REQUEST)))
+
+    assert final_state["path_taken"] == "completed"
+    assert final_state["validation_b_passed"]
+    assert [o["nodo"] for o in sink.saved] == ["A", "B"]
+    print("✅ Grafo offline completado")
+
+
+# JSON_A sin las secciones obligatorias; la reparación tampoco las añade → ValidatorA rechaza
+INVALID_JSON_A = {"secciones_JN": {"objeto": ""}}
+INVALID_REPAIR = {"foo": 1}
+
+
+def build_routing_graph(monkeypatch, tmp_path):
+    """Grafo offline con JSON_A inválido (FAKE_LLM_RESPONSES_FILE) y output_mode de texto."""
+    from backend.benchmarks.bench_pipeline import InMemoryOutputSink, OfflineRetriever
+    from backend.agents.orchestrator import OrchestratorAgents, build_orchestrator
+
+    responses_file = tmp_path / "responses.json"
+    responses_file.write_text(json.dumps({"json_a": INVALID_JSON_A, "json_repair": INVALID_REPAIR}), encoding="utf-8")
+    monkeypatch.setenv("FAKE_LLM_RESPONSES_FILE", str(responses_file))
+
+    sink = InMemoryOutputSink()
+    agents = OrchestratorAgents(retriever=OfflineRetriever(latency_ms=0), output_sink=sink)
+    return agents, sink, build_orchestrator(agents=agents)
+
+
+def routing_request():
+    from backend.benchmarks.bench_pipeline import BENCH_REQUEST
+    # Texto y sin hedging: una llamada al proveedor por intento de GeneratorA
+    return dict(BENCH_REQUEST, output_mode="text", hedge_llm=False)
+
+
+def test_invalid_json_a_is_rejected_without_generator_b(monkeypatch, tmp_path):
+    """JSON_A inválido dos veces: retry → fail → rejected, sin llamar a GeneratorB"""
+    agents, sink, graph = build_routing_graph(monkeypatch, tmp_path)
+    calls_a = LLM_REQUESTS.value(task_type="json_a", model=FAKE_MODEL_NAME)
+    calls_b = LLM_REQUESTS.value(task_type="json_b", model=FAKE_MODEL_NAME)
+
+    final_state = asyncio.run(graph.ainvoke(routing_request()))
+
+    assert final_state["route_history"] == ["validator_a:retry", "validator_a:fail"]
+    assert final_state["generation_a_attempts"] == 2
+    assert final_state["path_taken"] == "rejected"
+    assert not final_state.get("json_b")
+    assert [o["nodo"] for o in sink.saved] == ["A", "A"]
+    # El reintento llega al proveedor: ni la caché ni nada devuelve la respuesta rechazada
+    assert LLM_REQUESTS.value(task_type="json_a", model=FAKE_MODEL_NAME) == calls_a + 2
+    assert LLM_REQUESTS.value(task_type="json_b", model=FAKE_MODEL_NAME) == calls_b
+    print("✅ JSON_A rechazado tras 2 intentos sin generar narrativa")
+
+
+def test_retry_recovers_and_completes(monkeypatch, tmp_path):
+    """JSON_A inválido solo en el primer intento: retry → continue → completed_after_retry"""
+    agents, sink, graph = build_routing_graph(monkeypatch, tmp_path)
+    generator_a = agents.generator_a
+    original_ainvoke = generator_a.ainvoke
+
+    async def ainvoke_then_fix(state, *args, **kwargs):
+        result = await original_ainvoke(state, *args, **kwargs)
+        # A partir del segundo intento el proveedor responde un JSON_A válido
+        generator_a.llm.client.responses = dict(generator_a.llm.client.responses, json_a=DEFAULT_RESPONSES["json_a"])
+        return result
+
+    generator_a.ainvoke = ainvoke_then_fix
+    calls_a = LLM_REQUESTS.value(task_type="json_a", model=FAKE_MODEL_NAME)
+
+    final_state = asyncio.run(graph.ainvoke(routing_request()))
+
+    assert final_state["route_history"] == ["validator_a:retry", "validator_a:continue"]
+    assert final_state["generation_a_attempts"] == 2
+    assert final_state["path_taken"] == "completed_after_retry"
+    assert final_state["validation_b_passed"]
+    assert [o["nodo"] for o in sink.saved] == ["A", "A", "B"]
+    assert LLM_REQUESTS.value(task_type="json_a", model=FAKE_MODEL_NAME) == calls_a + 2
+    print("✅ Reintento de GeneratorA recuperado")
+
+
+def test_percentile():
+    from backend.benchmarks.bench_pipeline import percentile
+
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50.5
+    assert round(percentile(values, 99), 2) == 99.01
+    assert percentile([], 95) == 0.0
+
+
+if __name__ == "__main__":
+    os.environ["LLM_PROVIDER"] = "fake"
+    test_get_llm_returns_fake_model()
+    test_fake_stream_and_latency()
+    test_offline_graph_completes()
+    test_percentile()
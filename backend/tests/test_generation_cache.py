@@ -0,0 +1,139 @@
+"""
+Test de la caché de generación
+------------------------------
+Usa InMemoryGenerationCacheStore, el modelo fake y agentes offline (sin Mongo ni Atlas):
+- Clave canónica estable y dependiente de la versión del corpus
+- Acierto tras una ejecución completada, sin volver a ejecutar el grafo
+- force_regenerate y ejecuciones rechazadas no se sirven desde caché
+- Cambiar retrieval_mode, rerank o el contexto precargado cambia la clave
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pytest
+
+from backend.core.llm_cache import LLMResponseCache, set_llm_cache
+from backend.core.generation_cache import GenerationCache, InMemoryGenerationCacheStore, generation_key, set_generation_cache
+
+REQUEST = {
+    "expediente_id": "EXP-CACHE",
+    "documento": "JN",
+    "seccion": "JN.1",
+    "user_text": "Queremos montar un mercadillo con 15 puestos en la plaza del pueblo.",
+}
+
+
+@pytest.fixture(autouse=True)
+def fake_provider(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "0")
+    set_llm_cache(LLMResponseCache())  # solo memoria: sin Mongo
+    yield
+    set_llm_cache(None)
+
+
+def make_cache(versions):
+    async def corpus_version():
+        return versions[-1]
+    return GenerationCache(InMemoryGenerationCacheStore(), corpus_version_fn=corpus_version, enabled=True)
+
+
+def test_generation_key_is_canonical():
+    """Espacios triviales comparten clave; otra versión del corpus no"""
+    base = generation_key("EXP-1", "JN", "JN.1", "Mercadillo  en la\nplaza ", "v1")
+    assert base == generation_key("EXP-1", "JN", "JN.1", "Mercadillo en la plaza", "v1")
+    assert base != generation_key("EXP-1", "JN", "JN.1", "Mercadillo en la plaza", "v2")
+    assert base != generation_key("EXP-1", "JN", "JN.2", "Mercadillo en la plaza", "v1")
+
+
+def test_retrieval_options_change_the_key():
+    """retrieval_mode, rerank y el texto del contexto precargado no comparten entrada"""
+    async def scenario():
+        cache = make_cache(["v1"])
+        completed = {"path_taken": "completed", "validation_b_passed": True,
+                     "json_a": {"json": {}}, "json_b": {"narrativa": "vectorial"}}
+        state = dict(REQUEST, retrieval_mode="vector")
+        assert await cache.lookup(state) is None
+        await cache.remember({**state, **completed})
+        assert await cache.lookup(dict(REQUEST, retrieval_mode="vector"))
+
+        assert await cache.lookup(dict(REQUEST, retrieval_mode="hybrid")) is None
+        assert await cache.lookup(dict(REQUEST, retrieval_mode="vector", rerank=True)) is None
+        assert await cache.lookup(dict(REQUEST, retrieval_mode="vector", hedge_llm=True)) is None
+        # Sección de un lote: mismo texto de sección, contexto recuperado con otro texto
+        prefetched = dict(REQUEST, retrieval_mode="vector", rag_prefetched=True, rag_query="Texto del lote")
+        assert await cache.lookup(prefetched) is None
+
+    asyncio.run(scenario())
+    print("✅ Las opciones de retrieval forman parte de la clave")
+
+
+def test_only_completed_runs_are_cached():
+    """Las ejecuciones rechazadas no se guardan; force_regenerate omite la consulta"""
+    async def scenario():
+        cache = make_cache(["v1"])
+        state = dict(REQUEST)
+        assert await cache.lookup(state) is None
+
+        await cache.remember({**state, "path_taken": "rejected"})
+        assert await cache.lookup(dict(REQUEST)) is None
+
+        await cache.remember({**state, "path_taken": "completed", "validation_b_passed": True,
+                              "json_a": {"json": {}}, "json_b": {"narrativa": "texto"}})
+        hit = await cache.lookup(dict(REQUEST))
+        assert hit["cache_hit"] and hit["json_b"] == {"narrativa": "texto"}
+        assert await cache.lookup(dict(REQUEST), force_regenerate=True) is None
+
+    asyncio.run(scenario())
+    print("✅ Solo se cachean ejecuciones completadas")
+
+
+def test_run_section_hits_cache_and_invalidates_on_corpus_change():
+    """La segunda ejecución sale de la caché; un nuevo corpus vuelve a ejecutar el grafo"""
+    from backend.benchmarks.bench_pipeline import InMemoryOutputSink, OfflineRetriever
+    from backend.agents.orchestrator import (
+        OrchestratorAgents,
+        init_orchestrator_runtime,
+        run_section,
+        shutdown_orchestrator_runtime,
+    )
+
+    async def scenario():
+        versions = ["v1"]
+        set_generation_cache(make_cache(versions))
+        sink = InMemoryOutputSink()
+        agents = OrchestratorAgents(retriever=OfflineRetriever(latency_ms=0), output_sink=sink)
+        await init_orchestrator_runtime(warmup=False, agents=agents)
+        try:
+            first, run_id = await run_section(REQUEST)
+            assert first["path_taken"] == "completed" and run_id
+            assert len(sink.saved) == 2
+
+            second, run_id = await run_section(REQUEST)
+            assert second["cache_hit"] and run_id is None
+            assert second["json_a"] == first["json_a"]
+            assert len(sink.saved) == 2  # sin nuevos outputs → el grafo no se ejecutó
+
+            versions.append("v2")  # nueva ingesta de normativa
+            third, _ = await run_section(REQUEST)
+            assert not third.get("cache_hit")
+            assert len(sink.saved) == 4
+        finally:
+            await shutdown_orchestrator_runtime()
+            set_generation_cache(None)
+
+    asyncio.run(scenario())
+    print("✅ Caché de generación delante del orquestador")
+
+
+if __name__ == "__main__":
+    test_generation_key_is_canonical()
+    test_retrieval_options_change_the_key()
+    test_only_completed_runs_are_cached()
+    test_run_section_hits_cache_and_invalidates_on_corpus_change()
@@ -0,0 +1,144 @@
+"""
+Test de peticiones hedged
+-------------------------
+Dos modelos fake con latencias distintas simulan los proveedores:
+- Si el principal es rápido no se lanza el alternativo
+- Si el principal tarda más que el retardo gana el alternativo y el principal se cancela
+- Si el principal devuelve algo que no parsea, el alternativo se lanza inmediatamente
+- La perdedora ya está cancelada (y limpia) cuando se devuelve la respuesta
+- Una llamada hedged no hace además el failover de LLMHandle
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import httpx
+
+from backend.agents.generators.output_parser import OutputParser
+from backend.core import llm_resilience
+from backend.core.fake_llm import FakeChatModel
+from backend.core.hedging import HedgedLLM
+from backend.core.llm_client import LLMHandle
+from backend.core.llm_resilience import reset_breakers
+from backend.core.metrics import LLM_HEDGE_REQUESTS
+
+
+def _handle(provider: str, latency_ms: float, response: str = None) -> LLMHandle:
+    responses = {"json_a": response} if response is not None else {}
+    model = FakeChatModel(task_type="json_a", latency_ms=latency_ms, responses=responses)
+    return LLMHandle(model, provider, f"fake-{provider}", "json_a")
+
+
+def _hedged(primary, secondary, delay_ms):
+    return HedgedLLM(
+        primary, task_type="json_a", delay_ms=delay_ms, secondary=secondary,
+        accept=lambda content: OutputParser.parse_json(content, strict=False)[1] is None,
+    )
+
+
+def test_fast_primary_does_not_fire_secondary():
+    hedged = _hedged(_handle("openai", 5), _handle("groq", 5), delay_ms=500)
+    before = LLM_HEDGE_REQUESTS.value(task_type="json_a", outcome="primary_only")
+
+    response, info = asyncio.run(hedged.ainvoke("prompt"))
+
+    assert info["winner"] == "openai" and info["role"] == "primary"
+    assert not info["secondary_fired"]
+    assert "secciones_JN" in response.content
+    assert LLM_HEDGE_REQUESTS.value(task_type="json_a", outcome="primary_only") == before + 1
+    print("✅ Principal rápido: sin segunda petición")
+
+
+def test_slow_primary_loses_to_secondary():
+    hedged = _hedged(_handle("openai", 2000), _handle("groq", 20), delay_ms=50)
+
+    started = time.perf_counter()
+    response, info = asyncio.run(hedged.ainvoke("prompt"))
+    elapsed = time.perf_counter() - started
+
+    assert info["winner"] == "groq" and info["role"] == "secondary"
+    assert info["secondary_fired"] and info["accepted"]
+    assert elapsed < 1.0  # no espera al principal (cancelado)
+    assert info["latency_ms"] < 1000
+    print(f"✅ Gana el alternativo en {info['latency_ms']} ms")
+
+
+def test_unparseable_primary_fires_secondary_immediately():
+    hedged = _hedged(_handle("openai", 5, response="esto no es JSON"), _handle("groq", 5), delay_ms=5000)
+
+    started = time.perf_counter()
+    response, info = asyncio.run(hedged.ainvoke("prompt"))
+
+    assert time.perf_counter() - started < 1.0  # no espera el retardo
+    assert info["winner"] == "groq"
+    assert info["discarded"][0]["reason"] == "unparseable"
+    assert OutputParser.parse_json(response.content)[1] is None
+    print("✅ Respuesta inválida del principal → alternativo inmediato")
+
+
+class CancellationTrackingChatModel(FakeChatModel):
+    """Modelo fake que anota si su llamada terminó de limpiar tras cancelarse."""
+
+    cleaned_up: bool = False
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        try:
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        finally:
+            self.cleaned_up = True
+
+
+def test_losing_request_is_awaited_before_returning():
+    slow_model = CancellationTrackingChatModel(task_type="json_a", latency_ms=2000)
+    slow_primary = LLMHandle(slow_model, "openai", "fake-openai", "json_a")
+    hedged = _hedged(slow_primary, _handle("groq", 20), delay_ms=20)
+
+    async def scenario():
+        response, info = await hedged.ainvoke("prompt")
+        return info, slow_model.cleaned_up  # sin ceder el bucle: la perdedora ya terminó
+
+    info, cleaned_up = asyncio.run(scenario())
+    assert info["winner"] == "groq" and cleaned_up
+    print("✅ La petición perdedora se espera tras cancelarla")
+
+
+class UnavailableChatModel(FakeChatModel):
+    """Proveedor caído: siempre responde 503."""
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        request = httpx.Request("POST", "https://api.example.test/v1/chat/completions")
+        response = httpx.Response(503, request=request)
+        raise httpx.HTTPStatusError("HTTP 503", request=request, response=response)
+
+
+class CountingChatModel(FakeChatModel):
+    calls: int = 0
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def test_hedged_call_skips_handle_failover(monkeypatch):
+    monkeypatch.setattr(llm_resilience, "LLM_RETRY_MAX_ATTEMPTS", 1)
+    reset_breakers()
+    primary = LLMHandle(UnavailableChatModel(task_type="json_a", latency_ms=0), "openai", "gpt-down", "json_a")
+    failover_model = CountingChatModel(task_type="json_a", latency_ms=0)
+    primary._failover = LLMHandle(failover_model, "groq", "fake-groq-failover", "json_a")
+    primary._failover_resolved = True
+    hedged = _hedged(primary, _handle("groq", 5), delay_ms=5000)
+
+    try:
+        response, info = asyncio.run(hedged.ainvoke("prompt"))
+    finally:
+        reset_breakers()
+
+    assert info["winner"] == "groq" and info["role"] == "secondary"
+    assert failover_model.calls == 0  # solo el hedge llega al proveedor alternativo
+    print("✅ Sin failover duplicado en llamadas hedged")
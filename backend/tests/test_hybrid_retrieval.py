@@ -0,0 +1,91 @@
+"""
+Test de la recuperación híbrida (léxica + vectorial)
+----------------------------------------------------
+- Reciprocal rank fusion: deduplica por chunk y premia lo que encuentran ambas fuentes
+- Ambas búsquedas corren en paralelo y se informa la latencia de cada fuente
+- Si la léxica falla se sigue solo con la vectorial
+- Modo configurable por petición
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pytest
+
+from backend.agents.retriever_agent import reciprocal_rank_fusion
+
+
+def _chunk(cid, score):
+    return {"chunk_id": cid, "text": f"texto del chunk {cid} " + "x" * 150, "title": cid, "score": score}
+
+
+class SlowSource:
+    def __init__(self, results, delay=0.2, fail=False):
+        self.results = results
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def search(self, *args):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("text index required for $text query")
+        return list(self.results)
+
+
+@pytest.fixture
+def agent(make_retriever, make_atlas_backend):
+    backend = make_atlas_backend([_chunk("v1", 0.9), _chunk("both", 0.8), _chunk("v3", 0.7)], delay=0.2)
+    return make_retriever(backend, lexical=SlowSource([_chunk("art28", 12.0), _chunk("both", 7.5)]))
+
+
+def test_rrf_dedupes_and_rewards_agreement():
+    fused = reciprocal_rank_fusion({
+        "vector": [_chunk("a", 0.9), _chunk("b", 0.8), _chunk("c", 0.7)],
+        "lexical": [_chunk("c", 10.0), _chunk("d", 5.0)],
+    }, k=60)
+    assert [r["chunk_id"] for r in fused] == ["c", "a", "b", "d"]
+    assert fused[0]["sources"] == ["vector", "lexical"]
+    assert fused[0]["vector_score"] == 0.7 and fused[0]["lexical_score"] == 10.0
+    assert fused[0]["score"] == pytest.approx(1 / 63 + 1 / 61)
+    print("✅ RRF: deduplicado por chunk y fusionado")
+
+
+def test_hybrid_runs_sources_concurrently(agent):
+    started = time.perf_counter()
+    result = asyncio.run(agent.ainvoke({"user_text": "artículo 28 LCSP", "retrieval_mode": "hybrid"}))
+    elapsed = time.perf_counter() - started
+
+    assert result["status"] == "ok"
+    assert elapsed < 0.38  # 0.2 s cada fuente: en paralelo, no 0.4 s
+    debug = result["debug"]
+    assert debug["retrieval_mode"] == "hybrid"
+    assert set(debug["sources"]) == {"vector", "lexical"}
+    assert debug["sources"]["lexical"]["latency_ms"] >= 150
+    titles = [m["title"] for m in result["matches"]]
+    assert titles[0] == "both" and "art28" in titles and len(titles) == len(set(titles))
+    print(f"✅ Híbrida en {elapsed * 1000:.0f} ms — fuentes: {debug['sources']}")
+
+
+def test_vector_mode_skips_lexical(agent):
+    result = asyncio.run(agent.ainvoke({"user_text": "artículo 28 LCSP", "retrieval_mode": "vector"}))
+    assert agent.lexical.calls == 0
+    assert result["debug"]["retrieval_mode"] == "vector"
+    assert set(result["debug"]["sources"]) == {"vector"}
+    print("✅ Modo vectorial por petición")
+
+
+def test_lexical_failure_falls_back_to_vector(agent):
+    agent.lexical.fail = True
+    result = asyncio.run(agent.ainvoke({"user_text": "CPV 45233142-6", "retrieval_mode": "hybrid"}))
+    assert result["status"] == "ok"
+    assert "error" in result["debug"]["sources"]["lexical"]
+    assert [m["title"] for m in result["matches"]][:3] == ["v1", "both", "v3"]
+    print("✅ Fallo léxico → solo vectorial")
@@ -0,0 +1,217 @@
+"""
+Test de los endpoints del orquestador con el LLM fake
+-----------------------------------------------------
+Agentes offline (LLM_PROVIDER=fake, retriever fijo, outputs en memoria), sin Atlas ni Mongo:
+- /generar_jn_lote: una sola pasada de retrieval; cada sección recibe contexto,
+  citas y bloque debug igual que /generar_jn_orquestado (respuesta única y NDJSON)
+- Una sección que falla no arrastra al resto del lote; si falla el lote, NDJSON acaba con una línea de error
+- /generar_jn_orquestado/stream: eventos node → token → result en orden, y `error` si falla un nodo
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pytest
+from langgraph.checkpoint.memory import InMemorySaver
+
+from backend.core.llm_cache import LLMResponseCache, set_llm_cache
+
+# Solo JN.1 tiene instrucciones y esquema en este árbol; JN.9 no existe y debe fallar aislada
+SECCIONES = ["JN.1", "JN.9"]
+RETRIEVAL_DEBUG = {"retrieval_mode": "vector", "selected": 1, "cache": {"hit": False, "stored": True}}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Cliente HTTP en proceso contra el router de JN con el runtime offline inyectado."""
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "0")
+    set_llm_cache(LLMResponseCache())
+
+    import httpx
+    from fastapi import FastAPI
+    from backend.api.jn_routes import router
+    from backend.benchmarks.bench_pipeline import (
+        InMemoryOutputSink, OfflineRetriever, build_offline_generation_cache,
+    )
+    from backend.agents.orchestrator import (
+        OrchestratorAgents, init_orchestrator_runtime, shutdown_orchestrator_runtime,
+    )
+    from backend.core.generation_cache import set_generation_cache
+
+    class DebugRetriever(OfflineRetriever):
+        """Retriever offline que además devuelve el bloque debug y cuenta las consultas."""
+
+        def __init__(self):
+            super().__init__(latency_ms=0)
+            self.calls = 0
+
+        async def ainvoke(self, inputs):
+            self.calls += 1
+            return dict(await super().ainvoke(inputs), debug=RETRIEVAL_DEBUG)
+
+    retriever = DebugRetriever()
+    agents = OrchestratorAgents(retriever=retriever, output_sink=InMemoryOutputSink())
+    set_generation_cache(build_offline_generation_cache(False))
+    asyncio.run(init_orchestrator_runtime(warmup=False, agents=agents, checkpointer=InMemorySaver()))
+
+    app = FastAPI()
+    app.include_router(router)
+
+    def post(path, payload):
+        async def call():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as http:
+                return await http.post(path, json=payload)
+        return asyncio.run(call())
+
+    yield {"post": post, "retriever": retriever, "agents": agents}
+
+    asyncio.run(shutdown_orchestrator_runtime())
+    set_generation_cache(None)
+    set_llm_cache(None)
+
+
+def assert_section_like_single_endpoint(section, single):
+    """Una sección del lote trae las mismas claves de retrieval que /generar_jn_orquestado."""
+    assert section["success"]
+    assert section["path_taken"] == "completed"
+    assert section["json_a"] and section["json_b"]
+    assert section["rag_results_count"] == single["rag_results_count"] == 1
+    assert section["retrieval"] == single["retrieval"] == RETRIEVAL_DEBUG
+
+
+def test_batch_endpoint_shares_retrieval(client):
+    """/generar_jn_lote (respuesta única): un retrieval para todo el lote y citas/debug en cada sección"""
+    single = client["post"]("/justificacion/generar_jn_orquestado", {
+        "expediente_id": "EXP-SINGLE", "seccion": "JN.1", "user_text": "Mercadillo con 15 puestos",
+    })
+    assert single.status_code == 200
+    client["retriever"].calls = 0
+
+    response = client["post"]("/justificacion/generar_jn_lote", {
+        "expediente_id": "EXP-LOTE", "secciones": SECCIONES, "user_text": "Mercadillo con 15 puestos",
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    assert not body["success"] and body["expediente_id"] == "EXP-LOTE"
+    resultados = {r["seccion"]: r for r in body["resultados"]}
+    assert sorted(resultados) == SECCIONES
+    assert resultados["JN.1"]["expediente_id"] == "EXP-LOTE" and resultados["JN.1"]["run_id"]
+    assert_section_like_single_endpoint(resultados["JN.1"], single.json())
+    assert not resultados["JN.9"]["success"] and resultados["JN.9"]["error"]
+    # Los nodos retriever del grafo no vuelven a consultar: el lote ya trae el contexto
+    assert client["retriever"].calls == 1
+    print("✅ Lote con retrieval compartido")
+
+
+def test_batch_endpoint_ndjson_stream(client):
+    """/generar_jn_lote con stream=True: una línea NDJSON completa por sección"""
+    single = client["post"]("/justificacion/generar_jn_orquestado", {
+        "expediente_id": "EXP-SINGLE", "seccion": "JN.1", "user_text": "Mercadillo con 15 puestos",
+    }).json()
+
+    response = client["post"]("/justificacion/generar_jn_lote", {
+        "expediente_id": "EXP-LOTE", "secciones": SECCIONES + ["JN.1"], "user_text": "Mercadillo con 15 puestos",
+        "stream": True,
+    })
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines() if line]
+    # Una línea por sección única, en orden de finalización
+    assert sorted(line["seccion"] for line in lines) == SECCIONES
+    assert all(line["elapsed_ms"] >= 0 for line in lines)
+    by_section = {line["seccion"]: line for line in lines}
+    assert_section_like_single_endpoint(by_section["JN.1"], single)
+    assert set(by_section["JN.9"]) == {"success", "expediente_id", "seccion", "run_id", "error", "elapsed_ms"}
+    print(f"✅ NDJSON: {[line['seccion'] for line in lines]}")
+
+
+def test_batch_endpoint_ndjson_error_line(client):
+    """/generar_jn_lote con stream=True: un fallo del retrieval compartido termina con una línea de error"""
+    async def failing_retrieval(inputs):
+        raise RuntimeError("Atlas caído")
+
+    client["retriever"].ainvoke = failing_retrieval
+    response = client["post"]("/justificacion/generar_jn_lote", {
+        "expediente_id": "EXP-LOTE", "secciones": SECCIONES, "user_text": "Mercadillo con 15 puestos",
+        "stream": True,
+    })
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines() if line]
+    assert len(lines) == 1
+    assert lines[0]["success"] is False and lines[0]["expediente_id"] == "EXP-LOTE"
+    assert "Atlas caído" in lines[0]["error"]
+    print("✅ NDJSON: línea de error final")
+
+
+def parse_sse(text):
+    """Convierte el cuerpo SSE en una lista de (evento, datos)."""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_stream_endpoint_event_order(client):
+    """SSE: un evento por nodo en orden, tokens de GeneratorB antes de su nodo y `result` al final"""
+    response = client["post"]("/justificacion/generar_jn_orquestado/stream", {
+        "expediente_id": "EXP-SSE", "seccion": "JN.1", "user_text": "Mercadillo con 15 puestos",
+    })
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    kinds = [kind for kind, _ in events]
+    nodes = [data["node"] for kind, data in events if kind == "node"]
+    assert nodes == ["retriever", "prompt_refiner", "prompt_manager", "generator_a", "validator_a",
+                     "generator_b", "validator_b"]
+    assert kinds[-1] == "result" and kinds.count("result") == 1
+
+    # Los tokens llegan entre validator_a y el evento del nodo generator_b
+    first_token, last_token = kinds.index("token"), len(kinds) - 1 - kinds[::-1].index("token")
+    node_positions = {data["node"]: i for i, (kind, data) in enumerate(events) if kind == "node"}
+    assert node_positions["validator_a"] < first_token < last_token < node_positions["generator_b"]
+
+    tokens = [data for kind, data in events if kind == "token"]
+    assert all(t["node"] == "generator_b" for t in tokens)
+    narrative = "".join(t["delta"] for t in tokens)
+
+    node_data = {data["node"]: data for kind, data in events if kind == "node"}
+    assert node_data["retriever"]["data"]["context_chars"] > 0
+    assert node_data["validator_a"]["data"] == {"validation_failed": False, "route": "continue"}
+    assert node_data["retriever"]["elapsed_ms"] <= node_data["validator_b"]["elapsed_ms"]
+
+    result = events[-1][1]
+    assert result["success"] and result["run_id"] and result["path_taken"] == "completed"
+    assert result["rag_results_count"] == 1 and result["retrieval"] == RETRIEVAL_DEBUG
+    assert narrative and narrative in json.dumps(result["json_b"], ensure_ascii=False)
+    print(f"✅ SSE: {len(nodes)} nodos, {len(tokens)} tokens, result")
+
+
+def test_stream_endpoint_emits_error_event(client):
+    """SSE: si un nodo falla a mitad, el stream termina con un evento `error` (sin `result`)"""
+    async def failing_generator_b(state, *args, **kwargs):
+        raise RuntimeError("proveedor caído")
+
+    client["agents"].generator_b.ainvoke = failing_generator_b
+    response = client["post"]("/justificacion/generar_jn_orquestado/stream", {
+        "expediente_id": "EXP-SSE", "seccion": "JN.1", "user_text": "Mercadillo con 15 puestos",
+    })
+
+    events = parse_sse(response.text)
+    kinds = [kind for kind, _ in events]
+    assert [data["node"] for kind, data in events if kind == "node"][-1] == "validator_a"
+    assert kinds[-1] == "error" and "result" not in kinds
+    assert "proveedor caído" in events[-1][1]["detail"]
+    print("✅ SSE: evento de error")
@@ -0,0 +1,195 @@
+"""
+Test de la cola de jobs de generación
+-------------------------------------
+Usa InMemoryJobStore y un runner simulado (sin LLMs ni Mongo):
+- Progreso por nodo y resultado final
+- Back-pressure cuando la cola está llena
+- Cancelación de jobs encolados y en ejecución
+- Submits concurrentes no desbordan la cola ni dejan jobs huérfanos
+- Al arrancar, los jobs huérfanos de un proceso anterior pasan a failed
+- El runner de generación respeta las opciones de la petición (hedge, retrieval_mode, rerank)
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+from backend.core.job_queue import JobQueue, JobQueueFullError
+from backend.database.jobs_repository import InMemoryJobStore, new_job_document
+
+NODES = ["retriever", "prompt_refiner", "generator_a", "validator_a", "generator_b", "validator_b"]
+
+
+async def fake_runner(request, on_node):
+    for node in NODES:
+        await asyncio.sleep(request.get("delay", 0.01))
+        await on_node({"node": node, "elapsed_ms": 1.0})
+    return {"success": True, "seccion": request["seccion"]}
+
+
+async def wait_status(queue, job_id, statuses, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        job = await queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} no alcanzó {statuses}")
+
+
+def test_job_progress_and_result():
+    """El job termina con resultado y progreso de todos los nodos"""
+    async def scenario():
+        queue = JobQueue(InMemoryJobStore(), fake_runner, workers=2, max_pending=10)
+        await queue.start()
+        job = await queue.submit({"seccion": "JN.1"})
+        assert job["status"] == "queued"
+
+        done = await wait_status(queue, job["job_id"], ("succeeded",))
+        nodes = [n["node"] for n in done["progress"]["nodes_completed"]]
+        print(f"  Nodos completados: {nodes}")
+        assert nodes == NODES
+        assert done["progress"]["current_node"] == "validator_b"
+        assert done["result"]["seccion"] == "JN.1"
+        await queue.stop()
+
+    asyncio.run(scenario())
+    print("✅ Progreso por nodo y resultado correctos")
+
+
+def test_back_pressure_when_full():
+    """Con la cola llena, submit lanza JobQueueFullError"""
+    async def scenario():
+        queue = JobQueue(InMemoryJobStore(), fake_runner, workers=1, max_pending=2)
+        # Sin arrancar workers: nada se consume
+        await queue.submit({"seccion": "JN.1"})
+        await queue.submit({"seccion": "JN.2"})
+        try:
+            await queue.submit({"seccion": "JN.3"})
+            raise AssertionError("Debía lanzar JobQueueFullError")
+        except JobQueueFullError as e:
+            print(f"  Rechazado: {e}")
+        assert queue.stats()["pending"] == 2
+
+    asyncio.run(scenario())
+    print("✅ Back-pressure funciona")
+
+
+def test_cancel_queued_and_running():
+    """Se pueden cancelar jobs encolados y en ejecución"""
+    async def scenario():
+        queue = JobQueue(InMemoryJobStore(), fake_runner, workers=1, max_pending=10)
+        await queue.start()
+        running = await queue.submit({"seccion": "JN.1", "delay": 0.2})
+        queued = await queue.submit({"seccion": "JN.2"})
+
+        await wait_status(queue, running["job_id"], ("running",))
+        cancelled_queued = await queue.cancel(queued["job_id"])
+        assert cancelled_queued["status"] == "cancelled"
+
+        cancelled_running = await queue.cancel(running["job_id"])
+        assert cancelled_running["status"] == "cancelled"
+
+        # El job cancelado en cola no debe ejecutarse nunca
+        await asyncio.sleep(0.1)
+        job = await queue.get(queued["job_id"])
+        assert job["status"] == "cancelled"
+        assert job["progress"]["nodes_completed"] == []
+        await queue.stop()
+
+    asyncio.run(scenario())
+    print("✅ Cancelación funciona")
+
+
+class SlowCreateStore(InMemoryJobStore):
+    """Store cuya escritura tarda (como un insert en Mongo)."""
+
+    async def create(self, job):
+        await asyncio.sleep(0.01)
+        await super().create(job)
+
+
+def test_concurrent_submits_respect_capacity():
+    """Con submits concurrentes: como mucho max_pending aceptados, el resto 429, ningún job huérfano"""
+    async def scenario():
+        store = SlowCreateStore()
+        queue = JobQueue(store, fake_runner, workers=1, max_pending=3)
+        results = await asyncio.gather(*(queue.submit({"seccion": f"JN.{i}"}) for i in range(8)),
+                                       return_exceptions=True)
+        accepted = [r for r in results if isinstance(r, dict)]
+        rejected = [r for r in results if isinstance(r, JobQueueFullError)]
+        assert len(accepted) == 3 and len(rejected) == 5
+        assert set(store.jobs) == {job["job_id"] for job in accepted}
+        assert queue.stats()["pending"] == 3
+
+    asyncio.run(scenario())
+    print("✅ Submits concurrentes sin desbordar la cola")
+
+
+def test_start_fails_orphaned_jobs():
+    """Los jobs queued/running de un proceso anterior pasan a failed al arrancar"""
+    async def scenario():
+        store = InMemoryJobStore()
+        for job_id, status in [("a", "queued"), ("b", "running"), ("c", "succeeded")]:
+            job = new_job_document(job_id, {"seccion": "JN.1"})
+            job["status"] = status
+            await store.create(job)
+
+        queue = JobQueue(store, fake_runner, workers=1, max_pending=10)
+        await queue.start()
+        statuses = {job_id: (await queue.get(job_id))["status"] for job_id in "abc"}
+        assert statuses == {"a": "failed", "b": "failed", "c": "succeeded"}
+        assert "reinicio" in (await queue.get("a"))["error"]
+        await queue.stop()
+
+    asyncio.run(scenario())
+    print("✅ Jobs huérfanos marcados como failed")
+
+
+def test_generation_runner_keeps_request_options():
+    """Un job encolado llega al orquestador con el mismo estado inicial que /generar_jn_orquestado"""
+    from backend.api import routes_jobs
+    from backend.api.jn_routes import GenerateJNOrchestratedRequest
+
+    captured = {}
+
+    async def fake_stream(initial_state, stream_tokens=True, run_id=None, force_regenerate=False):
+        captured.update(initial_state=initial_state, force_regenerate=force_regenerate)
+        yield {"event": "node", "node": "retriever", "elapsed_ms": 1.0}
+        yield {"event": "result", "run_id": "run-1", "state": {**initial_state, "path_taken": "completed"}}
+
+    request = GenerateJNOrchestratedRequest(
+        expediente_id="EXP-JOB", seccion="JN.1", user_text="Mercadillo", force_regenerate=True,
+        hedge=False, retrieval_mode="hybrid", rerank=True,
+    )
+    nodes = []
+
+    async def on_node(event):
+        nodes.append(event["node"])
+
+    original = routes_jobs.stream_orchestrator
+    routes_jobs.stream_orchestrator = fake_stream
+    try:
+        response = asyncio.run(routes_jobs.run_generation_job(request.model_dump(), on_node))
+    finally:
+        routes_jobs.stream_orchestrator = original
+
+    state = captured["initial_state"]
+    assert state["retrieval_mode"] == "hybrid" and state["rerank"] is True and state["hedge_llm"] is False
+    assert captured["force_regenerate"] and nodes == ["retriever"]
+    assert response["run_id"] == "run-1" and response["seccion"] == "JN.1"
+    print("✅ El job conserva las opciones de la petición")
+
+
+if __name__ == "__main__":
+    test_job_progress_and_result()
+    test_back_pressure_when_full()
+    test_cancel_queued_and_running()
+    test_concurrent_submits_respect_capacity()
+    test_start_fails_orphaned_jobs()
+    test_generation_runner_keeps_request_options()
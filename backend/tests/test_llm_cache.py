@@ -0,0 +1,142 @@
+"""
+Test de la caché de respuestas LLM
+----------------------------------
+Modelo fake + nivel persistente simulado en memoria (sin Mongo):
+- LRU con expulsión por tamaño y caducidad
+- Aciertos en memoria y en el nivel persistente sin llamar al modelo
+- Streaming, bypass (force_regenerate) y activación por task_type
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pytest
+
+from backend.core.fake_llm import FAKE_MODEL_NAME
+from backend.core.llm_cache import LLMResponseCache, MemoryLRUTier, bypass_llm_cache, set_llm_cache
+from backend.core.llm_client import get_llm
+from backend.core.metrics import LLM_REQUESTS
+
+
+class DictStore:
+    """Nivel persistente simulado con la interfaz de MongoLLMCacheStore."""
+
+    def __init__(self):
+        self.entries = {}
+
+    async def get(self, key):
+        return self.entries.get(key)
+
+    async def put(self, key, content, task_type, model):
+        self.entries[key] = content
+
+
+@pytest.fixture(autouse=True)
+def fake_provider(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "0")
+    yield
+    set_llm_cache(None)
+
+
+def calls(task_type):
+    return LLM_REQUESTS.value(task_type=task_type, model=FAKE_MODEL_NAME)
+
+
+def test_memory_tier_lru_and_ttl():
+    tier = MemoryLRUTier(max_entries=2, ttl_seconds=60)
+    tier.put("a", "1")
+    tier.put("b", "2")
+    assert tier.get("a") == "1"  # "a" pasa a ser la más reciente
+    tier.put("c", "3")
+    assert tier.get("b") is None and tier.get("a") == "1" and len(tier) == 2
+
+    expired = MemoryLRUTier(max_entries=2, ttl_seconds=-1)
+    expired.put("a", "1")
+    assert expired.get("a") is None
+
+
+def test_hits_skip_the_model():
+    """Segunda llamada idéntica: acierto en memoria; tras reiniciar memoria, acierto persistente"""
+    store = DictStore()
+    set_llm_cache(LLMResponseCache(store=store))
+    llm = get_llm(task_type="prompt_refiner", temperature=0.3)
+
+    async def scenario():
+        before = calls("prompt_refiner")
+        first = await llm.ainvoke("refina JN.1")
+        second = await llm.ainvoke("refina JN.1")
+        assert second.content == first.content
+        assert second.response_metadata["llm_cache"] == "hit"
+        assert calls("prompt_refiner") == before + 1
+
+        llm.cache.memory = MemoryLRUTier()  # simula otro proceso: solo queda el nivel persistente
+        third = await llm.ainvoke("refina JN.1")
+        assert third.content == first.content and calls("prompt_refiner") == before + 1
+
+        await llm.ainvoke("otro prompt")
+        assert calls("prompt_refiner") == before + 2
+        assert len(store.entries) == 2
+
+    asyncio.run(scenario())
+    print("✅ Aciertos sin llamar al modelo")
+
+
+def test_stream_bypass_and_toggle():
+    set_llm_cache(LLMResponseCache())
+    llm = get_llm(task_type="json_b", temperature=0.3)
+
+    async def scenario():
+        before = calls("json_b")
+        streamed = "".join([c.content async for c in llm.astream("narrativa")])
+        cached = [c.content async for c in llm.astream("narrativa")]
+        assert cached == [streamed] and calls("json_b") == before + 1
+
+        with bypass_llm_cache():
+            await llm.ainvoke("narrativa")
+        assert calls("json_b") == before + 2
+
+        uncached = get_llm(task_type="json_b", temperature=0.3, cache=False)
+        assert uncached.cache is None
+        await uncached.ainvoke("narrativa")
+        assert calls("json_b") == before + 3
+
+        # El streaming síncrono comparte la caché
+        assert [c.content for c in llm.stream("narrativa")] == [streamed] and calls("json_b") == before + 3
+        sync_streamed = "".join(c.content for c in llm.stream("otra narrativa"))
+        assert [c.content for c in llm.stream("otra narrativa")] == [sync_streamed]
+        assert calls("json_b") == before + 4
+
+    asyncio.run(scenario())
+    assert get_llm(task_type="json_repair").cache is None  # no está en LLM_CACHE_TASKS
+    print("✅ Streaming, bypass y activación por tarea")
+
+
+def test_rejected_responses_are_not_cached():
+    """Con `cache_accept` solo se guardan las respuestas válidas (un reintento no recibe la rechazada)"""
+    from backend.agents.generators.generator_a import section_json_complete
+
+    set_llm_cache(LLMResponseCache())
+    llm = get_llm(task_type="json_a", temperature=0.2)
+    accept = lambda content: section_json_complete(content, "JN.1")
+
+    async def scenario():
+        before = calls("json_a")
+        llm.client.responses = {**llm.client.responses, "json_a": '{"secciones_JN": {"objeto": "x"}}'}
+        await llm.ainvoke("genera JN.1", cache_accept=accept)
+        await llm.ainvoke("genera JN.1", cache_accept=accept)
+        assert calls("json_a") == before + 2 and len(llm.cache.memory) == 0
+
+        llm.client.responses = {**llm.client.responses, "json_a": '{"secciones_JN": {"objeto": "x", "alcance": "y", "ambito": "z"}}'}
+        await llm.ainvoke("genera JN.1", cache_accept=accept)
+        hit = await llm.ainvoke("genera JN.1", cache_accept=accept)
+        assert hit.response_metadata["llm_cache"] == "hit" and calls("json_a") == before + 3
+
+    asyncio.run(scenario())
+    assert not section_json_complete("no es json", "JN.1")
+    print("✅ Respuestas rechazadas fuera de la caché")
@@ -0,0 +1,64 @@
+"""
+Test del registro de clientes LLM
+---------------------------------
+- Clientes memoizados por (provider, model, temperature, max_tokens)
+- Pool HTTP compartido por proveedor y cierre en el apagado
+- El handle por tarea funciona en cadenas LCEL y contabiliza métricas
+(no realiza llamadas de red: solo construye clientes)
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from backend.core import llm_client
+from backend.core.llm_client import aclose_llm_clients, get_llm, llm_registry_stats
+from backend.core.fake_llm import FAKE_MODEL_NAME
+from backend.core.metrics import LLM_REQUESTS
+
+
+def test_clients_are_memoized_and_share_pool(monkeypatch):
+    """Misma configuración → mismo cliente; todos los modelos de un proveedor comparten pool"""
+    monkeypatch.setenv("LLM_PROVIDER", "openai")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+
+    a = get_llm(task_type="json_a", temperature=0.2, model_name="gpt-test")
+    repair = get_llm(task_type="json_repair", temperature=0.2, model_name="gpt-test")
+    b = get_llm(task_type="json_b", temperature=0.3, model_name="gpt-test")
+
+    assert a.client is repair.client
+    assert a.task_type != repair.task_type
+    assert b.client is not a.client
+    assert b.client.http_async_client is a.client.http_async_client
+    assert llm_registry_stats()["http_pools"] == ["openai"]
+
+    pool = a.client.http_async_client
+    asyncio.run(aclose_llm_clients())
+    assert pool.is_closed
+    assert llm_registry_stats() == {"clients": [], "http_pools": []}
+    assert get_llm(task_type="json_a", temperature=0.2, model_name="gpt-test").client is not a.client
+    asyncio.run(aclose_llm_clients())
+    print("✅ Registro de clientes y pools compartidos")
+
+
+def test_handle_works_in_lcel_chain(monkeypatch):
+    """El handle es un Runnable: `prompt | llm` funciona y cuenta la llamada"""
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "0")
+
+    llm = get_llm(task_type="legacy_narrative")
+    chain = ChatPromptTemplate.from_messages([("human", "{texto}")]) | llm
+    before = LLM_REQUESTS.value(task_type="legacy_narrative", model=FAKE_MODEL_NAME)
+    response = asyncio.run(chain.ainvoke({"texto": "hola"}))
+
+    assert response.content
+    assert LLM_REQUESTS.value(task_type="legacy_narrative", model=FAKE_MODEL_NAME) == before + 1
+    assert not llm_client._CLIENTS  # el modelo fake no ocupa el registro
+    print("✅ Handle compatible con LCEL")
+
@@ -0,0 +1,197 @@
+"""
+Test del envoltorio de resiliencia LLM
+--------------------------------------
+- Reintentos con backoff respetando Retry-After
+- Circuit breaker por proveedor (closed → open → half_open → closed)
+- En half_open solo un error del cliente cierra el circuito; un error "other" libera la prueba
+- Failover al proveedor alternativo desde LLMHandle (también en `stream` síncrono)
+- Deadline por llamada
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import httpx
+import pytest
+
+from backend.core import llm_resilience
+from backend.core.fake_llm import FakeChatModel
+from backend.core.llm_client import LLMHandle
+from backend.core.llm_resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    call_with_retries,
+    call_with_retries_sync,
+    classify_error,
+    get_breaker,
+    reset_breakers,
+    retry_after_seconds,
+)
+from backend.core.metrics import LLM_FAILOVERS, LLM_RETRIES
+
+
+def _http_error(status: int, headers: dict = None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://api.example.test/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return httpx.HTTPStatusError(f"HTTP {status}", request=request, response=response)
+
+
+class UnavailableChatModel(FakeChatModel):
+    """Proveedor caído: siempre responde 503."""
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise _http_error(503)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        raise _http_error(503)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_resilience, "LLM_RETRY_BASE_DELAY_MS", 1)
+    reset_breakers()
+    yield
+    reset_breakers()
+
+
+def test_classification_and_retry_after():
+    assert classify_error(_http_error(429)) == "rate_limit"
+    assert classify_error(_http_error(503)) == "server_error"
+    assert classify_error(_http_error(400)) == "client_error"
+    assert classify_error(httpx.ConnectError("boom")) == "connection"
+    assert retry_after_seconds(_http_error(429, {"retry-after": "2"})) == 2.0
+    assert retry_after_seconds(_http_error(429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(_http_error(429)) is None
+    print("✅ Clasificación de errores y Retry-After")
+
+
+def test_retries_rate_limit_then_succeeds():
+    calls = {"n": 0}
+
+    async def flaky():
+        calls["n"] += 1
+        if calls["n"] < 3:
+            raise _http_error(429, {"retry-after": "0.01"})
+        return "ok"
+
+    before = LLM_RETRIES.value(provider="test-retry", task_type="generic")
+    result = asyncio.run(call_with_retries(flaky, "test-retry", "generic", time.monotonic() + 5))
+
+    assert result == "ok" and calls["n"] == 3
+    assert LLM_RETRIES.value(provider="test-retry", task_type="generic") == before + 2
+    assert get_breaker("test-retry").state == "closed"
+    print("✅ Reintentos con Retry-After")
+
+
+def test_non_retryable_error_is_not_retried():
+    calls = {"n": 0}
+
+    async def bad_request():
+        calls["n"] += 1
+        raise _http_error(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(call_with_retries(bad_request, "test-400", "generic", time.monotonic() + 5))
+    assert calls["n"] == 1
+    print("✅ Errores del cliente sin reintento")
+
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker("test-breaker", failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert breaker.allow()          # llamada de prueba
+    assert not breaker.allow()      # solo una a la vez
+    breaker.record_success()
+    assert breaker.state == "closed"
+    print("✅ Circuit breaker closed → open → half_open → closed")
+
+
+def test_half_open_probe_closes_only_on_client_error():
+    """Una prueba que falla sin status HTTP no cierra el circuito; un 400 sí (el proveedor respondió)"""
+    breaker = get_breaker("test-probe")
+    breaker.reset_seconds = 0.05
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+
+    async def parse_error():
+        raise ValueError("respuesta ilegible")
+
+    def parse_error_sync():
+        raise ValueError("respuesta ilegible")
+
+    with pytest.raises(ValueError):
+        asyncio.run(call_with_retries(parse_error, "test-probe", "generic", time.monotonic() + 5))
+    assert breaker.state == "half_open"
+    with pytest.raises(ValueError):
+        call_with_retries_sync(parse_error_sync, "test-probe", "generic", time.monotonic() + 5)
+    assert breaker.state == "half_open" and breaker.failures == breaker.failure_threshold
+
+    async def bad_request():
+        raise _http_error(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(call_with_retries(bad_request, "test-probe", "generic", time.monotonic() + 5))
+    assert breaker.state == "closed"
+    print("✅ half_open: solo client_error cierra el circuito")
+
+
+def test_handle_fails_over_when_provider_is_down(monkeypatch):
+    monkeypatch.setattr(llm_resilience, "LLM_RETRY_MAX_ATTEMPTS", 2)
+    primary = LLMHandle(UnavailableChatModel(task_type="generic", latency_ms=0), "openai", "gpt-down", "generic")
+    backup = LLMHandle(FakeChatModel(task_type="generic", latency_ms=0), "groq", "fake-groq", "generic")
+    primary._failover, primary._failover_resolved = backup, True
+
+    before = LLM_FAILOVERS.value(from_provider="openai", to_provider="groq", task_type="generic")
+    response = asyncio.run(primary.ainvoke("hola"))
+
+    assert response.content
+    assert LLM_FAILOVERS.value(from_provider="openai", to_provider="groq", task_type="generic") == before + 1
+
+    # Con el circuito abierto ya no se intenta el proveedor caído
+    monkeypatch.setattr(get_breaker("openai"), "failure_threshold", 1)
+    get_breaker("openai").record_failure()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call_with_retries(lambda: asyncio.sleep(0), "openai", "generic", time.monotonic() + 5))
+    assert asyncio.run(primary.ainvoke("hola")).content
+    print("✅ Failover al proveedor alternativo")
+
+
+def test_sync_stream_retries_and_fails_over(monkeypatch):
+    """`stream` síncrono: reintenta, cuenta en el circuito y hace failover como `invoke`"""
+    monkeypatch.setattr(llm_resilience, "LLM_RETRY_MAX_ATTEMPTS", 2)
+    primary = LLMHandle(UnavailableChatModel(task_type="generic", latency_ms=0), "openai", "gpt-down", "generic")
+    backup = LLMHandle(FakeChatModel(task_type="generic", latency_ms=0), "groq", "fake-groq", "generic")
+    primary._failover, primary._failover_resolved = backup, True
+
+    retries = LLM_RETRIES.value(provider="openai", task_type="generic")
+    failovers = LLM_FAILOVERS.value(from_provider="openai", to_provider="groq", task_type="generic")
+    text = "".join(chunk.content for chunk in primary.stream("hola"))
+
+    assert text == backup.invoke("hola").content
+    assert LLM_RETRIES.value(provider="openai", task_type="generic") == retries + 1
+    assert LLM_FAILOVERS.value(from_provider="openai", to_provider="groq", task_type="generic") == failovers + 1
+    assert not hasattr(primary, "with_structured_output")  # la salida estructurada va por ainvoke_structured
+    print("✅ Streaming síncrono con reintentos y failover")
+
+
+def test_deadline_bounds_the_call():
+    started = time.perf_counter()
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(call_with_retries(lambda: asyncio.sleep(2), "test-deadline", "generic", time.monotonic() + 0.05))
+    assert time.perf_counter() - started < 1
+    print("✅ Deadline por llamada")
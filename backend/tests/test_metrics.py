@@ -0,0 +1,78 @@
+"""
+Test del registro de métricas (formato Prometheus)
+---------------------------------------------------
+Verifica contadores, histogramas y el callback de tokens LLM sin llamadas reales.
+"""
+
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from backend.core.metrics import MetricsRegistry, LLM_PROMPT_TOKENS, LLM_COMPLETION_TOKENS
+from backend.core.llm_client import LLMMetricsCallback
+
+
+def test_counter_and_histogram_render():
+    """Render de contadores e histogramas con etiquetas"""
+    registry = MetricsRegistry()
+    calls = registry.counter("test_calls_total", "Llamadas", ["node"])
+    latency = registry.histogram("test_latency_seconds", "Latencia", ["node"], buckets=(0.1, 1))
+
+    calls.inc(node="retriever")
+    calls.inc(2, node="retriever")
+    latency.observe(0.05, node="retriever")
+    latency.observe(0.5, node="retriever")
+
+    text = registry.render()
+    print(text)
+
+    assert "# TYPE test_calls_total counter" in text
+    assert 'test_calls_total{node="retriever"} 3' in text
+    assert 'test_latency_seconds_bucket{node="retriever",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{node="retriever",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{node="retriever",le="+Inf"} 2' in text
+    assert 'test_latency_seconds_count{node="retriever"} 2' in text
+    print("✅ Render Prometheus correcto")
+
+
+def test_histogram_timer_and_label_validation():
+    """El temporizador registra observaciones y las etiquetas se validan"""
+    registry = MetricsRegistry()
+    latency = registry.histogram("test_timer_seconds", "Latencia", ["node"])
+    with latency.time(node="generator_a"):
+        pass
+    assert latency.count(node="generator_a") == 1
+
+    try:
+        latency.observe(1.0, otro="x")
+        raise AssertionError("Debía rechazar etiquetas desconocidas")
+    except ValueError:
+        pass
+    print("✅ Temporizador y validación de etiquetas correctos")
+
+
+def test_llm_metrics_callback_counts_tokens():
+    """El callback suma tokens de prompt y respuesta por task_type"""
+    labels = {"task_type": "test_json_a", "model": "fake-model"}
+    before_prompt = LLM_PROMPT_TOKENS.value(**labels)
+    before_completion = LLM_COMPLETION_TOKENS.value(**labels)
+
+    message = AIMessage(content="{}", usage_metadata={"input_tokens": 120, "output_tokens": 30, "total_tokens": 150})
+    result = LLMResult(generations=[[ChatGeneration(message=message)]])
+    LLMMetricsCallback("test_json_a", "fake-model").on_llm_end(result)
+
+    assert LLM_PROMPT_TOKENS.value(**labels) - before_prompt == 120
+    assert LLM_COMPLETION_TOKENS.value(**labels) - before_completion == 30
+    print("✅ Tokens contabilizados por task_type")
+
+
+if __name__ == "__main__":
+    test_counter_and_histogram_render()
+    test_histogram_timer_and_label_validation()
+    test_llm_metrics_callback_counts_tokens()
@@ -0,0 +1,147 @@
+"""
+Test de reanudación desde checkpoints (InMemorySaver + LLM fake)
+----------------------------------------------------------------
+Una ejecución se interrumpe tras GeneratorA (ValidatorA falla la primera vez):
+- Reanudar desde validator_a no repite retriever / refiner / GeneratorA
+- Reanudar desde retriever (as_node=START) repite el grafo completo con el estado sustituido
+- El endpoint /reanudar devuelve la sección completada, 404 sin checkpoints y 400 con nodo desconocido
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pytest
+from langgraph.checkpoint.memory import InMemorySaver
+
+from backend.core.llm_cache import LLMResponseCache, set_llm_cache
+
+TRACKED_AGENTS = ["retriever", "prompt_refiner", "generator_a", "validator_a", "generator_b", "validator_b"]
+
+
+class FlakyOnce:
+    """Falla la primera llamada (simula una caída del proceso a mitad del grafo)."""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.failed = False
+
+    async def ainvoke(self, state, *args, **kwargs):
+        if not self.failed:
+            self.failed = True
+            raise RuntimeError("Caída simulada tras GeneratorA")
+        return await self.agent.ainvoke(state, *args, **kwargs)
+
+
+def track_calls(agents, executed):
+    """Registra en `executed` cada agente llamado por el grafo."""
+    for name in TRACKED_AGENTS:
+        agent = getattr(agents, name)
+        original = agent.ainvoke
+
+        async def recorded(state, *args, _name=name, _original=original, **kwargs):
+            executed.append(_name)
+            return await _original(state, *args, **kwargs)
+
+        agent.ainvoke = recorded
+
+
+@pytest.fixture
+def runtime(monkeypatch):
+    """Runtime del orquestador con agentes offline, checkpoints en memoria y un run interrumpido."""
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "0")
+    set_llm_cache(LLMResponseCache())
+
+    from backend.benchmarks.bench_pipeline import BENCH_REQUEST, InMemoryOutputSink, OfflineRetriever
+    from backend.agents.orchestrator import (
+        OrchestratorAgents, init_orchestrator_runtime, new_run_config, shutdown_orchestrator_runtime,
+    )
+
+    agents = OrchestratorAgents(retriever=OfflineRetriever(latency_ms=0), output_sink=InMemoryOutputSink())
+    agents.validator_a = FlakyOnce(agents.validator_a)
+    executed = []
+    track_calls(agents, executed)
+
+    run_id = "run-resume-test"
+    graph = asyncio.run(init_orchestrator_runtime(warmup=False, agents=agents, checkpointer=InMemorySaver()))
+    with pytest.raises(RuntimeError):
+        asyncio.run(graph.ainvoke(dict(BENCH_REQUEST), new_run_config(run_id)))
+    assert executed == ["retriever", "prompt_refiner", "generator_a", "validator_a"]
+    executed.clear()
+
+    yield {"run_id": run_id, "agents": agents, "executed": executed}
+
+    asyncio.run(shutdown_orchestrator_runtime())
+    set_llm_cache(None)
+
+
+def test_resume_from_validator_a_skips_upstream_nodes(runtime):
+    """from_node=validator_a reutiliza el JSON_A guardado: solo se ejecutan validator_a y siguientes"""
+    from backend.agents.orchestrator import resume_orchestrator
+
+    final_state = asyncio.run(resume_orchestrator(runtime["run_id"], "validator_a"))
+
+    assert runtime["executed"] == ["validator_a", "generator_b", "validator_b"]
+    assert final_state["path_taken"] == "completed"
+    assert final_state["generation_a_attempts"] == 1
+    assert [o["nodo"] for o in runtime["agents"].output_sink.saved] == ["A", "B"]
+    print(f"✅ Reanudado desde validator_a: {runtime['executed']}")
+
+
+def test_resume_from_retriever_reruns_whole_graph(runtime):
+    """from_node=retriever con overrides: el primer nodo se reanuda como START y usa el estado sustituido"""
+    from backend.agents.orchestrator import resume_orchestrator
+
+    new_text = "Queremos ampliar el mercadillo a 20 puestos."
+    final_state = asyncio.run(resume_orchestrator(runtime["run_id"], "retriever", {"user_text": new_text}))
+
+    assert runtime["executed"] == TRACKED_AGENTS
+    assert final_state["user_text"] == new_text
+    assert final_state["path_taken"] == "completed"
+    print(f"✅ Reanudado desde retriever: {runtime['executed']}")
+
+
+def test_resume_without_from_node_continues_last_checkpoint(runtime):
+    """Sin from_node se continúa justo en el nodo que falló"""
+    from backend.agents.orchestrator import resume_orchestrator
+
+    final_state = asyncio.run(resume_orchestrator(runtime["run_id"]))
+
+    assert runtime["executed"] == ["validator_a", "generator_b", "validator_b"]
+    assert final_state["path_taken"] == "completed"
+    print("✅ Reanudado desde el último checkpoint")
+
+
+def test_reanudar_endpoint(runtime):
+    """POST /justificacion/reanudar: sección completada, 404 sin checkpoints y 400 con nodo desconocido"""
+    import httpx
+    from fastapi import FastAPI
+    from backend.api.jn_routes import router
+
+    app = FastAPI()
+    app.include_router(router)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            unknown_run = await client.post("/justificacion/reanudar", json={"run_id": "no-existe"})
+            bad_node = await client.post("/justificacion/reanudar",
+                                         json={"run_id": runtime["run_id"], "from_node": "no_existe"})
+            resumed = await client.post("/justificacion/reanudar",
+                                        json={"run_id": runtime["run_id"], "from_node": "validator_a"})
+            return unknown_run, bad_node, resumed
+
+    unknown_run, bad_node, resumed = asyncio.run(scenario())
+    assert unknown_run.status_code == 404
+    assert bad_node.status_code == 400
+    assert resumed.status_code == 200
+    body = resumed.json()
+    assert body["success"] and body["run_id"] == runtime["run_id"]
+    assert runtime["executed"] == ["validator_a", "generator_b", "validator_b"]
+    print("✅ Endpoint /reanudar")
+
@@ -0,0 +1,100 @@
+"""
+Test del limitador RPM/TPM
+--------------------------
+- Espera cuando el bucket TPM se agota y devuelve el saldo estimado de más
+- Orden FIFO entre llamadas concurrentes
+- Límites por proveedor y por modelo desde el entorno
+- Integración con LLMHandle (modelo fake)
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pytest
+
+from backend.core.fake_llm import FakeChatModel
+from backend.core.llm_client import LLMHandle
+from backend.core.metrics import LLM_RATE_LIMIT_WAIT
+from backend.core.rate_limiter import RateLimiter, configured_limit, get_rate_limiter, reset_rate_limiters
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiters():
+    reset_rate_limiters()
+    yield
+    reset_rate_limiters()
+
+
+def test_waits_when_token_budget_is_exhausted():
+    limiter = RateLimiter("test", "m", tpm=600)  # 10 tokens/s
+
+    async def run():
+        assert await limiter.acquire(600) < 0.05
+        return await limiter.acquire(5)
+
+    waited = asyncio.run(run())
+    assert 0.3 < waited < 1.5
+    print(f"✅ Espera de {waited:.2f}s con el bucket TPM agotado")
+
+
+def test_settle_refunds_overestimate():
+    limiter = RateLimiter("test", "m", tpm=600)
+    asyncio.run(limiter.acquire(600))
+    limiter.settle(estimated=600, actual=100)
+    assert limiter.tokens.level >= 499
+    print("✅ Saldo estimado de más devuelto")
+
+
+def test_callers_are_served_in_arrival_order():
+    limiter = RateLimiter("test", "m", tpm=6000)  # 100 tokens/s
+    served = []
+
+    async def caller(i):
+        await limiter.acquire(10)
+        served.append(i)
+
+    async def run():
+        await limiter.acquire(6000)  # agota el bucket
+        tasks = []
+        for i in range(5):
+            tasks.append(asyncio.create_task(caller(i)))
+            await asyncio.sleep(0)  # llegada en orden
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert served == [0, 1, 2, 3, 4]
+    assert limiter.waiting == 0
+    print("✅ Cola FIFO")
+
+
+def test_limits_from_env(monkeypatch):
+    monkeypatch.setenv("LLM_RATE_LIMIT_RPM_GROQ", "100")
+    monkeypatch.setenv("LLM_RATE_LIMIT_RPM_GROQ__OPENAI_GPT_OSS_20B", "7")
+    assert configured_limit("RPM", "groq", "openai/gpt-oss-120b") == 100
+    assert configured_limit("RPM", "groq", "openai/gpt-oss-20b") == 7
+    assert get_rate_limiter("fake", "fake-celia") is None  # sin límites por defecto
+    print("✅ Límites por proveedor y por modelo")
+
+
+def test_handle_calls_go_through_limiter(monkeypatch):
+    monkeypatch.setenv("LLM_RATE_LIMIT_TPM_FAKE", "60000")
+    handle = LLMHandle(FakeChatModel(task_type="generic", latency_ms=0), "fake", "fake-limited", "generic")
+    before = LLM_RATE_LIMIT_WAIT.count(provider="fake", model="fake-limited")
+
+    asyncio.run(handle.ainvoke("hola"))
+
+    limiter = get_rate_limiter("fake", "fake-limited")
+    assert limiter is not None
+    assert LLM_RATE_LIMIT_WAIT.count(provider="fake", model="fake-limited") == before + 1
+    assert limiter.tokens.level > 59000  # consumo real devuelto tras la respuesta
+
+    # El streaming síncrono también espera turno
+    assert "".join(c.content for c in handle.stream("hola"))
+    assert LLM_RATE_LIMIT_WAIT.count(provider="fake", model="fake-limited") == before + 2
+    print("✅ LLMHandle pasa por el limitador")
@@ -0,0 +1,112 @@
+"""
+Test del rerank con cross-encoder
+---------------------------------
+- Una sola llamada por lotes; se conservan los top-k por relevancia
+- Presupuesto de latencia: si se supera (o el modelo está ocupado) se sigue con el orden vectorial
+- Sin modelo disponible el retriever funciona igual
+- Integración con RetrieverAgent (sobre-captura y bloque debug)
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pytest
+
+from backend.core.metrics import RERANK_OUTCOMES
+from backend.core.reranker import CrossEncoderReranker, set_reranker
+from backend.core.retrieval_policy import RetrievalPolicyManager
+
+
+class KeywordCrossEncoder:
+    """Puntúa por apariciones de la palabra clave; registra el tamaño de cada llamada."""
+
+    def __init__(self, keyword="LCSP", delay=0.0):
+        self.keyword = keyword
+        self.delay = delay
+        self.calls = []
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.calls.append(len(pairs))
+        time.sleep(self.delay)
+        return [text.count(self.keyword) for _, text in pairs]
+
+
+class BrokenLoader(CrossEncoderReranker):
+    def load(self):
+        self._load_error = "OSError: modelo no descargado"
+        return None
+
+
+def _candidates(n):
+    return [{"chunk_id": f"c{i}", "text": f"chunk {i} " + "LCSP " * (i % 4) + "x" * 150,
+             "title": f"c{i}", "score": 1 - i / 100} for i in range(n)]
+
+
+def test_rerank_keeps_top_k_in_one_batch():
+    model = KeywordCrossEncoder()
+    reranker = CrossEncoderReranker(model=model, budget_ms=1000)
+    ranked, info = asyncio.run(reranker.rerank("artículo 28 LCSP", _candidates(12), top_k=3))
+    reranker.close()
+    assert model.calls == [12]
+    assert [r["chunk_id"] for r in ranked] == ["c3", "c7", "c11"]
+    assert info["status"] == "ok" and info["kept"] == 3 and info["latency_ms"] >= 0
+    print(f"✅ Rerank por lotes: {info}")
+
+
+def test_budget_exceeded_falls_back_to_vector_order():
+    reranker = CrossEncoderReranker(model=KeywordCrossEncoder(delay=0.3), budget_ms=50)
+    candidates = _candidates(6)
+    timeouts = RERANK_OUTCOMES.value(outcome="timeout")
+
+    async def run():
+        started = time.perf_counter()
+        first = await reranker.rerank("LCSP", candidates, top_k=2)
+        second = await reranker.rerank("LCSP", candidates, top_k=2)  # el modelo sigue ocupado
+        return first, second, time.perf_counter() - started
+
+    (ranked, info), (_, busy), elapsed = asyncio.run(run())
+    reranker.close()
+    assert info["status"] == "timeout" and ranked == candidates
+    assert busy["status"] == "busy"
+    assert elapsed < 0.2
+    assert RERANK_OUTCOMES.value(outcome="timeout") == timeouts + 1
+    print(f"✅ Presupuesto agotado → orden vectorial en {elapsed * 1000:.0f} ms")
+
+
+def test_unavailable_model_is_skipped():
+    reranker = BrokenLoader(budget_ms=500)
+    candidates = _candidates(4)
+    ranked, info = asyncio.run(reranker.rerank("LCSP", candidates, top_k=2))
+    ranked2, info2 = asyncio.run(reranker.rerank("LCSP", candidates, top_k=2))
+    reranker.close()
+    assert ranked == candidates and info["status"] == "unavailable"
+    assert info2["status"] == "unavailable"
+    print("✅ Sin modelo: se usa el orden vectorial")
+
+
+@pytest.fixture
+def reranker():
+    reranker = CrossEncoderReranker(model=KeywordCrossEncoder(), budget_ms=1000)
+    set_reranker(reranker)
+    yield reranker
+    reranker.close()
+    set_reranker(None)
+
+
+def test_retriever_overfetches_and_reranks(reranker, make_retriever, make_atlas_backend):
+    agent = make_retriever(make_atlas_backend(_candidates(30)),
+                           policy_manager=RetrievalPolicyManager(store=None, default_limit=3))
+    result = asyncio.run(agent.ainvoke({"user_text": "LCSP", "rerank": True}))
+
+    assert agent.backend.collection.limits == [20]  # RERANK_CANDIDATES
+    debug = result["debug"]
+    assert debug["rerank"]["status"] == "ok" and debug["rerank"]["candidates"] == 20
+    assert [m["title"] for m in result["matches"]] == ["c3", "c7", "c11"]
+    assert all("rerank_score" in m for m in result["matches"])
+    print(f"✅ RetrieverAgent con rerank: {debug['rerank']}")
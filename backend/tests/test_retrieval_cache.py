@@ -0,0 +1,220 @@
+"""
+Test de la caché de resultados del retriever
+--------------------------------------------
+- Un acierto no vuelve a buscar (ni Atlas ni índice local)
+- Subir la versión del corpus invalida las entradas al momento
+- LRU acotado y caducidad por TTL
+- Clave exacta o cuantizada del embedding
+- Por defecto la versión se lee en cada consulta (invalidación inmediata tras una ingesta)
+- Con RETRIEVAL_CACHE_VERSION_REFRESH_SECONDS > 0 se relee en segundo plano sin bloquear la consulta
+- Resultados degradados (rerank sin terminar, léxica caída) no se cachean
+- La búsqueda léxica se solapa con el embedding de la consulta
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import numpy as np
+import pytest
+
+from backend.core.reranker import CrossEncoderReranker, set_reranker
+from backend.core.retrieval_cache import RetrievalCache, embedding_fingerprint, set_retrieval_cache
+
+
+class CorpusVersions:
+    def __init__(self, version="v1"):
+        self.version = version
+        self.reads = 0
+
+    async def __call__(self, corpus):
+        self.reads += 1
+        return self.version
+
+
+# Chunks de la colección fake (el backend devuelve los `limit` primeros)
+CHUNKS = [{"chunk_id": f"c{i}", "text": f"fragmento {i} " + "x" * 200, "title": f"norma {i}",
+           "score": 0.9 - i / 100} for i in range(50)]
+
+
+@pytest.fixture
+def versions():
+    versions = CorpusVersions()
+    set_retrieval_cache(RetrievalCache(corpus_version_fn=versions, version_refresh_seconds=0))
+    yield versions
+    set_retrieval_cache(None)
+
+
+@pytest.fixture
+def agent(versions, make_retriever, make_atlas_backend):
+    agent = make_retriever(make_atlas_backend(CHUNKS), vector=[0.3, 0.1, 0.5])
+    agent.versions = versions
+    return agent
+
+
+def test_hit_skips_vector_search(agent):
+    first = asyncio.run(agent.ainvoke({"user_text": "fraccionamiento del contrato"}))
+    second = asyncio.run(agent.ainvoke({"user_text": "fraccionamiento  del contrato "}))
+    assert len(agent.backend.collection.pipelines) == 1
+    assert first["debug"]["cache"] == {"hit": False, "stored": True}
+    assert second["debug"]["cache"]["hit"] is True
+    assert second["context"] == first["context"] and second["matches"] == first["matches"]
+    print("✅ Acierto sin búsqueda vectorial")
+
+
+def test_corpus_version_bump_invalidates(agent):
+    asyncio.run(agent.ainvoke({"user_text": "garantía definitiva"}))
+    agent.versions.version = "v2"  # la ingesta ha cambiado `embeddings`
+    result = asyncio.run(agent.ainvoke({"user_text": "garantía definitiva"}))
+    assert len(agent.backend.collection.pipelines) == 2 and result["debug"]["cache"]["hit"] is False
+    print("✅ Nueva versión del corpus → sin aciertos antiguos")
+
+
+def test_per_request_options_are_part_of_the_key(agent):
+    asyncio.run(agent.ainvoke({"user_text": "garantía definitiva"}))
+    asyncio.run(agent.ainvoke({"user_text": "garantía definitiva", "rerank": False}))
+    asyncio.run(agent.ainvoke({"user_text": "garantía definitiva", "retrieval_mode": "hybrid"}))  # sin léxica → vector
+    assert len(agent.backend.collection.pipelines) == 1
+    print("✅ Misma clave para opciones equivalentes")
+
+
+def test_lru_and_ttl_eviction():
+    async def run():
+        cache = RetrievalCache(max_entries=2, ttl_seconds=0.2, corpus_version_fn=CorpusVersions(),
+                               version_refresh_seconds=0)
+        keys = []
+        for i in range(3):
+            key, _ = await cache.lookup([float(i), 1.0], k=5)
+            cache.store(key, {"status": "ok", "context": f"c{i}"})
+            keys.append(key)
+        evicted = await cache.lookup([0.0, 1.0], k=5)
+        kept = await cache.lookup([2.0, 1.0], k=5)
+        await asyncio.sleep(0.25)
+        expired = await cache.lookup([2.0, 1.0], k=5)
+        return len(cache), evicted, kept, expired
+
+    size, evicted, kept, expired = asyncio.run(run())
+    assert evicted[1] is None and kept[1]["context"] == "c2" and expired[1] is None
+    assert size == 1  # la entrada caducada se ha retirado
+    print("✅ LRU acotado y TTL")
+
+
+def test_quantized_key_shares_near_identical_embeddings():
+    v = np.random.default_rng(0).normal(size=384)
+    noisy = v + 1e-6
+    assert embedding_fingerprint(v, "exact") != embedding_fingerprint(noisy, "exact")
+    assert embedding_fingerprint(v, "int8") == embedding_fingerprint(noisy, "int8")
+    print("✅ Clave cuantizada int8")
+
+
+def test_default_cache_sees_ingest_immediately():
+    """Con la configuración por defecto, la consulta siguiente a una ingesta ya no acierta"""
+    async def run():
+        versions = CorpusVersions()
+        cache = RetrievalCache(corpus_version_fn=versions)
+        key, _ = await cache.lookup([1.0, 0.0], k=5)
+        cache.store(key, {"status": "ok", "context": "normativa antigua"})
+        hit = await cache.lookup([1.0, 0.0], k=5)
+        versions.version = "v2"  # ingesta en otro proceso
+        after_ingest = await cache.lookup([1.0, 0.0], k=5)
+        return hit, after_ingest, versions.reads
+
+    hit, after_ingest, reads = asyncio.run(run())
+    assert hit[1]["context"] == "normativa antigua"
+    assert after_ingest[1] is None and reads == 3
+    print("✅ Invalidación inmediata tras la ingesta")
+
+
+def test_version_refresh_does_not_block_lookups():
+    class SlowVersions(CorpusVersions):
+        async def __call__(self, corpus):
+            await asyncio.sleep(0.1)
+            return await super().__call__(corpus)
+
+    async def run():
+        versions = SlowVersions()
+        cache = RetrievalCache(corpus_version_fn=versions, version_refresh_seconds=60)
+        started = time.perf_counter()
+        first = await cache.lookup([1.0, 0.0], k=5)
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(0.15)
+        second = await cache.lookup([1.0, 0.0], k=5)
+        return first, second, elapsed, versions.reads
+
+    first, second, elapsed, reads = asyncio.run(run())
+    assert first == (None, None) and elapsed < 0.05  # versión aún desconocida: no se cachea ni se espera
+    assert second[0] is not None and reads == 1
+    print("✅ Versión del corpus releída en segundo plano")
+
+
+class SlowFirstCrossEncoder:
+    """Cross-encoder lento solo en su primera llamada."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.calls += 1
+        if self.calls == 1:
+            time.sleep(0.2)
+        return [float(len(text)) for _, text in pairs]
+
+
+def test_degraded_rerank_is_not_cached(agent):
+    model = SlowFirstCrossEncoder()
+    reranker = CrossEncoderReranker(model=model, budget_ms=50)
+    set_reranker(reranker)
+    try:
+        first = asyncio.run(agent.ainvoke({"user_text": "garantía definitiva", "rerank": True}))
+        time.sleep(0.25)  # termina la puntuación que agotó el presupuesto
+        second = asyncio.run(agent.ainvoke({"user_text": "garantía definitiva", "rerank": True}))
+        third = asyncio.run(agent.ainvoke({"user_text": "garantía definitiva", "rerank": True}))
+    finally:
+        reranker.close()
+        set_reranker(None)
+
+    assert first["debug"]["rerank"]["status"] == "timeout"
+    assert first["debug"]["cache"] == {"hit": False, "stored": False}
+    assert second["debug"]["cache"]["hit"] is False and second["debug"]["rerank"]["status"] == "ok"
+    assert third["debug"]["cache"]["hit"] is True and model.calls == 2
+    print("✅ Rerank degradado fuera de la caché")
+
+
+class SlowLexical:
+    def __init__(self, delay=0.2, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def search(self, query_text, limit):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("text index required for $text query")
+        return [{"chunk_id": "lex", "text": "fragmento léxico " + "y" * 200, "title": "lex", "score": 9.0}]
+
+
+def test_failed_lexical_leg_is_not_cached(agent):
+    agent.lexical = SlowLexical(delay=0, fail=True)
+    first = asyncio.run(agent.ainvoke({"user_text": "CPV 45233142-6", "retrieval_mode": "hybrid"}))
+    agent.lexical.fail = False
+    second = asyncio.run(agent.ainvoke({"user_text": "CPV 45233142-6", "retrieval_mode": "hybrid"}))
+    assert "error" in first["debug"]["sources"]["lexical"] and first["debug"]["cache"]["stored"] is False
+    assert second["debug"]["cache"]["hit"] is False and "lex" in [m["title"] for m in second["matches"]]
+    print("✅ Léxica caída fuera de la caché")
+
+
+def test_lexical_search_overlaps_query_embedding(versions, make_retriever, make_atlas_backend):
+    agent = make_retriever(make_atlas_backend(CHUNKS), lexical=SlowLexical(delay=0.2), delay=0.2)
+    started = time.perf_counter()
+    result = asyncio.run(agent.ainvoke({"user_text": "artículo 28 LCSP", "retrieval_mode": "hybrid"}))
+    elapsed = time.perf_counter() - started
+    assert result["status"] == "ok" and elapsed < 0.38  # 0.2 s embedding + 0.2 s léxica en paralelo
+    hit = asyncio.run(agent.ainvoke({"user_text": "artículo 28 LCSP", "retrieval_mode": "hybrid"}))
+    assert hit["debug"]["cache"]["hit"] is True  # la léxica lanzada en paralelo se cancela
+    print(f"✅ Léxica en paralelo con el embedding: {elapsed * 1000:.0f} ms")
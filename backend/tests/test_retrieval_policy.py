@@ -0,0 +1,79 @@
+"""
+Test de la búsqueda vectorial en una sola ronda
+-----------------------------------------------
+- Selección en cliente: completa con la sobre-captura si el contexto sale corto
+- La política aprende a ampliar / reducir limit y numCandidates dentro de sus límites
+- RetrieverAgent hace una única agregación y el bloque debug refleja los valores usados
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+from backend.agents.retriever_agent import select_context
+from backend.core.retrieval_policy import RetrievalPolicy, RetrievalPolicyManager
+
+
+class MemoryStore:
+    def __init__(self):
+        self.saved = {}
+
+    async def load(self, corpus):
+        return self.saved.get(corpus)
+
+    async def save(self, policy):
+        self.saved[policy.corpus] = policy.to_dict()
+
+
+def _docs(n, length):
+    return [{"text": f"{i:03d}" + "x" * (length - 3), "title": f"doc {i}", "score": 1 - i / 100} for i in range(n)]
+
+
+def test_select_context_fills_short_context_from_overfetch():
+    selected, context, unused = select_context(_docs(10, 80), limit=3, max_chars=4000, min_chars=500)
+    assert len(selected) == 7  # 3 no bastan para 500 caracteres: se completa con la sobre-captura
+    assert unused == 0
+
+    selected, context, unused = select_context(_docs(10, 1500), limit=5, max_chars=4000, min_chars=500)
+    assert len(context) <= 4000 and context.endswith("…")
+    assert len(selected) == 3 and unused == 2
+    print("✅ Selección en cliente sin segunda agregación")
+
+
+def test_policy_grows_on_short_context_and_shrinks_on_unused_results():
+    policy = RetrievalPolicy("corpus", num_candidates=150, limit=5)
+    adjustments = [policy.observe(context_chars=100, unused=0, mean_score=0.6) for _ in range(10)]
+    assert "grow" in adjustments
+    assert policy.limit > 5 and policy.num_candidates > 150
+
+    grown = (policy.limit, policy.num_candidates)
+    adjustments = [policy.observe(context_chars=4000, unused=policy.limit, mean_score=0.7) for _ in range(10)]
+    assert "shrink" in adjustments
+    assert policy.limit < grown[0]
+    assert policy.num_candidates >= policy.limit * 10
+    print(f"✅ Política aprendida: {policy.to_dict()}")
+
+
+def test_retriever_issues_one_aggregate_and_reports_used_values(make_retriever, make_atlas_backend):
+    store = MemoryStore()
+    agent = make_retriever(
+        make_atlas_backend(_docs(20, 60)),
+        policy_manager=RetrievalPolicyManager(store, default_num_candidates=150, default_limit=5),
+    )
+    collection = agent.backend.collection
+
+    result = asyncio.run(agent.ainvoke({"user_text": "ruido en la vía pública"}))
+
+    assert result["status"] == "ok"
+    assert len(collection.pipelines) == 1
+    search = collection.pipelines[0][0]["$vectorSearch"]
+    debug = result["debug"]
+    assert (debug["num_candidates"], debug["fetch_limit"]) == (search["numCandidates"], search["limit"])
+    assert debug["limit"] == 5 and debug["fetch_limit"] == 10
+    assert debug["selected"] == len(result["matches"]) > 5  # chunks cortos: se usa la sobre-captura
+    assert debug["policy"]["observations"] == 1
+    print(f"✅ Una sola $vectorSearch: {debug}")
@@ -0,0 +1,84 @@
+"""
+Test de la salida estructurada nativa de GeneratorA
+---------------------------------------------------
+- Esquema de la sección preparado para el proveedor
+- GeneratorA usa la salida estructurada cuando el modelo la soporta
+- Respaldo al camino de texto + OutputParser cuando no la soporta
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pytest
+
+from backend.agents.generators.generator_a import GeneratorA
+from backend.agents.schemas.json_schemas import BinderSchemas
+from backend.core.fake_llm import FakeChatModel
+from backend.core.llm_cache import LLMResponseCache, set_llm_cache
+from backend.core.llm_client import LLMHandle
+from backend.core.metrics import GENERATOR_A_OUTPUTS
+
+
+class TextOnlyChatModel(FakeChatModel):
+    """Modelo sin salida estructurada nativa."""
+
+    def with_structured_output(self, schema, **kwargs):
+        raise NotImplementedError("sin response_format")
+
+
+@pytest.fixture(autouse=True)
+def fake_provider(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "0")
+    set_llm_cache(LLMResponseCache())
+    yield
+    set_llm_cache(None)
+
+
+def _state():
+    return {
+        "prompt_a": "Extrae objeto, alcance y ámbito.",
+        "user_text": "Mercadillo municipal con 15 puestos",
+        "seccion": "JN.1",
+        "expediente_id": "EXP-STRUCT",
+    }
+
+
+def test_section_schema_for_provider():
+    schema = BinderSchemas.get_structured_output_schema("JN.1")
+    assert schema["title"] == "JSON_A_JN_1"
+    assert schema["required"] == ["secciones_JN"]
+    assert BinderSchemas.get_structured_output_schema("JN.99") is None
+    assert "title" not in BinderSchemas.SECTION_SCHEMAS["JN.1"]  # no muta el esquema del binder
+    print("✅ Esquema de sección para salida estructurada")
+
+
+def test_generator_a_uses_structured_output():
+    before = GENERATOR_A_OUTPUTS.value(mode="structured")
+    result = asyncio.run(GeneratorA().ainvoke(_state()))
+
+    json_a = result["json_a"]
+    assert json_a["metadata"]["output_mode"] == "structured"
+    assert json_a["parse_error"] is None
+    assert json_a["json"]["secciones_JN"]["objeto"]
+    assert GENERATOR_A_OUTPUTS.value(mode="structured") == before + 1
+    print("✅ JSON_A por salida estructurada nativa")
+
+
+def test_generator_a_falls_back_to_text_path():
+    generator = GeneratorA()
+    generator.llm = LLMHandle(TextOnlyChatModel.from_env(task_type="json_a"), "fake", "fake-text", "json_a")
+    result = asyncio.run(generator.ainvoke(_state()))
+
+    json_a = result["json_a"]
+    assert json_a["metadata"]["output_mode"] == "text_fallback"
+    assert json_a["json"]["secciones_JN"]["objeto"]
+
+    result = asyncio.run(generator.ainvoke({**_state(), "output_mode": "text"}))
+    assert result["json_a"]["metadata"]["output_mode"] == "text"
+    print("✅ Respaldo al camino de texto")
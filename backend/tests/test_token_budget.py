@@ -0,0 +1,141 @@
+"""
+Test del presupuesto de tokens
+------------------------------
+- Conteo y recorte por tokens
+- Recorte de los segmentos de menor prioridad primero (los fijos nunca se recortan)
+- max_tokens acotado por la ventana de contexto; sin límite para modelos de razonamiento
+- Respuesta cortada por max_tokens (finish_reason=length): se repite con más margen
+- Desglose en la metadata de JSON_A con el modelo fake
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import pytest
+
+from backend.core.llm_cache import LLMResponseCache, set_llm_cache
+from backend.core import token_budget
+from backend.core.token_budget import PromptSegment, count_tokens, fit_prompt, render_prompt, truncate_to_tokens
+
+
+@pytest.fixture(autouse=True)
+def fake_provider(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "0")
+    set_llm_cache(LLMResponseCache())
+    yield
+    set_llm_cache(None)
+
+
+def test_truncate_respects_token_limit():
+    text = "normativa municipal de mercadillos " * 200
+    truncated = truncate_to_tokens(text, 50)
+    assert count_tokens(truncated) <= 50
+    assert truncated.endswith(token_budget.TRUNCATION_MARKER)
+    assert truncate_to_tokens("corto", 50) == "corto"
+    print("✅ Recorte por tokens correcto")
+
+
+def test_fit_prompt_trims_lowest_priority_first():
+    long_text = "artículo de la ordenanza " * 400
+    fitted, report = fit_prompt("json_a", [
+        PromptSegment("esquema", "{\"secciones_JN\": {}}", priority=100, trimmable=False),
+        PromptSegment("user_text", "Mercadillo con 15 puestos", priority=90),
+        PromptSegment("contexto", long_text, priority=50),
+        PromptSegment("dependencias", long_text, priority=10),
+    ], budget=600)
+
+    segments = report["segments"]
+    assert report["prompt_tokens"] <= 600
+    assert not report["over_budget"]
+    assert segments["dependencias"]["tokens"] == 0  # se vacía antes de tocar el contexto
+    assert segments["contexto"]["trimmed"]
+    assert not segments["user_text"]["trimmed"]
+    assert fitted["esquema"] == "{\"secciones_JN\": {}}"
+    assert report["original_prompt_tokens"] > report["prompt_tokens"]
+    print("✅ Segmentos recortados por prioridad")
+
+
+def test_completion_budget_bounded_by_context_window(monkeypatch):
+    monkeypatch.setattr(token_budget, "CONTEXT_WINDOW_TOKENS", 1000)
+    assert token_budget.completion_budget("json_b", 900) == 100
+    monkeypatch.setattr(token_budget, "CONTEXT_WINDOW_TOKENS", 128000)
+    assert token_budget.completion_budget("json_a", 10) == token_budget.default_max_tokens("json_a")
+    print("✅ max_tokens acotado por la ventana de contexto")
+
+
+def test_reasoning_models_get_no_completion_cap():
+    """En gpt-5/o-series max_completion_tokens incluye el razonamiento: no se envía el tope por tarea"""
+    from backend.core.llm_client import LLMHandle
+    from backend.core.fake_llm import FakeChatModel
+
+    assert token_budget.default_max_tokens("json_a", "gpt-5") is None
+    assert token_budget.default_max_tokens("json_a", "o3-mini") is None
+    assert token_budget.completion_budget("json_a", 10, "gpt-5") is None
+    assert token_budget.default_max_tokens("json_a", "gpt-4o-mini") == token_budget.COMPLETION_MAX_TOKENS["json_a"]
+
+    handle = LLMHandle(FakeChatModel(), "openai", "gpt-5", "json_a")
+    assert handle.default_max_tokens is None
+    assert "max_tokens" not in handle._call_kwargs({"max_tokens": None})
+    print("✅ Sin tope de respuesta para modelos de razonamiento")
+
+
+def test_generator_a_reports_token_budget():
+    from backend.agents.generators.generator_a import GeneratorA
+
+    state = {
+        "prompt_a": "Extrae objeto, alcance y ámbito.",
+        "user_text": "Mercadillo municipal con 15 puestos",
+        "context": "Ordenanza reguladora de la venta ambulante. " * 50,
+        "seccion": "JN.1",
+        "expediente_id": "EXP-BUDGET",
+    }
+    result = asyncio.run(GeneratorA().ainvoke(state))
+    budget = result["json_a"]["metadata"]["token_budget"]
+
+    assert budget["task_type"] == "json_a"
+    assert set(budget["segments"]) >= {"prompt_a", "user_text", "contexto_normativo", "golden", "dependencias"}
+    assert budget["max_tokens"] == token_budget.default_max_tokens("json_a")
+    assert result["json_a"]["json"]["secciones_JN"]["objeto"]
+    assert render_prompt(["a", "b"]) == "a\n\nb"
+    print("✅ Desglose de tokens en la metadata de JSON_A")
+
+
+def test_length_truncated_response_is_retried_with_larger_cap():
+    """content vacío + finish_reason=length → se repite una vez con el límite ampliado"""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+    from backend.core.llm_client import LLMHandle
+    from backend.core.metrics import LLM_LENGTH_RETRIES
+
+    class ReasoningLikeModel(BaseChatModel):
+        """Gasta 2000 tokens razonando: con menos límite la respuesta visible queda vacía."""
+        calls: list = []
+
+        @property
+        def _llm_type(self):
+            return "reasoning-like"
+
+        def _generate(self, messages, stop=None, run_manager=None, max_tokens=None, **kwargs):
+            self.calls.append(max_tokens)
+            if max_tokens is not None and max_tokens < 2500:
+                message = AIMessage(content="", response_metadata={"finish_reason": "length"})
+            else:
+                message = AIMessage(content='{"ok": true}', response_metadata={"finish_reason": "stop"})
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    model = ReasoningLikeModel()
+    handle = LLMHandle(model, "openai", "gpt-4o-mini", "json_a")
+    before = LLM_LENGTH_RETRIES.value(task_type="json_a", model="gpt-4o-mini")
+    response = asyncio.run(handle.ainvoke("genera JN.1", max_tokens=1500))
+
+    assert model.calls == [1500, 3000]
+    assert response.content == '{"ok": true}'
+    assert LLM_LENGTH_RETRIES.value(task_type="json_a", model="gpt-4o-mini") == before + 1
+    print("✅ Respuesta cortada por longitud repetida con más margen")
@@ -0,0 +1,139 @@
+"""
+Test del índice vectorial local
+-------------------------------
+- Top-k exacto igual que la fuerza bruta y scores en la escala de Atlas
+- int8 conserva el orden de los resultados
+- Refresco incremental desde la colección de embeddings y recarga en otro lector
+- IVF (búsqueda aproximada) con buen recall
+- RetrieverAgent con VECTOR_BACKEND=local
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from backend.agents.retriever_agent import LocalVectorBackend
+from backend.core.vector_index import LocalVectorIndex, build_from_records, normalize_rows, refresh_from_collection
+
+DIM = 32
+
+
+def _records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, DIM)).astype(np.float32)
+    return [
+        {"chunk_id": f"c{i}", "embedding": vectors[i].tolist(), "text": f"fragmento {i} " + "x" * 200,
+         "title": f"norma {i % 7}", "source": "pdfs/norma.pdf", "page": i % 50}
+        for i in range(n)
+    ], vectors
+
+
+class FakeSyncCursor(list):
+    def sort(self, field, direction):
+        return FakeSyncCursor(sorted(self, key=lambda d: d[field]))
+
+
+class FakeSyncCollection:
+    """Colección pymongo mínima: find con filtro {_id: {$gt: ...}} y sort."""
+
+    def __init__(self):
+        self.docs = []
+
+    def find(self, query, projection=None):
+        gt = (query.get("_id") or {}).get("$gt")
+        return FakeSyncCursor(d for d in self.docs if gt is None or d["_id"] > gt)
+
+
+def test_exact_search_matches_brute_force(tmp_path):
+    records, vectors = _records(500)
+    index = build_from_records(records, LocalVectorIndex(str(tmp_path)))
+    query = vectors[42] + 0.05
+
+    results = index.search(query, k=5)
+    expected = np.argsort(-(normalize_rows(vectors) @ (query / np.linalg.norm(query))))[:5]
+    assert [r["chunk_id"] for r in results] == [f"c{i}" for i in expected]
+    assert results[0]["chunk_id"] == "c42" and 0.99 < results[0]["score"] <= 1.0
+    assert results[0]["title"] == "norma 0" and results[0]["page"] == 42
+    print("✅ Top-k exacto = fuerza bruta")
+
+
+def test_int8_keeps_ranking(tmp_path):
+    records, vectors = _records(500)
+    f32 = build_from_records(records, LocalVectorIndex(str(tmp_path / "f32")))
+    i8 = build_from_records(records, LocalVectorIndex(str(tmp_path / "i8")), dtype="int8")
+    assert i8.dtype == "int8" and i8.vectors.dtype == np.int8
+
+    hits = 0
+    for i in range(20):
+        top_f32 = [r["chunk_id"] for r in f32.search(vectors[i], k=5)]
+        top_i8 = [r["chunk_id"] for r in i8.search(vectors[i], k=5)]
+        hits += len(set(top_f32) & set(top_i8))
+    assert hits / 100 >= 0.9
+    print(f"✅ int8: solapamiento top-5 {hits}%")
+
+
+def test_incremental_refresh_from_collection(tmp_path):
+    records, vectors = _records(300)
+    collection = FakeSyncCollection()
+    for r in records[:200]:
+        collection.docs.append({"_id": ObjectId(), "embedding": r["embedding"], "text": r["text"],
+                                "metadata": {"title": r["title"], "source": r["source"], "page": r["page"]}})
+    writer = LocalVectorIndex(str(tmp_path))
+    reader = LocalVectorIndex(str(tmp_path))
+    assert refresh_from_collection(collection, writer, batch_size=64)["added"] == 200
+
+    for r in records[200:]:
+        collection.docs.append({"_id": ObjectId(), "embedding": r["embedding"], "text": r["text"]})
+    report = refresh_from_collection(collection, writer, batch_size=64)
+    assert report["added"] == 100 and report["count"] == 300
+
+    assert reader.reload_if_changed() and reader.count == 300
+    assert reader.search(vectors[250], k=1)[0]["text"] == records[250]["text"]
+    assert reader.search(vectors[10], k=1)[0]["title"] == records[10]["title"]
+    print("✅ Refresco incremental (solo _id nuevos) y recarga en otro lector")
+
+
+def test_ivf_approximate_search_recall(tmp_path):
+    records, vectors = _records(4000, seed=1)
+    index = build_from_records(records, LocalVectorIndex(str(tmp_path), nprobe=8))
+    nlist = index.train_ivf(nlist=32)
+    assert nlist == 32 and index.manifest["ivf"]["nlist"] == 32
+
+    recall = 0
+    for i in range(0, 200, 10):
+        exact = {r["chunk_id"] for r in index.search(vectors[i], k=10, exact=True)}
+        approx = {r["chunk_id"] for r in index.search(vectors[i], k=10)}
+        recall += len(exact & approx) / 10
+    assert recall / 20 >= 0.6
+    # Con numCandidates ≥ filas se exploran todas las listas: mismo resultado que el exacto
+    assert index.search(vectors[3], k=10, num_candidates=4000) == index.search(vectors[3], k=10, exact=True)
+    print(f"✅ IVF: recall@10 = {recall / 20:.2f}")
+
+
+class VectorModel:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def encode(self, texts, **kwargs):
+        return [self.vectors[int(t.split()[-1])] for t in texts]
+
+
+def test_retriever_with_local_backend(tmp_path, make_retriever):
+    records, vectors = _records(200)
+    index = build_from_records(records, LocalVectorIndex(str(tmp_path)))
+    agent = make_retriever(LocalVectorBackend(index), model=VectorModel(vectors))
+
+    result = asyncio.run(agent.ainvoke({"user_text": "consulta 17"}))
+
+    assert result["status"] == "ok"
+    assert result["matches"][0]["title"] == records[17]["title"]
+    assert result["debug"]["backend"] == "local" and result["debug"]["rows"] == 200
+    print("✅ RetrieverAgent con VECTOR_BACKEND=local")
@@ -69,6 +69,69 @@ class ApiService {
       }
     }
   }
+
+  // Variante en streaming (SSE): notifica cada nodo del grafo y los tokens de la narrativa
+  // onEvent(evento, datos) → evento: 'node' | 'token' | 'result' | 'error'
+  async generateJNStream(userInput, onEvent = () => {}) {
+    const body = {
+      expediente_id: userInput.expediente_id,
+      documento: "JN",
+      seccion: userInput.seccion,
+      user_text: userInput.user_text
+    }
+
+    try {
+      console.log('[SEND] Sending to backend (stream):', body)
+      const response = await fetch(`${API_BASE_URL}/justificacion/generar_jn_orquestado/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+        body: JSON.stringify(body),
+      })
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP ${response.status}`)
+      }
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      let jnData = null
+
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        // Los eventos SSE se separan por una línea en blanco
+        let boundary
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const rawEvent = buffer.slice(0, boundary)
+          buffer = buffer.slice(boundary + 2)
+
+          let eventName = 'message'
+          let dataLines = []
+          for (const line of rawEvent.split('\n')) {
+            if (line.startsWith('event:')) eventName = line.slice(6).trim()
+            else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim())
+          }
+          const data = dataLines.length ? JSON.parse(dataLines.join('\n')) : {}
+          if (eventName === 'result') jnData = data
+          if (eventName === 'error') throw new Error(data.detail)
+          onEvent(eventName, data)
+        }
+      }
+
+      if (!jnData) throw new Error('El stream terminó sin resultado')
+      return { success: true, content: this.formatJNResponse(jnData), data: jnData }
+    } catch (error) {
+      console.error('[ERR] Error generating JN (stream):', error)
+      return {
+        success: false,
+        error: error.message,
+        content: this.getMockJN(userInput)
+      }
+    }
+  }
+
   // Formatear respuesta de JN del backend para mostrar en el chat
   formatJNResponse(jnData) {
     // DEBUG TEMPORAL: Ver estructura exacta